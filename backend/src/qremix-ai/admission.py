@@ -0,0 +1,163 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SlotTimer:
+    """Latency of one slot; call ``mark()`` to end the measurement early (e.g. first token).
+
+    A call that only learns how long the answer took to generate once it is
+    complete passes that as ``generating``, which is left out of the latency.
+    """
+
+    __slots__ = ("_clock", "started", "latency")
+
+    def __init__(self, clock):
+        self._clock = clock
+        self.started = clock()
+        self.latency: Optional[float] = None
+
+    def mark(self, generating: float = 0.0) -> None:
+        if self.latency is None:
+            self.latency = max(0.0, self._clock() - self.started - generating)
+
+
+class AdmissionController:
+    """Bounds upstream concurrency with a bounded FIFO wait queue.
+
+    Up to ``limiter.limit`` callers hold a slot at once; up to ``max_queue``
+    more wait at most ``queue_timeout`` seconds for one. Anything beyond that
+    is rejected immediately with :class:`Overloaded` so clients fail fast
+    instead of hanging until the upstream timeout. Each finished slot reports
+    its latency, and whether ``is_drop`` considers its exception an overload
+    signal, to the limiter, which may move the limit.
+    """
+
+    def __init__(
+        self,
+        limiter,
+        max_queue: int,
+        queue_timeout: float,
+        is_drop: Callable[[BaseException], bool] = lambda error: isinstance(error, asyncio.TimeoutError),
+        clock=time.monotonic,
+    ):
+        self.limiter = limiter
+        self.is_drop = is_drop
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        # Exponentially weighted mean time a slot is held, used for Retry-After
+        self.service_time = 1.0
+
+    @property
+    def limit(self) -> int:
+        return self.limiter.limit
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        backlog = self.queue_depth + 1
+        return max(1, math.ceil(self.service_time * backlog / max(self.limit, 1)))
+
+    def check(self) -> None:
+        # Fail fast before committing to work that could only end up rejected
+        if self.in_flight >= self.limit and self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("upstream queue is full", self.retry_after())
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        self.check()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = self._clock()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout if timeout is None else timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(error, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            raise Overloaded("timed out waiting for an upstream slot", self.retry_after()) from None
+        finally:
+            waited = self._clock() - started
+            self.queue_wait_total += waited
+            self.queue_wait_max = max(self.queue_wait_max, waited)
+        self.admitted += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        # Hand free slots to the oldest live waiters first so they can't be overtaken;
+        # when the limit has just shrunk, slots are retired instead
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None, kind: str = "call") -> AsyncIterator[SlotTimer]:
+        await self.acquire(timeout)
+        timer = SlotTimer(self._clock)
+        failed = dropped = False
+        try:
+            yield timer
+        except BaseException as error:
+            failed = True
+            dropped = self.is_drop(error)
+            raise
+        finally:
+            held = self._clock() - timer.started
+            self.service_time = 0.9 * self.service_time + 0.1 * held
+            # Other failures (bad request, client went away) say nothing about upstream
+            # health, unless a latency was already marked before they happened
+            if dropped or not failed or timer.latency is not None:
+                latency = timer.latency if timer.latency is not None else held
+                self.limiter.on_sample(latency, dropped, self.in_flight, kind)
+            self.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.limiter.stats(),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queue_wait_avg_s": round(self.queue_wait_total / self.admitted, 4) if self.admitted else 0.0,
+            "queue_wait_max_s": round(self.queue_wait_max, 4),
+            "service_time_s": round(self.service_time, 4),
+        }
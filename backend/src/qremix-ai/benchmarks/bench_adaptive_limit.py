@@ -0,0 +1,149 @@
+"""Goodput of fixed vs adaptive upstream concurrency limits.
+
+An in-process simulation, no network: a simulated Groq serves ``capacity``
+calls at full speed and slows down proportionally beyond that; past
+``capacity + upstream_queue`` concurrent calls it answers 429. Answers are
+between --min-tokens and --max-tokens long, so a call takes --first-token
+seconds plus --per-token seconds per token, and like Groq's usage the
+simulation reports how much of that was spent generating. Its capacity
+changes between phases (normal, degraded, recovered) while clients keep
+arriving at a constant rate and give up after ``--deadline`` seconds.
+Goodput counts answers delivered within the deadline.
+
+The adaptive limit is run twice: "aimd" leaves generation time out of the
+latency it reports, as the server does; "aimd-whole" reports whole
+completions, where long answers on a healthy upstream look like overload
+and drive the limit down.
+
+    python benchmarks/bench_adaptive_limit.py --rate 100 --phases 40,10,60
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from common import SERVICE_DIR  # noqa: F401  (puts the service on sys.path)
+from admission import AdmissionController, Overloaded
+from concurrency_limit import AIMDLimit, FixedLimit
+
+
+class Throttled(Exception):
+    pass
+
+
+class SimulatedUpstream:
+    def __init__(self, first_token: float, per_token: float, tokens: range, upstream_queue: int, rng):
+        self.first_token = first_token
+        self.per_token = per_token
+        self.tokens = tokens
+        self.upstream_queue = upstream_queue
+        self.rng = rng
+        self.capacity = 1
+        self.active = 0
+        self.throttled = 0
+
+    async def call(self) -> float:
+        # Returns the time spent generating the answer, as Groq's usage.completion_time does
+        if self.active >= self.capacity + self.upstream_queue:
+            self.throttled += 1
+            await asyncio.sleep(0.002)
+            raise Throttled()
+        self.active += 1
+        try:
+            slowdown = max(1.0, self.active / self.capacity)
+            generating = self.rng.choice(self.tokens) * self.per_token * slowdown
+            await asyncio.sleep(self.first_token * slowdown + generating)
+            return generating
+        finally:
+            self.active -= 1
+
+
+async def run(name: str, limiter, args, whole_latency: bool = False) -> dict:
+    upstream = SimulatedUpstream(
+        args.first_token, args.per_token, range(args.min_tokens, args.max_tokens + 1), args.upstream_queue,
+        random.Random(2),
+    )
+    admission = AdmissionController(
+        limiter=limiter,
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        is_drop=lambda error: isinstance(error, (Throttled, asyncio.TimeoutError)),
+    )
+    phases = [int(capacity) for capacity in args.phases.split(",")]
+    per_phase = []
+    rng = random.Random(1)
+
+    async def request(outcome: dict) -> None:
+        started = time.perf_counter()
+        try:
+            async with admission.slot() as timer:
+                generating = await asyncio.wait_for(upstream.call(), args.deadline * 4)
+                if not whole_latency:
+                    timer.mark(generating=generating)
+        except Overloaded:
+            outcome["shed"] += 1
+            return
+        except (Throttled, asyncio.TimeoutError):
+            outcome["errors"] += 1
+            return
+        if time.perf_counter() - started <= args.deadline:
+            outcome["good"] += 1
+        else:
+            outcome["late"] += 1
+
+    tasks = []
+    for capacity in phases:
+        upstream.capacity = capacity
+        outcome = {"capacity": capacity, "good": 0, "late": 0, "errors": 0, "shed": 0, "limits": []}
+        end = time.perf_counter() + args.phase_seconds
+        next_sample = 0.0
+        while time.perf_counter() < end:
+            tasks.append(asyncio.create_task(request(outcome)))
+            if time.perf_counter() >= next_sample:
+                outcome["limits"].append(admission.limit)
+                next_sample = time.perf_counter() + args.phase_seconds / 5
+            await asyncio.sleep(rng.expovariate(args.rate))
+        per_phase.append(outcome)
+    await asyncio.gather(*tasks)
+    for outcome in per_phase:
+        outcome["goodput_per_s"] = round(outcome["good"] / args.phase_seconds, 1)
+    return {
+        "limiter": name,
+        "goodput_per_s": round(sum(o["good"] for o in per_phase) / (args.phase_seconds * len(phases)), 1),
+        "throttled_429": upstream.throttled,
+        "phases": per_phase,
+    }
+
+
+async def main(args):
+    for name, limiter in (
+        (f"fixed-{args.max_limit}", FixedLimit(args.max_limit)),
+        (f"fixed-{args.min_limit * 2}", FixedLimit(args.min_limit * 2)),
+        ("aimd", AIMDLimit(initial=16, min_limit=args.min_limit, max_limit=args.max_limit)),
+        ("aimd-whole", AIMDLimit(initial=16, min_limit=args.min_limit, max_limit=args.max_limit)),
+    ):
+        result = await run(name, limiter, args, whole_latency=name == "aimd-whole")
+        print(
+            f"{result['limiter']:>10}  goodput {result['goodput_per_s']}/s  429s {result['throttled_429']}"
+            f"  limit increases/decreases {limiter.stats().get('increases', '-')}/{limiter.stats().get('decreases', '-')}"
+        )
+        for phase in result["phases"]:
+            print(f"{'':>12}{phase}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=100, help="arrivals per second")
+    parser.add_argument("--phases", default="40,10,60", help="upstream capacity in each phase")
+    parser.add_argument("--phase-seconds", type=float, default=5.0)
+    parser.add_argument("--first-token", type=float, default=0.03, help="no-load time to the first token")
+    parser.add_argument("--per-token", type=float, default=0.0005, help="no-load seconds per answer token")
+    parser.add_argument("--min-tokens", type=int, default=20)
+    parser.add_argument("--max-tokens", type=int, default=800)
+    parser.add_argument("--upstream-queue", type=int, default=20)
+    parser.add_argument("--deadline", type=float, default=1.0, help="client gives up after this long")
+    parser.add_argument("--queue-timeout", type=float, default=0.1, help="longest wait for an upstream slot")
+    parser.add_argument("--min-limit", type=int, default=4)
+    parser.add_argument("--max-limit", type=int, default=64)
+    parser.add_argument("--max-queue", type=int, default=256)
+    asyncio.run(main(parser.parse_args()))
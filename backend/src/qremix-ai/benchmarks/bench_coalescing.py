@@ -0,0 +1,67 @@
+"""Upstream calls made for a burst of identical prompts.
+
+A classroom clicking the same example prompt at once: N fresh sessions send
+the same first message concurrently. With coalescing they should share one
+Groq call; with X-Cache-Bypass (no cache, no coalescing) every request goes
+upstream. A few clients disconnect mid-burst to show the shared call
+survives their cancellation.
+
+    python benchmarks/bench_coalescing.py --burst 100
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common import mock_groq
+
+
+async def upstream_calls(base_url: str) -> int:
+    async with httpx.AsyncClient() as http:
+        return (await http.get(f"{base_url}/calls")).json()["calls"]
+
+
+async def burst(app, base_url: str, size: int, prompt: str, bypass: bool, cancel: int) -> dict:
+    headers = {"X-Cache-Bypass": "1"} if bypass else {}
+    transport = httpx.ASGITransport(app=app)
+    before = await upstream_calls(base_url)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+        requests = [
+            asyncio.create_task(
+                http.post("/chat", json={"message": prompt}, headers={**headers, "X-Session-Id": f"burst{i:08d}"})
+            )
+            for i in range(size)
+        ]
+        start = time.perf_counter()
+        await asyncio.sleep(0.05)
+        for task in requests[:cancel]:
+            task.cancel()
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+    responses = [r for r in results if isinstance(r, httpx.Response)]
+    return {
+        "mode": "bypass" if bypass else "coalesced",
+        "requests": size,
+        "cancelled": cancel,
+        "ok": sum(1 for r in responses if r.status_code == 200 and not r.json()["response"].startswith("Error")),
+        "x_cache": sorted({r.headers.get("X-Cache") for r in responses}),
+        "upstream_calls": await upstream_calls(base_url) - before,
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+async def main(args):
+    with mock_groq("--latency", str(args.latency)) as base_url:
+        import server
+
+        print(await burst(server.app, base_url, args.burst, "Explain what is a Solidity contract!", True, 0))
+        print(await burst(server.app, base_url, args.burst, "Show me a basic ERC20 token contract", False, args.cancel))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--burst", type=int, default=100)
+    parser.add_argument("--cancel", type=int, default=5, help="clients that disconnect mid-burst")
+    parser.add_argument("--latency", type=float, default=1.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+"""Throughput of /chat as the number of concurrent users grows.
+
+Every upstream call against the mock takes a fixed latency, so a handler that
+blocks the event loop completes ~1/latency requests per second no matter how
+many users are waiting, while the async path should scale with concurrency.
+
+    python benchmarks/bench_concurrency.py --latency 0.5 --levels 1 10 50 200
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common import mock_groq
+
+
+async def run_level(app, users: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        health_latencies = []
+
+        async def probe_health(stop: asyncio.Event):
+            while not stop.is_set():
+                start = time.perf_counter()
+                await http.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(stop))
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(http.post("/chat", json={"message": f"question {i}"}) for i in range(users))
+        )
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    ok = sum(1 for r in responses if r.status_code == 200)
+    return {
+        "users": users,
+        "ok": ok,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 1),
+        "health_max_ms": round(max(health_latencies, default=0) * 1000, 1),
+    }
+
+
+async def main(args):
+    with mock_groq("--latency", str(args.latency)):
+        import server
+
+        for users in args.levels:
+            print(await run_level(server.app, users))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 50, 200])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,72 @@
+"""Cost of the local small-talk check that runs before every chat request.
+
+Times IntentClassifier.classify() for each path a prompt can take: a regex
+match, a variant only the fallback model recognises, a short prompt the
+model passes on to the LLM, and a long or code-bearing prompt rejected
+before either runs. Also reports how long open() takes to fit the model,
+and how a labelled set of held-out prompts is classified, so that tuning
+the threshold or the patterns can be checked for prompts wrongly answered
+locally (the costly mistake).
+
+    python benchmarks/bench_fast_path.py --iterations 20000 --threshold 0.9
+"""
+import argparse
+import time
+
+from common import SERVICE_DIR  # noqa: F401  (puts the service on sys.path)
+from fast_path import IntentClassifier
+
+PATHS = {
+    "regex": ["hi", "Thanks!!", "ok", "what can you do?", "hey qremix, how are you?"],
+    "model": ["thank youu", "hi again!", "great job!", "who r u", "thnks"],
+    "llm": ["what is a mapping?", "ok now make it pausable", "hi, write me an ERC20 token", "deploy it"],
+    "rejected": [
+        "contract Token { mapping(address => uint) balances; }",
+        "Write an ERC721 contract with a public mint, a max supply and royalties for the creator",
+    ],
+}
+# Held-out prompts (none of them in the training examples) and the intent they should get
+LABELLED = {
+    "hello!": "greeting", "hey there qremix": "greeting", "heyyy": "greeting", "good evening": "greeting",
+    "thanks a lot!": "thanks", "thank you that worked": "thanks", "thx!": "thanks", "thanks again": "thanks",
+    "okay": "pleasantry", "bye!": "pleasantry", "got it, thanks bye": "pleasantry", "sounds good": "pleasantry",
+    "help": "help", "who are you?": "help", "how do I use this?": "help",
+    "hi i have a bug": None, "thanks, now add a burn function": None, "help me with reentrancy": None,
+    "ok and the gas cost?": None, "what about events": None, "hello world in python": None,
+    "is this safe?": None, "can you explain": None, "please continue": None, "same error": None,
+    "great, now write the tests": None, "hey, quick question": None, "no": None, "yes": None,
+    "ok go on": None, "k do it": None, "yeah go for it": None, "please do": None, "sure thing": None,
+    "yes sure": None, "okay then": None,
+}
+
+
+def per_call_us(classifier: IntentClassifier, prompts, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        classifier.classify(prompts[i % len(prompts)])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(args):
+    classifier = IntentClassifier(threshold=args.threshold)
+    start = time.perf_counter()
+    classifier.open()
+    open_ms = (time.perf_counter() - start) * 1000
+
+    timings = {path: round(per_call_us(classifier, prompts, args.iterations), 2) for path, prompts in PATHS.items()}
+    wrongly_local, missed = [], []
+    for prompt, expected in LABELLED.items():
+        intent, _ = classifier.classify(prompt)
+        if intent is not None and intent != expected:
+            wrongly_local.append(prompt)
+        elif intent is None and expected is not None:
+            missed.append(prompt)
+    print({"open_ms": round(open_ms, 1), "threshold": args.threshold, "classify_us": timings})
+    print({"labelled": len(LABELLED), "wrongly_answered_locally": wrongly_local, "sent_to_llm_needlessly": missed})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    main(parser.parse_args())
@@ -0,0 +1,95 @@
+"""Tail latency and upstream load of /chat with and without hedging.
+
+Runs the service twice against the mock Groq server, once with HEDGE=0 and
+once with hedging on, and sends the same closed-loop load of unique prompts
+to each (with X-Cache-Bypass, so every request goes upstream). Most mock
+calls take about --latency seconds but --spike-rate of them take
+--spike-factor times longer, like Groq's occasional stalls. Reports
+latency percentiles per run, the requests slower than half a spiked call
+(spikes that hedging did not cover) and how many upstream calls each
+request cost. Hedging should cut the slow requests while adding
+no more than HEDGE_BUDGET extra calls.
+
+    python benchmarks/bench_hedging.py --users 2 --requests 1500 --spike-rate 0.01
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common import mock_groq, service
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+async def load(base_url: str, mock_url: str, users: int, requests: int, slow: float) -> dict:
+    latencies = []
+    failures = 0
+    counter = iter(range(requests))
+
+    async def user(http: httpx.AsyncClient, index: int):
+        nonlocal failures
+        for i in counter:
+            start = time.perf_counter()
+            response = await http.post(
+                "/chat",
+                json={"message": f"Request {i}: explain the storage layout of a mapping"},
+                headers={"X-Session-Id": f"hedge{index:06d}", "X-Cache-Bypass": "1"},
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures += 1
+
+    async with httpx.AsyncClient(timeout=120) as http:
+        before = (await http.get(f"{mock_url}/calls")).json()["calls"]
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(http, index) for index in range(users)))
+        elapsed = time.perf_counter() - start
+        hedging = (await http.get("/admission/stats")).json()["hedging"]
+    async with httpx.AsyncClient(timeout=120) as http:
+        calls = (await http.get(f"{mock_url}/calls")).json()["calls"] - before
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "slow_requests": sum(latency > slow for latency in latencies),
+        "upstream_calls_per_request": round(calls / len(latencies), 4),
+        "hedged": hedging["hedged"],
+        "hedge_wins": hedging["hedge_wins"],
+        "over_budget": hedging["over_budget"],
+        "hedge_delay_s": hedging["delay_s"],
+    }
+
+
+def main(args):
+    mock_args = [
+        "--latency", str(args.latency), "--latency-dist", "lognormal", "--latency-spread", str(args.spread),
+        "--spike-rate", str(args.spike_rate), "--spike-factor", str(args.spike_factor), "--seed", "7",
+    ]
+    with mock_groq(*mock_args) as mock_url:
+        for hedge in ("0", "1"):
+            # No history log, so that fsyncs do not swamp the latency being measured
+            with service(HEDGE=hedge, HEDGE_BUDGET=str(args.budget), HISTORY_LOG_DIR="") as base_url:
+                result = asyncio.run(load(base_url, mock_url, args.users, args.requests, args.spike_factor * args.latency / 2))
+            print({"hedging": hedge == "1", **result})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=800)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean seconds per mock completion")
+    parser.add_argument("--spread", type=float, default=0.3, help="lognormal sigma of the mock latency")
+    parser.add_argument("--spike-rate", type=float, default=0.01)
+    parser.add_argument("--spike-factor", type=float, default=10.0)
+    parser.add_argument("--budget", type=float, default=0.05, help="HEDGE_BUDGET for the hedged run")
+    main(parser.parse_args())
@@ -0,0 +1,116 @@
+"""Append throughput and restart time of the durable history log.
+
+Appends turns from many concurrent sessions through the memory backend with
+the log enabled, with and without fsync, and reports how many log records
+(fsyncs) the group commit needed. Then restarts from the resulting
+directory twice: once replaying the raw log, once from a snapshot. Last,
+writes the same turns with the default snapshot thresholds, as the server
+does, and restarts from the latest snapshot plus the log written since.
+
+    python benchmarks/bench_history_log.py --messages 100000 --writers 256
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from common import SERVICE_DIR  # noqa: F401  (puts the service on sys.path)
+from history_backends import MemoryHistory
+from history_log import HistoryLog, ReplayClock
+from history_store import SessionHistoryStore
+
+MAX_MESSAGES = 100
+
+
+def open_backend(directory: str, fsync: bool, **snapshot_thresholds) -> MemoryHistory:
+    clock = ReplayClock()
+    store = SessionHistoryStore(max_bytes=4 << 30, idle_ttl=3600, max_messages=MAX_MESSAGES, clock=clock)
+    log = HistoryLog(directory, store, clock, fsync=fsync, **snapshot_thresholds)
+    log.recover()
+    return MemoryHistory(store, log)
+
+
+async def append_turns(backend: MemoryHistory, messages: int, writers: int, sessions: int, size: int) -> dict:
+    rng = random.Random(7)
+    body = "".join(rng.choice("abcdefghij klmnop\n") for _ in range(size))
+    latencies = []
+    turns = messages // 2
+
+    async def writer(index: int):
+        for turn in range(index, turns, writers):
+            start = time.perf_counter()
+            await backend.append(
+                f"session{turn % sessions:06d}",
+                [
+                    {"role": "user", "content": f"question {turn} {body[:size // 4]}", "tokens": size // 16},
+                    {"role": "assistant", "content": f"answer {turn} {body}", "tokens": size // 4},
+                ],
+            )
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(i) for i in range(writers)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "turns_per_s": round(turns / elapsed),
+        "append_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "append_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "records": backend.log.records,
+        "turns_per_record": round(turns / max(backend.log.records, 1), 1),
+    }
+
+
+async def run(args, fsync: bool) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        # No snapshot while writing, so the first restart replays the whole log
+        backend = open_backend(directory, fsync, snapshot_bytes=1 << 40, snapshot_operations=1 << 40)
+        result = await append_turns(backend, args.messages, args.writers, args.sessions, args.size)
+        await backend.close()
+        log_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print({"fsync": fsync, "messages": args.messages, "log_mb": round(log_bytes / 2**20, 1), **result})
+
+        replayed = open_backend(directory, fsync, snapshot_bytes=0)
+        stored = sum(len(messages) for _, messages, _, _ in replayed.store.sessions())
+        print({"restart": "log replay", "recovery_s": round(replayed.log.recovery_seconds, 3), "messages": stored})
+        # Any write now snapshots (snapshot_bytes=0) and retires the replayed segments
+        await replayed.append("session000000", [{"role": "user", "content": "x", "tokens": 1}])
+        await replayed.close()
+
+        restored = open_backend(directory, fsync)
+        stored = sum(len(messages) for _, messages, _, _ in restored.store.sessions())
+        print({"restart": "snapshot", "recovery_s": round(restored.log.recovery_seconds, 3), "messages": stored})
+        await restored.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = open_backend(directory, fsync)
+        result = await append_turns(backend, args.messages, args.writers, args.sessions, args.size)
+        await backend.close()
+        restored = open_backend(directory, fsync)
+        stored = sum(len(messages) for _, messages, _, _ in restored.store.sessions())
+        print({
+            "restart": "default snapshots",
+            "snapshots_written": backend.log.snapshots,
+            "recovery_s": round(restored.log.recovery_seconds, 3),
+            "replayed_operations": restored.log.recovered_operations,
+            "messages": stored,
+            "turns_per_s": result["turns_per_s"],
+        })
+        await restored.close()
+
+
+async def main(args):
+    for fsync in (True, False):
+        await run(args, fsync)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--writers", type=int, default=256, help="concurrent sessions appending")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=400, help="characters per assistant message")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""Bursts against a rate-limited upstream, with and without quota pacing.
+
+The mock Groq enforces a requests-per-minute quota and reports it in
+``x-ratelimit-*`` headers like Groq does. After one warm-up call (so the
+quota is known), a burst larger than the remaining quota is sent. With
+pacing the excess waits for the quota to refill; with RATE_LIMIT_MAX_WAIT=0
+it is refused locally with 503 + Retry-After instead of reaching Groq; with
+the headers ignored (the old behaviour) the excess is sent and gets 429s.
+
+    python benchmarks/bench_rate_limits.py --rpm 60 --burst 70
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from common import mock_groq
+from rate_limits import RateLimitPacer
+
+
+async def upstream_stats(base_url: str) -> dict:
+    async with httpx.AsyncClient() as http:
+        return (await http.get(f"{base_url}/calls")).json()
+
+
+async def burst(server, base_url: str, size: int, mode: str) -> dict:
+    transport = httpx.ASGITransport(app=server.app)
+    before = await upstream_stats(base_url)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+
+        async def one(i: int):
+            start = time.perf_counter()
+            response = await http.post(
+                "/chat",
+                json={"message": f"Explain storage slot {i} ({mode})"},
+                headers={"X-Session-Id": f"ratelimit{i:08d}"},
+            )
+            return response.status_code, time.perf_counter() - start
+
+        results = await asyncio.gather(*(one(i) for i in range(size)))
+    after = await upstream_stats(base_url)
+    ok = sorted(latency for status, latency in results if status == 200)
+    return {
+        "mode": mode,
+        "requests": size,
+        "ok": len(ok),
+        "rejected_503": sum(1 for status, _ in results if status == 503),
+        "upstream_429": after["throttled"] - before["throttled"],
+        "p50_s": round(statistics.median(ok), 3) if ok else None,
+        "max_s": round(ok[-1], 3) if ok else None,
+    }
+
+
+async def main(args):
+    with mock_groq("--latency", str(args.latency), "--rpm", str(args.rpm)) as base_url:
+        import server
+
+        for index, (mode, max_wait) in enumerate((("paced", args.max_wait), ("fail-fast", 0), ("unpaced", 0))):
+            if index:
+                # Let the quota refill before the next run
+                await asyncio.sleep(60 * args.burst / args.rpm)
+            server.pacer = RateLimitPacer(max_wait=max_wait)
+            if mode == "unpaced":
+                server.pacer.report = lambda headers, throttled=False: None
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://b") as http:
+                await http.post("/chat", json={"message": f"warm up {mode}"}, headers={"X-Session-Id": "ratelimitwarmup"})
+            print(await burst(server, base_url, args.burst, mode), server.pacer.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rpm", type=float, default=60)
+    parser.add_argument("--burst", type=int, default=70)
+    parser.add_argument("--max-wait", type=float, default=15.0)
+    parser.add_argument("--latency", type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
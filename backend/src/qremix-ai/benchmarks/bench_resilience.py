@@ -0,0 +1,100 @@
+"""/chat against a flaky and a failing Groq, with and without retries and the circuit breaker.
+
+Two scenarios, each run on a fresh service against the mock Groq server,
+with unique prompts and X-Cache-Bypass so every request goes upstream:
+
+* flaky: --error-rate of the mock calls fail with a 500. Compares
+  UPSTREAM_MAX_ATTEMPTS=1 (no retries) with the default; retries should
+  turn most failures into answers for a few extra upstream calls.
+* outage: every mock call fails after --error-latency seconds, as when
+  Groq is down behind a load balancer. Compares a breaker that never trips
+  with the default; once it trips, requests should fail in about a
+  millisecond with a 503 and stop adding load to the failing upstream.
+
+Reports answered and failed requests by status, latency percentiles, upstream
+calls per request, and how many failures were stored in the chat history
+(should be none).
+
+    python benchmarks/bench_resilience.py --requests 200 --error-rate 0.2
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from common import mock_groq, service
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 2)
+
+
+async def load(base_url: str, mock_url: str, users: int, requests: int) -> dict:
+    latencies = []
+    statuses = Counter()
+    failed = []
+    counter = iter(range(requests))
+
+    async def user(http: httpx.AsyncClient, index: int):
+        for i in counter:
+            start = time.perf_counter()
+            response = await http.post(
+                "/chat",
+                json={"message": f"Request {i}: explain the storage layout of a mapping"},
+                headers={"X-Session-Id": f"resilience{i:06d}", "X-Cache-Bypass": "1"},
+            )
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code != 200:
+                failed.append(i)
+
+    async with httpx.AsyncClient(timeout=120) as http:
+        before = (await http.get(f"{mock_url}/calls")).json()["calls"]
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as http:
+        await asyncio.gather(*(user(http, index) for index in range(users)))
+        # One session per request, so a failed request's session should have no messages
+        stored = 0
+        for i in failed:
+            page = await http.get("/history", headers={"X-Session-Id": f"resilience{i:06d}"})
+            stored += len(page.json()["messages"])
+        stats = (await http.get("/admission/stats")).json()
+    async with httpx.AsyncClient(timeout=120) as http:
+        calls = (await http.get(f"{mock_url}/calls")).json()["calls"] - before
+    return {
+        "statuses": dict(sorted(statuses.items())),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+        "upstream_calls_per_request": round(calls / len(latencies), 3),
+        "failures_stored": stored,
+        "retries": stats["retries"]["retries"],
+        "circuit_trips": stats["circuit"]["trips"],
+    }
+
+
+def main(args):
+    scenarios = [
+        ("flaky", ["--error-rate", str(args.error_rate)],
+         [("no retries", {"UPSTREAM_MAX_ATTEMPTS": "1"}), ("retries", {})]),
+        ("outage", ["--error-rate", "1", "--error-latency", str(args.error_latency)],
+         [("no breaker", {"CIRCUIT_FAILURE_THRESHOLD": "1000000000"}), ("breaker", {})]),
+    ]
+    for scenario, mock_args, runs in scenarios:
+        with mock_groq("--latency", str(args.latency), "--seed", "7", *mock_args) as mock_url:
+            for name, env in runs:
+                # No history log, so that fsyncs do not swamp the latency being measured
+                with service(HISTORY_LOG_DIR="", **env) as base_url:
+                    result = asyncio.run(load(base_url, mock_url, args.users, args.requests))
+                print({"scenario": scenario, "run": name, **result})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean seconds per mock completion")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="fraction of failed calls when flaky")
+    parser.add_argument("--error-latency", type=float, default=0.2, help="seconds before each failure in the outage")
+    main(parser.parse_args())
@@ -0,0 +1,125 @@
+"""Query latency and incremental update cost of the BM25 code index.
+
+Builds a project of --files Solidity files from the repo's sample contracts
+(ERC20.sol, MyContract1.sol and Lock.sol concatenated, with contract and
+function names varied per file so the names are not all identical) and
+indexes it. Reports:
+
+* the build time and number of chunks,
+* the time to re-index a file after editing one function, which should
+  re-tokenize just that chunk,
+* query latency percentiles over a set of questions, including a long
+  one that has to be cut to its rarest terms, next to the same BM25
+  scoring done the plain way (every posting of every term).
+
+The corpus is built from a few contracts copied many times, so common terms
+such as owner or transfer appear in thousands of chunks. That makes the
+posting lists longer than a real project's, and the latencies pessimistic.
+
+    python benchmarks/bench_retrieval.py --files 300 --iterations 200
+"""
+import argparse
+import heapq
+import math
+import os
+import random
+import re
+import time
+
+from common import SERVICE_DIR
+from retrieval import B, K1, MAX_QUERY_TERMS, CodeIndex, search, tokenize
+
+PROJECT = os.path.join(SERVICE_DIR, "..", "..", "..")
+SOURCES = ["backend/contracts/ERC20.sol", "backend/contracts/MyContract1.sol", "frontend/contracts/Lock.sol"]
+NAMES = re.compile(r"\b(MyERC20Token|Lock|MyContract|transfer|withdraw|approve|balanceOf)\b")
+WORDS = ["vault", "stake", "reward", "oracle", "price", "swap", "pool", "fee", "vote", "proposal",
+         "mint", "burn", "pause", "owner", "claim", "lock", "escrow", "auction", "bid", "nft"]
+QUERIES = [
+    "why does transfer in MyContract1 revert",
+    "how does withdraw check the unlock time",
+    "what does setMessage do",
+    "where is the allowance checked in transferFrom",
+    "Explain what is a Solidity contract and how the owner can pause minting of tokens when the "
+    "price oracle fails, and whether the reward pool keeps the fee after a vote on a proposal",
+]
+
+
+def project(files: int):
+    source = "\n".join(open(os.path.join(PROJECT, path)).read() for path in SOURCES)
+    rng = random.Random(7)
+    for number in range(files):
+        yield f"contracts/Token{number}.sol", NAMES.sub(
+            lambda match: f"{match.group(1)}{rng.choice(WORDS).capitalize()}{number}", source
+        )
+
+
+def score_every_posting(index: CodeIndex, query: str, k: int):
+    count = len(index.chunks)
+    average = index.total_length / count
+    terms = sorted((len(index.postings[term]), term) for term in set(tokenize(query)) if term in index.postings)
+    scores = {}
+    for frequency, term in terms[:MAX_QUERY_TERMS]:
+        idf = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+        for chunk_id, tf in index.postings[term].items():
+            norm = K1 * (1 - B + B * index.lengths[chunk_id] / average)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+    return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+
+
+def main(args):
+    index = CodeIndex()
+    files = list(project(args.files))
+    started = time.perf_counter()
+    for path, content in files:
+        index.update(path, content)
+    build = time.perf_counter() - started
+    print({"files": len(files), "chunks": len(index), "terms": len(index.postings), "build_s": round(build, 3)})
+
+    # Edit one function body per round in a different file each time
+    updates = []
+    for number in range(args.iterations):
+        path, content = files[number % len(files)]
+        edited = content.replace(
+            "require(block.timestamp >= unlockTime", f"require({number} + block.timestamp >= unlockTime", 1
+        )
+        indexed = index.chunks_indexed
+        started = time.perf_counter()
+        index.update(path, edited)
+        updates.append(time.perf_counter() - started)
+        files[number % len(files)] = (path, edited)
+    print({
+        "update_p50_ms": percentile(updates, 0.5),
+        "update_p99_ms": percentile(updates, 0.99),
+        "chunks_reindexed_per_edit": index.chunks_indexed - indexed,
+    })
+
+    for query in QUERIES:
+        latencies = []
+        baseline = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            found = search([index], query, args.k)
+            latencies.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            score_every_posting(index, query, args.k)
+            baseline.append(time.perf_counter() - started)
+        print({
+            "query": query[:40],
+            "p50_ms": percentile(latencies, 0.5),
+            "p99_ms": percentile(latencies, 0.99),
+            "every_posting_p50_ms": percentile(baseline, 0.5),
+            "top": [f"{chunk.name} {score:.1f}" for score, chunk in found[:2]],
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=300, help="16 chunks each")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4, help="chunks returned per query")
+    main(parser.parse_args())
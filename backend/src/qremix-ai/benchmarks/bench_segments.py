@@ -0,0 +1,112 @@
+"""Cost of splitting answers into segments, against a chain of regexes.
+
+Builds answers shaped like the ones SYSTEM_PROMPT asks for (prose, a few
+fenced code blocks, an **Explanation** section) at several sizes and times
+parse_segments() on each, along with expand_segments(), which builds the
+API form on every /chat and /history response. The baseline does the same
+job the usual way: a non-greedy fence regex, a search for the Explanation
+heading in each prose piece, then a strip per piece (without ~~~, longer or
+indented fences, which the parser handles). The answers here have a fence
+every few lines, the parser's worst case since it only stops at lines that
+start with a fence or a heading character. Also reports how much the stored
+segments (offsets into the content) add to a message as JSON.
+
+    python benchmarks/bench_segments.py --iterations 2000 --sizes 1 4 16 64
+"""
+import argparse
+import json
+import re
+import time
+
+from common import SERVICE_DIR  # noqa: F401  (puts the service on sys.path)
+from segments import expand_segments, parse_segments
+
+FENCE = re.compile(r"```([\w+-]*)[^\n]*\n(.*?)```", re.DOTALL)
+EXPLANATION = re.compile(r"^(?:#{1,6}\s*)?\*\*Explanation:?\*\*:?|^#{1,6}\s*Explanation", re.IGNORECASE | re.MULTILINE)
+HEADING = re.compile(r"^#{1,6}\s", re.MULTILINE)
+
+BLOCK = (
+    "Here is a contract that does what you asked, with the storage kept in a mapping.\n\n"
+    "```solidity\n// SPDX-License-Identifier: MIT\npragma solidity ^0.8.20;\n\n"
+    "contract Vault {\n    mapping(address => uint256) public balances;\n\n"
+    "    function deposit() external payable {\n        balances[msg.sender] += msg.value;\n    }\n}\n```\n\n"
+    "You can call it from JavaScript like this:\n\n"
+    "```javascript\nconst tx = await vault.deposit({ value: ethers.parseEther(\"1\") });\nawait tx.wait();\n```\n\n"
+)
+EXPLAIN = (
+    "**Explanation**\n"
+    "- `balances` maps each depositor to the wei they sent.\n"
+    "- `deposit` is `payable`, so it can receive ether, and adds `msg.value` to the sender's balance.\n"
+)
+
+
+def regex_chain(markdown: str):
+    segments = []
+    position = 0
+    pieces = []
+    for match in FENCE.finditer(markdown):
+        pieces.append(("prose", markdown[position:match.start()], ""))
+        pieces.append(("code", match.group(2).rstrip("\n"), match.group(1)))
+        position = match.end()
+    pieces.append(("prose", markdown[position:], ""))
+    in_explanation = False
+    for kind, text, language in pieces:
+        if kind == "code":
+            segments.append({"type": "code", "content": text, "language": language})
+            continue
+        heading = EXPLANATION.search(text)
+        if heading is not None:
+            before, text = text[:heading.start()], text[heading.end():]
+            if before.strip():
+                segments.append({"type": "explanation" if in_explanation else "text", "content": before.strip()})
+            in_explanation = True
+        if in_explanation and HEADING.search(text):
+            in_explanation = False
+        if text.strip():
+            segments.append({"type": "explanation" if in_explanation else "text", "content": text.strip()})
+    return segments
+
+
+def answer(kilobytes: int) -> str:
+    body = BLOCK * max(1, kilobytes * 1024 // len(BLOCK))
+    return body + EXPLAIN
+
+
+def per_call_us(function, text: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(text)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(args):
+    for kilobytes in args.sizes:
+        text = answer(kilobytes)
+        stored = parse_segments(text)
+        iterations = max(10, args.iterations // kilobytes)
+        parse_us = per_call_us(parse_segments, text, iterations)
+        print({
+            "answer_kb": round(len(text) / 1024, 1),
+            "segments": len(stored),
+            "parse_us": round(parse_us, 1),
+            "parse_us_per_kb": round(parse_us / (len(text) / 1024), 2),
+            "expand_us": round(per_call_us(lambda t: expand_segments(t, stored), text, iterations), 1),
+            "regex_chain_us": round(per_call_us(regex_chain, text, iterations), 1),
+            "stored_json_bytes": len(json.dumps(stored)),
+            "content_json_bytes": len(json.dumps(text)),
+        })
+    # The closing fences dropped, so each opening fence has to be matched much further on
+    text = answer(args.sizes[-1]).replace("```\n\n", "\n\n")
+    iterations = max(10, args.iterations // args.sizes[-1])
+    print({
+        "unclosed_fences_kb": round(len(text) / 1024, 1),
+        "parse_us": round(per_call_us(parse_segments, text, iterations), 1),
+        "regex_chain_us": round(per_call_us(regex_chain, text, iterations), 1),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="calls at 1 KB, fewer for larger answers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16, 64], help="answer sizes in KB")
+    main(parser.parse_args())
@@ -0,0 +1,122 @@
+"""Lookup latency of the near-duplicate (semantic) cache at large sizes.
+
+Fills the cache with synthetic prompts, then times lookups of reworded
+variants. The full-matrix product is timed as well to show what candidate
+selection saves. Before that, checks pairs of prompts one at a time: each
+paraphrase should be answered from the other's entry, and each pair that
+uses the same words for a different request (the opposite conversion)
+must not be.
+
+    python benchmarks/bench_semantic_cache.py --entries 100000
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from common import SERVICE_DIR  # noqa: F401  (puts the service on sys.path)
+from semantic_cache import SemanticCache
+
+TOPICS = [
+    "erc20", "erc721", "erc1155", "reentrancy", "modifier", "mapping", "struct", "event",
+    "fallback", "receive", "payable", "constructor", "interface", "library", "delegatecall",
+    "selfdestruct", "keccak256", "abi", "gas", "storage", "memory", "calldata", "oracle",
+    "uniswap", "staking", "vesting", "multisig", "proxy", "upgradeable", "ownable",
+]
+VERBS = ["write", "explain", "debug", "optimize", "show", "audit", "document", "test"]
+FILLER = ["how do i", "please", "can you", "quickly", "in solidity", "for my project", "a simple"]
+PARAPHRASES = [
+    ("how do I write an erc20", "write ERC20 token contract"),
+    ("explain reentrancy attacks", "Explain reentrancy attack"),
+    ("what is a modifier in solidity", "What's a modifier in Solidity?"),
+    ("convert this solidity code to python", "Convert this Solidity code into Python"),
+    ("how to prevent reentrancy in solidity", "prevent reentrancy in solidity"),
+]
+DIFFERENT_REQUESTS = [
+    ("convert this solidity code to python", "convert this python code to solidity"),
+    ("translate python to javascript", "translate javascript to python"),
+    ("how do I transfer tokens to a contract", "how do I transfer tokens from a contract"),
+    ("write a token", "write a contract"),
+    ("write an erc20 token", "write an erc721 token"),
+    ("explain reentrancy", "prevent reentrancy"),
+]
+
+
+def prompt(rng: random.Random, names: list) -> str:
+    # Real prompts mix a few common topic words with project-specific identifiers
+    topic = rng.sample(TOPICS, 2)
+    name = names[min(int(rng.paretovariate(1.2)) - 1, len(names) - 1)]
+    return f"{rng.choice(FILLER)} {rng.choice(VERBS)} {topic[0]} {topic[1]} for {name}"
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def check_pairs(args) -> None:
+    for expected, pairs in ((True, PARAPHRASES), (False, DIFFERENT_REQUESTS)):
+        for cached, asked in pairs:
+            cache = SemanticCache(max_entries=4, threshold=args.threshold, ttl=3600, dims=args.dims)
+            cache.put(cached, "0" * 64, "answer")
+            hit = cache.get(asked, "0" * 64) is not None
+            print({
+                "cached": cached,
+                "asked": asked,
+                "similarity": round(cache.similarity(cached, asked), 3),
+                "hit": hit,
+                "ok": hit == expected,
+            })
+
+
+def main(args):
+    check_pairs(args)
+    rng = random.Random(7)
+    cache = SemanticCache(max_entries=args.entries, threshold=args.threshold, ttl=3600, dims=args.dims)
+    context = "0" * 64
+    names = [f"{rng.choice(TOPICS)}{rng.choice(VERBS)}{i}" for i in range(args.identifiers)]
+    rng.shuffle(names)
+    prompts = [prompt(rng, names) for _ in range(args.entries)]
+
+    start = time.perf_counter()
+    for i, text in enumerate(prompts):
+        cache.put(text, context, f"answer {i}")
+    insert_us = (time.perf_counter() - start) / args.entries * 1e6
+
+    latencies = []
+    hits = 0
+    for _ in range(args.lookups):
+        index = rng.randrange(args.entries)
+        # Same words, different case/spacing/punctuation
+        variant = "  " + prompts[index].upper().replace(" ", "   ") + "?"
+        start = time.perf_counter()
+        result = cache.get(variant, context)
+        latencies.append(time.perf_counter() - start)
+        hits += result is not None
+
+    query = np.random.rand(cache.dims).astype(np.float32)
+    start = time.perf_counter()
+    for _ in range(20):
+        cache._vectors @ query
+    full_scan_ms = (time.perf_counter() - start) / 20 * 1000
+
+    print({
+        "entries": len(cache),
+        "insert_us": round(insert_us, 1),
+        "lookup_p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "lookup_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "full_scan_ms": round(full_scan_ms, 3),
+        "variant_hit_rate": round(hits / args.lookups, 3),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=2_000)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--dims", type=int, default=512)
+    parser.add_argument("--identifiers", type=int, default=20_000, help="distinct contract/function names")
+    main(parser.parse_args())
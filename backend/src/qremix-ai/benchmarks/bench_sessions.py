@@ -0,0 +1,59 @@
+"""Resident memory of the session history store under many concurrent sessions.
+
+Simulates N sessions each holding a conversation with code-sized answers and
+checks that the memory actually allocated by the store (tracemalloc) stays
+within the configured HISTORY_MAX_BYTES cap once eviction kicks in.
+
+    python benchmarks/bench_sessions.py --sessions 10000 --cap-mb 64
+"""
+import argparse
+import random
+import resource
+import time
+import tracemalloc
+import uuid
+
+from common import SERVICE_DIR  # noqa: F401  (puts the service on sys.path)
+from history_store import SessionHistoryStore
+
+
+def main(args):
+    rng = random.Random(42)
+    cap = args.cap_mb * 1024 * 1024
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    store = SessionHistoryStore(max_bytes=cap, idle_ttl=3600, max_messages=100)
+    session_ids = [uuid.uuid4().hex for _ in range(args.sessions)]
+
+    start = time.perf_counter()
+    appends = 0
+    for turn in range(args.turns):
+        for session_id in session_ids:
+            store.append(session_id, {"role": "user", "content": "q" * rng.randint(20, 400)})
+            store.append(session_id, {"role": "assistant", "content": "a" * rng.randint(200, 4000)})
+            appends += 2
+    elapsed = time.perf_counter() - start
+
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = store.stats()
+    print({
+        "sessions_requested": args.sessions,
+        "sessions_resident": stats["sessions"],
+        "evictions": stats["evictions"],
+        "cap_mb": args.cap_mb,
+        "accounted_mb": round(stats["bytes"] / 2**20, 2),
+        "traced_mb": round((current - baseline) / 2**20, 2),
+        "traced_peak_mb": round((peak - baseline) / 2**20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "append_us": round(elapsed / appends * 1e6, 2),
+        "within_cap": current - baseline <= cap,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--cap-mb", type=int, default=64)
+    main(parser.parse_args())
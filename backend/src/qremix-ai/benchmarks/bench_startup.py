@@ -0,0 +1,139 @@
+"""Import time of server.py and time until a fresh process answers.
+
+Imports the service under ``python -X importtime`` and reports the total
+with the slowest top-level imports, then starts it under uvicorn and polls
+until /health (liveness) and /ready (warm-up done) first return 200, timed
+from process start. Each figure is the median of --runs, and the script
+exits with status 1 when one goes over its budget, so it can guard
+against regressions in CI. The import budget is for ``own_import_ms``, the
+import time without FastAPI (and the pydantic and starlette it pulls in):
+FastAPI alone takes 350-600 ms depending on the machine, which nothing in
+this tree can change, while the rest is ours and takes 70-105 ms here.
+
+--history-messages fills the history log first, to show that replaying it
+delays /ready but not /health.
+
+    python benchmarks/bench_startup.py --runs 5 --history-messages 100000
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import SERVICE_DIR, free_port
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+# Imported first by server.py, so its time includes pydantic and starlette
+FRAMEWORK = "fastapi"
+
+
+def import_profile() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=SERVICE_DIR, capture_output=True, text=True, check=True,
+    )
+    # Modules are listed after everything they import, so the direct imports of server.py
+    # are the second-level lines between the previous top-level line and "server"
+    children = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent == 1:
+            if name == "server":
+                return {"total_us": cumulative, "children": children}
+            children = {}
+        elif indent == 3:
+            children[name] = cumulative
+    raise RuntimeError("server.py did not show up in the -X importtime output")
+
+
+def time_to_ok(env: dict, timeout: float = 60) -> dict:
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env,
+    )
+    reached = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as http:
+            while len(reached) < 2 and time.perf_counter() - start < timeout:
+                for path in ("/health", "/ready"):
+                    if path in reached:
+                        continue
+                    try:
+                        if http.get(path).status_code == 200:
+                            reached[path] = time.perf_counter() - start
+                    except httpx.TransportError:
+                        pass
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return reached
+
+
+def fill_history(directory: str, messages: int) -> None:
+    from bench_history_log import append_turns, open_backend
+
+    async def fill():
+        backend = open_backend(directory, fsync=False, snapshot_bytes=1 << 40)
+        await append_turns(backend, messages, writers=64, sessions=1000, size=400)
+        await backend.close()
+
+    asyncio.run(fill())
+
+
+def median_ms(samples) -> float:
+    return round(statistics.median(samples) * 1000, 1)
+
+
+def main(args):
+    profiles = [import_profile() for _ in range(args.runs)]
+    totals = [profile["total_us"] / 1e6 for profile in profiles]
+    slowest = sorted(profiles[-1]["children"].items(), key=lambda item: -item[1])[:args.top]
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        if args.history_messages:
+            fill_history(log_dir, args.history_messages)
+        # Warm-up only builds the client, so any key will do; nothing is sent to Groq
+        env = {**os.environ, "HISTORY_LOG_DIR": log_dir, "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "bench-key")}
+        starts = [time_to_ok(env) for _ in range(args.runs)]
+    if any(len(reached) < 2 for reached in starts):
+        sys.exit(f"the service did not become ready: {starts}")
+
+    own = [(profile["total_us"] - profile["children"].get(FRAMEWORK, 0)) / 1e6 for profile in profiles]
+    result = {
+        "import_ms": median_ms(totals),
+        "own_import_ms": median_ms(own),
+        "first_health_ms": median_ms([reached["/health"] for reached in starts]),
+        "first_ready_ms": median_ms([reached["/ready"] for reached in starts]),
+    }
+    budgets = {"own_import_ms": args.import_budget_ms, "first_health_ms": args.health_budget_ms,
+               "first_ready_ms": args.ready_budget_ms}
+    print({**result, "history_messages": args.history_messages})
+    print({"slowest_imports_ms": {name: round(us / 1000, 1) for name, us in slowest}})
+    over = {name: f"{result[name]} > {budget}" for name, budget in budgets.items() if result[name] > budget}
+    if over:
+        print({"over_budget": over})
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest direct imports to list")
+    parser.add_argument("--history-messages", type=int, default=0)
+    parser.add_argument("--import-budget-ms", type=float, default=150, help="for own_import_ms")
+    parser.add_argument("--health-budget-ms", type=float, default=2000)
+    parser.add_argument("--ready-budget-ms", type=float, default=2500)
+    main(parser.parse_args())
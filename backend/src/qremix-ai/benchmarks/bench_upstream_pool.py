@@ -0,0 +1,109 @@
+"""First-request latency with a cold and a pre-warmed Groq connection pool.
+
+Starts the service against the mock Groq server with
+UPSTREAM_WARM_CONNECTIONS=0 (every connection is opened on demand) and
+with warm connections, waits for /ready, then sends one /chat and right
+after it a concurrent burst, all with X-Cache-Bypass so each one calls
+upstream. Reports the first request's latency with its pool and connect
+Server-Timing phases, the burst's latency, and how many connections the
+requests had to open. Each mode is run --runs times on a fresh process.
+
+With --tls the mock serves HTTPS with a throwaway self-signed certificate
+(made with the openssl command), so a new connection pays for a TLS
+handshake as well as TCP. Against Groq itself both cost round trips, so
+expect the gap to be several times larger than on loopback.
+
+    python benchmarks/bench_upstream_pool.py --tls --runs 5 --burst 8
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+
+import httpx
+
+from common import mock_groq, service
+
+PHASE = re.compile(r"(\w[\w-]*);dur=([\d.]+)")
+
+
+def self_signed_certificate(directory: str):
+    certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True,
+    )
+    return certfile, keyfile
+
+
+async def wait_ready(http: httpx.AsyncClient, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while (await http.get("/ready")).status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError("the service did not become ready")
+        await asyncio.sleep(0.05)
+
+
+async def chat(http: httpx.AsyncClient, prompt: str) -> dict:
+    start = time.perf_counter()
+    response = await http.post(
+        "/chat", json={"message": prompt}, headers={"X-Cache-Bypass": "1", "X-Session-Id": f"pool-{prompt[:20]}"}
+    )
+    phases = {name: float(ms) for name, ms in PHASE.findall(response.headers.get("server-timing", ""))}
+    return {"ms": (time.perf_counter() - start) * 1000, "pool": phases.get("pool", 0.0),
+            "connect": phases.get("connect", 0.0), "opened": "connect" in phases}
+
+
+async def first_requests(base_url: str, burst: int) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+        await wait_ready(http)
+        first = await chat(http, "first request: explain mappings")
+        others = await asyncio.gather(*(chat(http, f"burst request {i}: explain events") for i in range(burst)))
+    return {
+        "first_ms": first["ms"],
+        "first_pool_ms": first["pool"],
+        "first_connect_ms": first["connect"],
+        "burst_max_ms": max(result["ms"] for result in others),
+        "connections_opened": first["opened"] + sum(result["opened"] for result in others),
+    }
+
+
+def median(runs, key: str) -> float:
+    return round(statistics.median(run[key] for run in runs), 2)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        mock_args = ["--latency", str(args.latency)]
+        env = {"HISTORY_LOG_DIR": ""}
+        if args.tls:
+            certfile, keyfile = self_signed_certificate(directory)
+            mock_args += ["--ssl-certfile", certfile, "--ssl-keyfile", keyfile]
+            # httpx trusts SSL_CERT_FILE in place of its CA bundle
+            env["SSL_CERT_FILE"] = certfile
+        with mock_groq(*mock_args):
+            for warm in (0, args.warm):
+                runs = []
+                for _ in range(args.runs):
+                    with service(UPSTREAM_WARM_CONNECTIONS=str(warm), **env) as base_url:
+                        runs.append(asyncio.run(first_requests(base_url, args.burst)))
+                print({
+                    "warm_connections": warm,
+                    "tls": args.tls,
+                    **{key: median(runs, key) for key in runs[0]},
+                })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--burst", type=int, default=8, help="concurrent requests sent after the first one")
+    parser.add_argument("--warm", type=int, default=4, help="UPSTREAM_WARM_CONNECTIONS for the warm runs")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock completion latency in seconds")
+    parser.add_argument("--tls", action="store_true", help="serve the mock over HTTPS")
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+"""/chat throughput with several uvicorn workers sharing one history backend.
+
+Starts the service with ``--workers N`` for each N and each shared backend
+(SQLite in WAL mode, and the Redis stand-in), then runs concurrent clients
+that each hold a multi-turn conversation in their own session. Requests of
+one session land on different workers, so the final /history of every
+session is checked for all of its turns.
+
+    python benchmarks/bench_workers.py --workers 1 4 8 --clients 64 --turns 5
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from common import mini_redis, mock_groq, service
+
+
+async def conversation(http: httpx.AsyncClient, client: int, turns: int, latencies: list) -> bool:
+    session = f"worker-bench-{client:06d}-{time.monotonic_ns()}"[:64]
+    headers = {"X-Session-Id": session}
+    for turn in range(turns):
+        start = time.perf_counter()
+        response = await http.post("/chat", json={"message": f"Turn {turn} of client {client}"}, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    history = (await http.get("/history", params={"limit": 100}, headers=headers)).json()
+    return len(history["messages"]) == 2 * turns
+
+
+async def run(base_url: str, clients: int, turns: int) -> dict:
+    latencies = []
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as http:
+        start = time.perf_counter()
+        complete = await asyncio.gather(*(conversation(http, i, turns, latencies) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "req_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "consistent_sessions": f"{sum(complete)}/{clients}",
+    }
+
+
+def main(args):
+    with mock_groq("--latency", str(args.latency)), mini_redis() as redis_url, tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            backends = {"sqlite": f"sqlite:///{tmp}/history-{workers}.db", "redis": redis_url}
+            if workers == 1:
+                backends = {"memory": "memory://", **backends}
+            for name, url in backends.items():
+                with service(workers, HISTORY_BACKEND=url, HISTORY_LOG_DIR=f"{tmp}/log-{workers}") as base_url:
+                    result = asyncio.run(run(base_url, args.clients, args.turns))
+                print({"workers": workers, "backend": name, **result})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock Groq latency")
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+"""Request sizes and server cost of referencing editor code through the workspace mirror.
+
+Simulates the editor's loop: a contract of --kb kilobytes is edited a line
+at a time and a question about it is asked after each edit. Compares the
+bytes sent per question when the whole contract is pasted into the message
+with the mirror (a PATCH carrying the one changed line, then a chat body
+with just a hash and a line range), and times the server side of the
+mirror: applying the patch (which rehashes the file), resolving a whole
+file and a 20-line range. The contract is the repo's ERC20.sol repeated up
+to the requested size.
+
+    python benchmarks/bench_workspace.py --kb 4 16 64 --questions 200
+"""
+import argparse
+import json
+import os
+import time
+
+from common import SERVICE_DIR
+from workspace import WorkspaceMirror, content_hash
+
+CONTRACT = os.path.join(SERVICE_DIR, "..", "..", "contracts", "ERC20.sol")
+SESSION = "benchworkspace"
+
+
+def contract(kilobytes: int) -> str:
+    with open(CONTRACT) as f:
+        source = f.read()
+    return source * max(1, kilobytes * 1024 // len(source))
+
+
+def edit(content: str, number: int):
+    # Rewrites one line in the middle of the file, like a burst of typing between questions
+    middle = content.index("\n", len(content) // 2) + 1
+    end = content.index("\n", middle)
+    text = f"    // edit {number}"
+    return (middle, end, text), content[:middle] + text + content[end:]
+
+
+def body_bytes(payload) -> int:
+    return len(json.dumps(payload).encode())
+
+
+def main(args):
+    question = "Why does transferFrom check the allowance before the balance?"
+    for kilobytes in args.kb:
+        mirror = WorkspaceMirror(
+            max_bytes=1 << 30, idle_ttl=3600, max_file_bytes=1 << 30, max_session_bytes=1 << 30
+        )
+        content = contract(kilobytes)
+        upload = {"path": "contracts/ERC20.sol", "content": content}
+        file = mirror.put(SESSION, upload["path"], content)
+        pasted = mirror_sent = 0
+        patch_time = resolve_file_time = resolve_range_time = 0.0
+        for number in range(args.questions):
+            replacement, new_content = edit(file.content, number)
+            patch = {
+                "path": file.path,
+                "base": file.hash,
+                "edits": [dict(zip(("start", "end", "text"), replacement))],
+                "hash": content_hash(new_content),
+            }
+            started = time.perf_counter()
+            file = mirror.patch(SESSION, file.path, file.hash, [replacement], patch["hash"])
+            patch_time += time.perf_counter() - started
+            chat = {"message": question, "references": [{"hash": file.hash, "start_line": 40, "end_line": 59}]}
+            mirror_sent += body_bytes(patch) + body_bytes(chat)
+            pasted += body_bytes({"message": f"{new_content}\n\n{question}"})
+            started = time.perf_counter()
+            mirror.resolve(SESSION, [(file.hash, None, None)])
+            resolve_file_time += time.perf_counter() - started
+            started = time.perf_counter()
+            mirror.resolve(SESSION, [(file.hash, 40, 59)])
+            resolve_range_time += time.perf_counter() - started
+        per_question = args.questions
+        print({
+            "contract_kb": round(len(content) / 1024, 1),
+            "upload_bytes": body_bytes(upload),
+            "pasted_bytes_per_question": pasted // per_question,
+            "mirror_bytes_per_question": mirror_sent // per_question,
+            "patch_us": round(patch_time / per_question * 1e6, 1),
+            "resolve_file_us": round(resolve_file_time / per_question * 1e6, 1),
+            "resolve_range_us": round(resolve_range_time / per_question * 1e6, 1),
+            "mirror_bytes": mirror.stats()["bytes"],
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kb", type=int, nargs="+", default=[4, 16, 64], help="contract sizes in KB")
+    parser.add_argument("--questions", type=int, default=200, help="edit-then-ask rounds per size")
+    main(parser.parse_args())
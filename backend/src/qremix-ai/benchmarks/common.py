@@ -0,0 +1,78 @@
+"""Helpers shared by the benchmark scripts."""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+
+# Make server.py importable from the benchmark scripts
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+
+@contextlib.contextmanager
+def mock_groq(*args: str):
+    """Run benchmarks/mock_groq.py in a subprocess and point GROQ_BASE_URL at it."""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_groq.py"), "--port", str(port), *args]
+    )
+    try:
+        wait_for_port(port)
+        base_url = f"{'https' if '--ssl-certfile' in args else 'http'}://127.0.0.1:{port}"
+        os.environ["GROQ_BASE_URL"] = base_url
+        os.environ.setdefault("GROQ_API_KEY", "mock-key")
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+@contextlib.contextmanager
+def service(workers: int = 1, **env: str):
+    """Run server.py under uvicorn with extra environment variables and yield its URL."""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=SERVICE_DIR,
+        env={**os.environ, **env},
+    )
+    try:
+        wait_for_port(port, timeout=60)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+@contextlib.contextmanager
+def mini_redis():
+    """Run benchmarks/mini_redis.py in a subprocess and yield its redis:// URL."""
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "mini_redis.py"), "--port", str(port)])
+    try:
+        wait_for_port(port)
+        yield f"redis://127.0.0.1:{port}/0"
+    finally:
+        proc.terminate()
+        proc.wait()
@@ -0,0 +1,251 @@
+"""Closed-loop load generator for /chat, /chat/stream and /clear.
+
+Starts the mock Groq server and the service under uvicorn (or targets a
+running service with --url), then runs --concurrency virtual users for
+--duration seconds. Each user keeps its own session and repeatedly picks
+an operation from --mix; prompts are drawn from --prompts distinct ones,
+which sets how often the response cache can hit. A --slow-clients fraction
+of streams is read with a pause after every chunk, the way a slow network
+or a busy browser tab reads it.
+
+Reports per operation: throughput, p50/p95/p99 latency, time to first token
+for streams, and outcomes (HTTP status, plus the final event for streams).
+Event loop lag is reported for the service (from its /metrics) and for the
+generator itself; if the generator's is high, it is the bottleneck and
+the numbers understate the service.
+
+Arguments this script does not know are passed on to mock_groq.py:
+
+    python benchmarks/loadgen.py --concurrency 64 --duration 30 --mix chat=6,stream=3,clear=1 \\
+        --output results/run.json --latency 0.3 --latency-dist lognormal --error-rate 0.01
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import random
+import re
+import subprocess
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from common import SERVICE_DIR, mock_groq, service
+
+OPERATIONS = ("chat", "stream", "clear")
+LAG_METRIC = "qremix_event_loop_lag_seconds"
+
+
+class Recorder:
+    """Latencies and outcomes per operation, collected on the generator's event loop."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.first_tokens: List[float] = []
+        self.outcomes: Dict[str, Counter] = defaultdict(Counter)
+
+    def add(self, operation: str, latency: float, outcome: str) -> None:
+        self.latencies[operation].append(latency)
+        self.outcomes[operation][outcome] += 1
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r} (expected one of {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def at(q: float) -> float:
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+
+    return {"p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99), "max_ms": round(samples[-1] * 1000, 1)}
+
+
+async def chat(http: httpx.AsyncClient, session: str, prompt: str, recorder: Recorder) -> None:
+    start = time.perf_counter()
+    response = await http.post("/chat", json={"message": prompt}, headers={"X-Session-Id": session})
+    recorder.add("chat", time.perf_counter() - start, str(response.status_code))
+
+
+async def stream(http: httpx.AsyncClient, session: str, prompt: str, recorder: Recorder, args, slow: bool) -> None:
+    start = time.perf_counter()
+    first_token = None
+    event = "none"
+    async with http.stream("POST", "/chat/stream", json={"message": prompt}, headers={"X-Session-Id": session}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and first_token is None:
+                first_token = time.perf_counter() - start
+                recorder.first_tokens.append(first_token)
+            if slow:
+                await asyncio.sleep(args.slow_client_delay)
+        outcome = f"{response.status_code} {event}" if response.status_code == 200 else str(response.status_code)
+    recorder.add("stream", time.perf_counter() - start, outcome)
+
+
+async def clear(http: httpx.AsyncClient, session: str, recorder: Recorder) -> None:
+    start = time.perf_counter()
+    response = await http.post("/clear", headers={"X-Session-Id": session})
+    recorder.add("clear", time.perf_counter() - start, str(response.status_code))
+
+
+async def user(index: int, http: httpx.AsyncClient, deadline: float, mix: Dict[str, float], recorder: Recorder, args):
+    rng = random.Random(args.seed * 100_003 + index)
+    session = f"load-{index:06d}-{os.getpid()}"
+    operations, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        prompt = f"Prompt {rng.randrange(args.prompts)}: explain the storage layout of a mapping"
+        try:
+            if operation == "chat":
+                await chat(http, session, prompt, recorder)
+            elif operation == "stream":
+                await stream(http, session, prompt, recorder, args, slow=rng.random() < args.slow_clients)
+            else:
+                await clear(http, session, recorder)
+        except httpx.HTTPError as error:
+            recorder.add(operation, 0.0, type(error).__name__)
+        if args.think_time:
+            await asyncio.sleep(rng.expovariate(1 / args.think_time))
+
+
+async def sample_own_lag(lags: List[float], stop: asyncio.Event, interval: float = 0.05) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        due = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - due))
+
+
+def read_histogram(text: str, name: str) -> Dict[str, float]:
+    # Cumulative bucket counts plus _sum and _count of an unlabelled histogram
+    values = {}
+    for line in text.splitlines():
+        match = re.match(rf'{name}_(bucket\{{le="([^"]+)"\}}|sum|count) (\S+)$', line)
+        if match:
+            values[match.group(2) or match.group(1)] = float(match.group(3))
+    return values
+
+
+def lag_between(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    count = after.get("count", 0) - before.get("count", 0)
+    if count <= 0:
+        return {}
+    total = after["sum"] - before.get("sum", 0)
+    # p99 is reported as the upper bound of the bucket it falls in
+    bounds = sorted((float(le), after[le] - before.get(le, 0)) for le in after if le not in ("sum", "count"))
+    p99 = next(bound for bound, seen in bounds if seen >= 0.99 * count)
+    return {"samples": int(count), "mean_ms": round(total / count * 1000, 2), "p99_le_ms": round(p99 * 1000, 1)}
+
+
+async def scrape_lag(http: httpx.AsyncClient) -> Dict[str, float]:
+    with contextlib.suppress(httpx.HTTPError):
+        response = await http.get("/metrics")
+        if response.status_code == 200:
+            return read_histogram(response.text, LAG_METRIC)
+    return {}
+
+
+async def run(base_url: str, args, mix: Dict[str, float]) -> dict:
+    recorder = Recorder()
+    own_lags: List[float] = []
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as http:
+        lag_before = await scrape_lag(http)
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_own_lag(own_lags, stop))
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(user(i, http, deadline, mix, recorder, args) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        lag_after = await scrape_lag(http)
+
+    operations = {}
+    for operation, latencies in recorder.latencies.items():
+        outcomes = recorder.outcomes[operation]
+        ok = sum(count for outcome, count in outcomes.items() if outcome in ("200", "200 done"))
+        operations[operation] = {
+            "requests": len(latencies),
+            "ok": ok,
+            "throughput_rps": round(ok / elapsed, 1),
+            "latency": percentiles(latencies),
+            "outcomes": dict(outcomes),
+        }
+        if operation == "stream":
+            operations[operation]["ttft"] = percentiles(recorder.first_tokens)
+    total_ok = sum(result["ok"] for result in operations.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(total_ok / elapsed, 1),
+        "operations": operations,
+        "service_event_loop_lag": lag_between(lag_before, lag_after),
+        "generator_event_loop_lag": percentiles(own_lags),
+    }
+
+
+def git_commit() -> Optional[str]:
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running service instead of starting one against the mock")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--mix", type=parse_mix, default="chat=6,stream=3,clear=1", help="weighted operations")
+    parser.add_argument("--prompts", type=int, default=1000, help="distinct prompts (fewer: more cache hits)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a user's requests")
+    parser.add_argument("--slow-clients", type=float, default=0.0, help="fraction of streams read slowly")
+    parser.add_argument("--slow-client-delay", type=float, default=0.05, help="pause after each streamed line")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when starting the service")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    # argparse runs string defaults through type as well, so args.mix is always a dict
+    args, mock_args = parser.parse_known_args()
+
+    with contextlib.ExitStack() as stack:
+        base_url = args.url
+        if base_url is None:
+            stack.enter_context(mock_groq(*mock_args))
+            # A throwaway history log, so runs neither see nor keep earlier sessions
+            log_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            base_url = stack.enter_context(service(args.workers, HISTORY_LOG_DIR=log_dir))
+        results = asyncio.run(run(base_url, args, args.mix))
+
+    report = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {**vars(args), "mock_args": mock_args},
+        "results": results,
+    }
+    print(json.dumps(report["results"], indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Local stand-in for Redis, for trying HISTORY_BACKEND=redis:// without a server.
+
+Speaks RESP2 and implements just the commands the history backend uses
+(strings, lists, expiry and MULTI/EXEC). Everything runs on one event loop,
+so a transaction is trivially atomic.
+
+    python benchmarks/mini_redis.py --port 6390
+    HISTORY_BACKEND=redis://127.0.0.1:6390/0 python server.py
+"""
+import argparse
+import asyncio
+import time
+
+from common import SERVICE_DIR  # noqa: F401  (puts the service on sys.path)
+from redis_protocol import RedisError
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _live(self, key: str):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _list(self, key: str) -> list:
+        value = self._live(key)
+        if value is None:
+            value = self.data[key] = []
+        if not isinstance(value, list):
+            raise RedisError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def execute(self, name: str, args: list):
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            return RedisError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except RedisError as error:
+            return error
+        except (TypeError, ValueError):
+            return RedisError(f"ERR wrong arguments for '{name}' command")
+
+    def cmd_ping(self):
+        return "PONG"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_get(self, key):
+        value = self._live(key)
+        if isinstance(value, list):
+            raise RedisError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def cmd_set(self, key, value, *options):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if len(options) == 2 and options[0].upper() == "EX":
+            self.expires[key] = time.monotonic() + int(options[1])
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key) is not None:
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_incrby(self, key, amount):
+        value = int(self.cmd_get(key) or 0) + int(amount)
+        self.data[key] = str(value)
+        return value
+
+    def cmd_expire(self, key, seconds):
+        if self._live(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def cmd_rpush(self, key, *values):
+        items = self._list(key)
+        items.extend(values)
+        return len(items)
+
+    def cmd_llen(self, key):
+        value = self._live(key)
+        return len(value) if value else 0
+
+    def cmd_lrange(self, key, start, stop):
+        items = self._live(key) or []
+        start, stop = int(start), int(stop)
+        stop = len(items) if stop == -1 else stop + 1 if stop >= 0 else len(items) + stop + 1
+        return items[start if start >= 0 else max(len(items) + start, 0):stop]
+
+    def cmd_ltrim(self, key, start, stop):
+        items = self._live(key)
+        if items:
+            items[:] = self.cmd_lrange(key, start, stop)
+            if not items:
+                self.cmd_del(key)
+        return "OK"
+
+    def cmd_dbsize(self):
+        return sum(1 for key in list(self.data) if self._live(key) is not None)
+
+    def cmd_flushdb(self):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+
+def encode(value) -> bytes:
+    if isinstance(value, RedisError):
+        return b"-%s\r\n" % str(value).encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    if value in ("OK", "PONG", "QUEUED"):
+        return b"+%s\r\n" % value.encode()
+    data = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+async def read_command(reader: asyncio.StreamReader) -> list:
+    header = await reader.readline()
+    if not header:
+        return []
+    count = int(header[1:-2])
+    args = []
+    for _ in range(count):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2].decode())
+    return args
+
+
+def create_handler(store: Store):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queued = None
+        try:
+            while True:
+                command = await read_command(reader)
+                if not command:
+                    break
+                name, args = command[0].upper(), command[1:]
+                if name == "MULTI":
+                    queued = []
+                    reply = "OK"
+                elif name == "EXEC":
+                    reply = [store.execute(n, a) for n, a in queued] if queued is not None else RedisError("ERR EXEC without MULTI")
+                    queued = None
+                elif name == "DISCARD":
+                    queued = None
+                    reply = "OK"
+                elif queued is not None:
+                    queued.append((name, args))
+                    reply = "QUEUED"
+                else:
+                    reply = store.execute(name, args)
+                writer.write(encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(create_handler(Store()), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
@@ -0,0 +1,256 @@
+"""Local stand-in for the Groq chat completions API used by the benchmarks.
+
+Completion latency follows a configurable distribution around --latency
+(streams take a tenth of it to the first token, then one word every
+--token-delay seconds), a --spike-rate fraction of calls is slowed down
+--spike-factor times, and a fraction of calls can be failed with a 5xx or
+a 429 on top of the --rpm/--tpm quotas.
+
+Run standalone with:
+    python benchmarks/mock_groq.py --port 8900 --latency 0.5 --latency-dist lognormal --error-rate 0.01
+and point server.py at it with GROQ_BASE_URL=http://127.0.0.1:8900
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from typing import Callable, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class Quota:
+    """Per-minute quota refilled continuously, reported the way Groq does."""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.remaining = limit
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.remaining = min(self.limit, self.remaining + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    def headers(self, kind: str) -> dict:
+        reset = (self.limit - self.remaining) * 60 / self.limit
+        return {
+            f"x-ratelimit-limit-{kind}": str(int(self.limit)),
+            f"x-ratelimit-remaining-{kind}": str(int(self.remaining)),
+            f"x-ratelimit-reset-{kind}": f"{reset:.2f}s",
+        }
+
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+def latency_sampler(distribution: str, mean: float, spread: float, rng: random.Random) -> Callable[[], float]:
+    # Every distribution has the given mean; spread is the half-width for uniform and
+    # sigma for lognormal, where real API latencies tend to sit
+    if distribution == "fixed":
+        return lambda: mean
+    if distribution == "uniform":
+        return lambda: max(0.0, rng.uniform(mean - spread, mean + spread))
+    if distribution == "exponential":
+        return lambda: rng.expovariate(1 / mean) if mean > 0 else 0.0
+    if distribution == "lognormal":
+        mu = math.log(mean) - spread ** 2 / 2 if mean > 0 else 0.0
+        return lambda: rng.lognormvariate(mu, spread) if mean > 0 else 0.0
+    raise ValueError(f"unknown latency distribution {distribution!r}")
+
+
+def create_app(
+    latency: float = 0.5,
+    token_delay: float = 0.01,
+    rpm: float = 0,
+    tpm: float = 0,
+    distribution: str = "fixed",
+    spread: float = 0.5,
+    answer_words: int = 0,
+    error_rate: float = 0.0,
+    error_status: int = 500,
+    error_latency: float = 0.0,
+    throttle_rate: float = 0.0,
+    spike_rate: float = 0.0,
+    spike_factor: float = 10.0,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    app = FastAPI(title="Mock Groq")
+    app.state.calls = 0
+    app.state.throttled = 0
+    app.state.errors = 0
+    rng = random.Random(seed)
+    sample_latency = latency_sampler(distribution, latency, spread, rng)
+    quotas = {kind: Quota(limit) for kind, limit in (("requests", rpm), ("tokens", tpm)) if limit}
+
+    def charge(body: dict):
+        # Returns the rate limit headers, or a 429 response when the quota is exhausted
+        cost = {
+            "requests": 1,
+            "tokens": sum(len(m["content"]) // 4 + 4 for m in body["messages"]) + body.get("max_tokens", 0),
+        }
+        headers = {}
+        for kind, quota in quotas.items():
+            quota.refill()
+        short = [kind for kind, quota in quotas.items() if quota.remaining < min(cost[kind], quota.limit)]
+        if short:
+            wait = max((min(cost[k], quotas[k].limit) - quotas[k].remaining) * 60 / quotas[k].limit for k in short)
+            for kind, quota in quotas.items():
+                headers.update(quota.headers(kind))
+            headers["retry-after"] = str(max(1, int(wait + 0.999)))
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "tokens"}}, 429, headers=headers)
+        for kind, quota in quotas.items():
+            quota.remaining -= min(cost[kind], quota.limit)
+            headers.update(quota.headers(kind))
+        return headers
+
+    def injected_failure() -> Optional[JSONResponse]:
+        # Failures drawn independently of the quota, as seen from a busy shared API
+        draw = rng.random()
+        if draw < error_rate:
+            app.state.errors += 1
+            return JSONResponse(
+                {"error": {"message": "Internal server error", "type": "internal_server_error"}}, error_status
+            )
+        if draw < error_rate + throttle_rate:
+            app.state.throttled += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests"}}, 429, headers={"retry-after": "1"}
+            )
+        return None
+
+    def answer(prompt: str) -> str:
+        content = f"Mock answer to: {prompt[:80]}"
+        padding = answer_words - len(content.split(" "))
+        return content + "".join(f" word{i}" for i in range(padding)) if padding > 0 else content
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        failure = injected_failure()
+        if failure is not None:
+            # An overloaded or failing backend often takes a while to give up
+            await asyncio.sleep(error_latency)
+            return failure
+        headers = charge(body)
+        if isinstance(headers, JSONResponse):
+            app.state.throttled += 1
+            return headers
+        content = answer(body["messages"][-1]["content"])
+        delay = sample_latency()
+        if spike_rate and rng.random() < spike_rate:
+            # A call stuck behind a slow replica, the kind of tail hedging works around
+            delay *= spike_factor
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(body, content, delay), media_type="text/event-stream", headers=headers)
+        await asyncio.sleep(delay)
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "llama3-8b-8192"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage(body, content, delay),
+        }, headers=headers)
+
+    def usage(body: dict, content: str, latency: float) -> dict:
+        # Groq reports token counts along with how long the call queued and ran on its side
+        prompt_tokens = sum(len(m["content"]) // 4 for m in body["messages"])
+        completion_tokens = len(content) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "queue_time": round(latency / 20, 6),
+            "prompt_time": round(latency / 20, 6),
+            "completion_time": round(latency * 0.9, 6),
+            "total_time": round(latency * 0.95, 6),
+        }
+
+    async def stream_chunks(body: dict, content: str, latency: float):
+        # Time-to-first-token is the queueing/prompt latency, then tokens trickle out
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        await asyncio.sleep(latency / 10)
+        for index, word in enumerate(content.split(" ")):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "llama3-8b-8192"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": word if index == 0 else " " + word},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(token_delay)
+        # Like Groq, the closing chunk carries the usage under x_groq
+        chunk["choices"] = [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        chunk["x_groq"] = {"id": completion_id, "usage": usage(body, content, latency)}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.get("/calls")
+    async def calls():
+        return {"calls": app.state.calls, "throttled": app.state.throttled, "errors": app.state.errors}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per completion")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="uniform half-width or lognormal sigma")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument("--answer-words", type=int, default=0, help="pad answers to this many words")
+    parser.add_argument("--rpm", type=float, default=0, help="requests per minute before 429s (0: unlimited)")
+    parser.add_argument("--tpm", type=float, default=0, help="tokens per minute before 429s (0: unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failed with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--error-latency", type=float, default=0.0, help="seconds before an injected failure")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls answered with a 429")
+    parser.add_argument("--spike-rate", type=float, default=0.0, help="fraction of calls slowed by --spike-factor")
+    parser.add_argument("--spike-factor", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ssl-certfile", help="serve HTTPS, so clients pay a TLS handshake per connection")
+    parser.add_argument("--ssl-keyfile")
+    args = parser.parse_args()
+    app = create_app(
+        args.latency,
+        args.token_delay,
+        args.rpm,
+        args.tpm,
+        distribution=args.latency_dist,
+        spread=args.latency_spread,
+        answer_words=args.answer_words,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        error_latency=args.error_latency,
+        throttle_rate=args.throttle_rate,
+        spike_rate=args.spike_rate,
+        spike_factor=args.spike_factor,
+        seed=args.seed,
+    )
+    uvicorn.run(
+        app, host=args.host, port=args.port, log_level="warning",
+        ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile,
+    )
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from bisect import bisect_right
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from history_backends import HistoryBackend
+from token_budget import message_tokens, pack_newest_first
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[str]]
+
+
+def unsummarized(messages: List[Dict[str, Any]], summary: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if summary is None:
+        return messages
+    return messages[bisect_right(messages, summary["upto"], key=lambda message: message["id"]):]
+
+
+class HistoryCompactor:
+    """Folds the older part of long sessions into a running summary.
+
+    Compaction runs as a background task per session, off the request path.
+    Scheduling while a session's task is still running is a no-op, because the
+    task re-checks the session before it exits. The task reads the session
+    itself, so scheduling costs the request path nothing. Clearing a session
+    should :meth:`cancel` its task; the backends also refuse a summary whose
+    messages were cleared, for a task running on another worker.
+    """
+
+    def __init__(
+        self,
+        store: HistoryBackend,
+        summarize: Summarizer,
+        trigger_tokens: int,
+        keep_recent_tokens: int,
+        input_budget: int,
+    ):
+        self.store = store
+        self.summarize = summarize
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.input_budget = input_budget
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.runs = 0
+        self.failures = 0
+
+    def due(self, messages: List[Dict[str, Any]], summary: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Messages that are neither summarized yet nor part of the verbatim recent tail
+        pending = unsummarized(messages, summary)
+        recent = pack_newest_first(pending, self.keep_recent_tokens)
+        older = pending[:len(pending) - len(recent)]
+        if sum(message["tokens"] for message in older) < self.trigger_tokens:
+            return []
+        return older
+
+    def schedule(self, session_id: str) -> None:
+        task = self._tasks.get(session_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[session_id] = asyncio.create_task(self._compact(session_id))
+
+    def cancel(self, session_id: str) -> None:
+        # For a cleared session: its summary must not land on whatever is appended next
+        task = self._tasks.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _compact(self, session_id: str) -> None:
+        try:
+            while True:
+                messages, summary = await self.store.load(session_id)
+                older = self.due(messages, summary)
+                if not older:
+                    return
+                previous = summary["content"][len(SUMMARY_PREFIX):] if summary else None
+                # Very long backlogs only contribute their newest part to the summary
+                text = await self.summarize(previous, pack_newest_first(older, self.input_budget))
+                content = SUMMARY_PREFIX + text
+                await self.store.set_summary(
+                    session_id, {"content": content, "upto": older[-1]["id"], "tokens": message_tokens(content)}
+                )
+                self.runs += 1
+        except Exception:
+            self.failures += 1
+            logger.warning("History compaction failed for session %s", session_id, exc_info=True)
+        finally:
+            # A cancelled task may already have been replaced by a newer one
+            if self._tasks.get(session_id) is asyncio.current_task():
+                del self._tasks[session_id]
+
+    async def drain(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": len(self._tasks), "runs": self.runs, "failures": self.failures}
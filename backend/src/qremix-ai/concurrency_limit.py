@@ -0,0 +1,100 @@
+import time
+from typing import Dict, List, Optional
+
+
+class FixedLimit:
+    """A concurrency limit that never changes."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+
+    def on_sample(self, latency: Optional[float], dropped: bool, in_flight: int, kind: str = "call") -> None:
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        return {"limit": self.limit}
+
+
+class AIMDLimit:
+    """Additive-increase / multiplicative-decrease concurrency limit.
+
+    Every completed call reports its latency, tagged with a ``kind`` so each
+    kind is compared against its own no-load baseline. The latency must not
+    depend on how long the answer is, or long answers on a healthy upstream
+    read as overload: callers report the time to the first token, or for a
+    whole completion its latency less the time the upstream spent generating
+    it. While latency stays within ``tolerance`` times the baseline and the
+    limit is actually in use, the limit grows by about one per limit's worth
+    of completions (roughly one per round trip). A drop (timeout, 429, 5xx) or an inflated latency cuts it
+    by ``backoff``, at most once per baseline round trip so a single burst of
+    failures doesn't collapse it to the floor.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        backoff: float = 0.9,
+        tolerance: float = 2.0,
+        baseline_window: float = 10.0,
+        clock=time.monotonic,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self._limit = float(min(max(initial, self.min_limit), max_limit))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self._clock = clock
+        self.baseline_window = baseline_window
+        # Estimated no-load latency per kind: the minimum over the current and previous
+        # window, so a lasting change in upstream speed is accepted within two windows
+        self._minimums: Dict[str, List[float]] = {}
+        self._window_started = clock()
+        self._last_decrease = float("-inf")
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def baseline(self, kind: str) -> Optional[float]:
+        lowest = min(self._minimums.get(kind, ()), default=float("inf"))
+        return lowest if lowest != float("inf") else None
+
+    def _observe(self, kind: str, latency: float) -> None:
+        now = self._clock()
+        if now - self._window_started >= self.baseline_window:
+            self._window_started = now
+            for minimums in self._minimums.values():
+                minimums[:] = [minimums[1], float("inf")]
+        minimums = self._minimums.setdefault(kind, [float("inf"), float("inf")])
+        minimums[1] = min(minimums[1], latency)
+
+    def on_sample(self, latency: Optional[float], dropped: bool, in_flight: int, kind: str = "call") -> None:
+        baseline = self.baseline(kind)
+        if latency is not None and not dropped:
+            self._observe(kind, latency)
+        inflated = latency is not None and baseline is not None and latency > baseline * self.tolerance
+        if dropped or inflated:
+            now = self._clock()
+            if now - self._last_decrease >= (baseline or 0.0):
+                self._limit = max(float(self.min_limit), self._limit * self.backoff)
+                self._last_decrease = now
+                self.decreases += 1
+        elif in_flight * 2 >= self.limit and self._limit < self.max_limit:
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            self.increases += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "baseline_latency_s": {
+                kind: round(self.baseline(kind), 4) for kind in self._minimums if self.baseline(kind) is not None
+            },
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
@@ -0,0 +1,285 @@
+import re
+import threading
+import zlib
+from importlib.util import find_spec
+from typing import Dict, List, Optional, Tuple
+
+# Like the semantic cache, the model is optional and NumPy is only imported when it is
+# trained, so the regex tier works (and the module imports quickly) without it
+np = None
+
+GREETING = "greeting"
+THANKS = "thanks"
+PLEASANTRY = "pleasantry"
+HELP = "help"
+OTHER = "other"
+INTENTS = (GREETING, THANKS, PLEASANTRY, HELP)
+
+ANSWERS = {
+    GREETING: "I am QRemix AI, how may I help you today?",
+    THANKS: "You're welcome! Let me know if there is anything else I can help with.",
+    PLEASANTRY: "Sounds good! Just ask whenever you need help with your code.",
+    HELP: (
+        "I am QRemix AI, a coding assistant for **Solidity**, **Python** and **JavaScript**. I can:\n\n"
+        "- **Write code**, e.g. *write an ERC20 token with a capped supply*\n"
+        "- **Debug code**, e.g. *debug this* followed by the code and the error\n"
+        "- **Explain code or concepts**, e.g. *explain reentrancy attacks*\n"
+        "- **Review and optimize**, e.g. *reduce the gas cost of this function*\n\n"
+        "Paste your code along with the question for the best results."
+    ),
+}
+
+# Anything that looks like code or a real question goes to the model untouched
+CODE_PATTERN = re.compile(r"[`{}();=<>\[\]\n]")
+NORMALIZE_PATTERN = re.compile(r"[^a-z0-9' ]+")
+# An instruction ("ok do it", "sure go ahead") is not small talk however short it is; only a
+# full regex match can contain one of these and still be answered locally ("will do")
+ACTION_PATTERN = re.compile(
+    r"\b(?:do|go|proceed|continue|run|make|add|write|fix|try|show|use|change|update|implement|deploy|"
+    r"apply|start|create|build|generate|remove|delete|refactor|test|explain)\b"
+)
+# Intents that mean "yes" after a question: an "ok" to "Shall I add events?" asks for them
+ACKNOWLEDGEMENTS = frozenset({PLEASANTRY})
+# How the previous answer offers to do more, when it does not simply end with a question
+OFFER_PATTERN = re.compile(
+    r"\b(?:would you like|do you want|want me to|shall i|should i|let me know if you(?:'d| would) like)\b"
+)
+# Only the end of the previous answer is looked at for a question; earlier ones were answered
+OFFER_TAIL_CHARS = 300
+
+_NAME = r"(?: (?:there|all|everyone|guys|friend|buddy|bot|assistant|qremix(?: ai)?))?"
+_HOW_ARE_YOU = r"(?: how (?:are|r) (?:you|u)(?: doing)?(?: today)?)?"
+_ACK = r"(?:ok|okay|great|perfect|awesome|cool|nice|good|brilliant|amazing)"
+INTENT_PATTERNS = {
+    GREETING: (
+        r"(?:hi+|hello+|hey+|heya|hiya|howdy|yo|greetings|sup|what'?s up|good (?:morning|afternoon|evening|day))"
+        + _NAME + _HOW_ARE_YOU + r"|how (?:are|r) (?:you|u)(?: doing)?(?: today)?"
+    ),
+    THANKS: (
+        rf"(?:{_ACK} )?(?:thanks|thank (?:you|u)|thx|thnx|ty|tysm|cheers|many thanks|much appreciated|appreciate it)"
+        r"(?: (?:a lot|so much|very much|a ton|again|man|mate))?"
+        r"(?: for (?:the|your) (?:help|answer|explanation|code))?"
+        r"(?: (?:that|it) (?:worked|works|helped|helps|fixed it))?"
+    ),
+    # One or two of these ("ok got it", "cool cool", "alright bye")
+    PLEASANTRY: r"{0}(?: {0})?".format(
+        rf"(?:{_ACK}|k|kk|alright|all right|got it|understood|sounds good|makes sense|i see|will do|"
+        r"bye|goodbye|good bye|see (?:you|ya)(?: later)?|good night|have a (?:good|nice) (?:day|one)|"
+        r"lol|haha+|nice one|cool thanks bye)"
+    ),
+    HELP: (
+        r"help|help me|i need help|can (?:you|u) help(?: me)?|what can (?:you|u) do|what do (?:you|u) do|"
+        r"who are (?:you|u)|what are (?:you|u)|how does this work|how do i use (?:this|you|qremix(?: ai)?)|"
+        r"what can i ask(?: you)?|what are your (?:features|capabilities)"
+    ),
+}
+
+# Labelled examples the fallback model is fitted on when the classifier is opened. The
+# "other" ones are deliberately close to the intents (short, friendly, or asking for
+# help with something specific) so the model learns those are not small talk
+TRAINING_EXAMPLES: Dict[str, List[str]] = {
+    GREETING: [
+        "hi", "hello", "hey", "heyy", "heyyy there", "helo", "hallo", "hi qremix", "hello friend",
+        "good morning", "morning", "evening", "hey how are you", "hi how's it going", "how's it going",
+        "hello hello", "hey hey", "hiii", "hi again", "hello again", "yo there", "greetings friend",
+        "hey bot", "hola",
+    ],
+    THANKS: [
+        "thanks", "thank you", "thank u", "thx", "thanks a lot", "thank you so much", "thanks man",
+        "thanks that worked", "thanks it works now", "thanks a bunch", "thank you very much",
+        "great thanks", "perfect thank you", "awesome thx", "ty", "thankss", "tnx", "thanku",
+        "thanks for helping", "that helped thanks", "thnks", "thank youu", "thanks you", "many thanks",
+    ],
+    PLEASANTRY: [
+        "ok", "okay", "okk", "cool", "nice", "great", "awesome", "got it", "alright", "sounds good",
+        "bye", "goodbye", "see you", "cya", "later", "good night", "lol", "haha", "okay cool",
+        "ok got it", "nice one", "great job", "nice work", "well done", "perfect", "understood", "ok bye",
+        "makes sense", "fine",
+    ],
+    HELP: [
+        "help", "help me", "help please", "i need help", "can you help", "what can you do",
+        "who are you", "what are you", "what do you do", "how does this work", "how do i use this",
+        "what can i ask", "what are your features", "how can you help me", "what is qremix",
+        "what is qremix ai", "how to use", "who r u", "who are u", "commands", "usage",
+        "what can you help with",
+    ],
+    OTHER: [
+        "write an erc20 token", "explain reentrancy", "debug this", "fix this error", "what is a mapping",
+        "hello world in python", "write hello world in solidity", "how are mappings stored",
+        "help me debug my contract", "help with erc721", "thanks but it still fails", "ok now add events",
+        "ok make it upgradeable", "hi can you write a function", "why does this revert", "what is gas",
+        "explain modifiers", "optimize this loop", "convert this to javascript", "what is msg sender",
+        "how do i deploy", "how do i use openzeppelin", "what are events in solidity", "add a constructor",
+        "make it ownable", "now write tests", "what does payable mean", "is this safe", "audit this",
+        "how to use mappings", "how to use structs", "what is a proxy contract", "compile error",
+        "it still does not work", "that is wrong", "try again", "continue", "more details",
+        "explain the code", "show me an example", "what is delegatecall", "use solidity 0.8",
+        "good way to store balances", "great now add a mint function", "nice can you add comments",
+        "cool now make it pausable", "great explain the second function", "what version of solidity",
+        "ok do it", "ok do that", "yes do it", "sure go ahead", "go ahead", "ok proceed", "yes please",
+        "ok please do", "alright do it", "ok continue", "ok run it", "ok try that", "ok fix it", "do it",
+        "yes", "yep", "sure", "ok go", "okay go for it", "ok lets do it",
+    ],
+}
+
+
+def normalize(text: str) -> str:
+    # Case, punctuation, emoji and repeated spaces do not change the intent
+    return " ".join(NORMALIZE_PATTERN.sub(" ", text.lower()).split())
+
+
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode())
+
+
+def features(text: str) -> Dict[int, int]:
+    # Hashed words, pairs of consecutive words and character trigrams of a normalized
+    # prompt. Unlike the semantic cache no word is dropped: in "ok do it" the short
+    # words are what make it an instruction
+    words = text.split()
+    counts: Dict[int, int] = {}
+    tokens = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        tokens.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    for token in tokens:
+        feature = _hash(token)
+        counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+def asks_for_reply(message: Optional[str]) -> bool:
+    # Whether an answer ends by asking the user something, so a short reply answers it
+    if not message:
+        return False
+    tail = message.rstrip()[-OFFER_TAIL_CHARS:]
+    return tail.endswith("?") or OFFER_PATTERN.search(tail.lower()) is not None
+
+
+class IntentClassifier:
+    """Recognises small talk that can be answered without calling the model.
+
+    Only short prompts without code are considered. They are normalized and
+    matched against one compiled regex with an alternative per intent; a full
+    match is certain. Prompts it misses go to a small multinomial logistic
+    regression over hashed word, word-pair and character-trigram features,
+    fitted on :data:`TRAINING_EXAMPLES` by :meth:`open`. Its answer is used
+    only when its probability reaches ``threshold``, it is not "other" and
+    the prompt holds no instruction ("ok do it"); everything else goes to the
+    LLM. An acknowledgement is also passed on when ``previous``, the last
+    answer, asked a question, since "ok" then means "yes, do that". Until
+    :meth:`open` has run, or without NumPy, only the regex is used.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_words: int = 8, max_chars: int = 80,
+                 use_model: bool = True, dims: int = 512):
+        self.threshold = threshold
+        self.max_words = max_words
+        self.max_chars = max_chars
+        self.use_model = use_model and find_spec("numpy") is not None
+        self.dims = dims
+        self._pattern = re.compile(
+            "|".join(f"(?P<{intent}>{pattern})" for intent, pattern in INTENT_PATTERNS.items())
+        )
+        self._labels: Tuple[str, ...] = INTENTS + (OTHER,)
+        self._weights = None
+        self._bias = None
+        self._open_lock = threading.Lock()
+        self.hits: Dict[str, int] = dict.fromkeys(INTENTS, 0)
+        self.model_hits = 0
+        self.misses = 0
+
+    def open(self) -> None:
+        global np
+        with self._open_lock:
+            if self._weights is not None or not self.use_model:
+                return
+            import numpy as np
+            texts, targets = [], []
+            for label, examples in TRAINING_EXAMPLES.items():
+                texts.extend(normalize(example) for example in examples)
+                targets.extend([self._labels.index(label)] * len(examples))
+            features = np.stack([self._vectorize(text) for text in texts])
+            self._weights, self._bias = self._fit(features, np.asarray(targets))
+
+    def _vectorize(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for feature, count in features(text).items():
+            vector[feature % self.dims] += count
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _fit(self, features: "np.ndarray", targets: "np.ndarray", steps: int = 1000,
+             learning_rate: float = 8.0, l2: float = 1e-4) -> Tuple["np.ndarray", "np.ndarray"]:
+        # Full-batch gradient descent on the cross-entropy; with a few hundred examples
+        # this takes tens of milliseconds, which is why it runs in open() and not per request
+        classes = len(self._labels)
+        onehot = np.eye(classes, dtype=np.float32)[targets]
+        weights = np.zeros((features.shape[1], classes), dtype=np.float32)
+        bias = np.zeros(classes, dtype=np.float32)
+        for _ in range(steps):
+            probabilities = self._softmax(features @ weights + bias)
+            error = (probabilities - onehot) / len(features)
+            weights -= learning_rate * (features.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return weights, bias
+
+    @staticmethod
+    def _softmax(logits: "np.ndarray") -> "np.ndarray":
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def classify(self, prompt: str, previous: Optional[str] = None) -> Tuple[Optional[str], float]:
+        # The intent and how sure the classifier is, or (None, confidence) for the LLM
+        intent, confidence = self._classify(prompt)
+        if intent in ACKNOWLEDGEMENTS and asks_for_reply(previous):
+            return None, confidence
+        return intent, confidence
+
+    def _classify(self, prompt: str) -> Tuple[Optional[str], float]:
+        if len(prompt) > self.max_chars or CODE_PATTERN.search(prompt):
+            return None, 0.0
+        text = normalize(prompt)
+        if not text or text.count(" ") >= self.max_words:
+            return None, 0.0
+        match = self._pattern.fullmatch(text)
+        if match:
+            return match.lastgroup, 1.0
+        if self._weights is None:
+            return None, 0.0
+        probabilities = self._softmax(self._vectorize(text) @ self._weights + self._bias)
+        best = int(np.argmax(probabilities))
+        confidence = float(probabilities[best])
+        intent = self._labels[best]
+        if intent == OTHER or confidence < self.threshold:
+            return None, confidence
+        # Asking for help takes a verb ("how to use"); small talk with one is an instruction
+        if intent != HELP and ACTION_PATTERN.search(text):
+            return None, confidence
+        return intent, confidence
+
+    def answer(self, prompt: str, previous: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        # The intent and its canned answer, or (None, None) when the LLM should answer
+        return self.record(*self.classify(prompt, previous))
+
+    def record(self, intent: Optional[str], confidence: float) -> Tuple[Optional[str], Optional[str]]:
+        # Counts a classify() result and returns answer() for it
+        if intent is None:
+            self.misses += 1
+            return None, None
+        self.hits[intent] += 1
+        if confidence < 1.0:
+            self.model_hits += 1
+        return intent, ANSWERS[intent]
+
+    def stats(self) -> Dict[str, float]:
+        hits = sum(self.hits.values())
+        checked = hits + self.misses
+        return {
+            "model": self._weights is not None,
+            "threshold": self.threshold,
+            "hits": dict(self.hits),
+            "model_hits": self.model_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / checked, 4) if checked else 0.0,
+        }
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class HedgePolicy:
+    """Sends a backup call when the primary is slower than most recent calls.
+
+    The primary starts at once. If it is still running after the
+    ``percentile`` latency of the last ``window`` primaries, a hedge starts
+    too; the first to succeed wins and the other is cancelled. A failed call
+    only loses when the other one can still answer.
+
+    Hedges are paid for from a token bucket that earns ``budget`` tokens per
+    call (at most ``burst``), so they add at most that fraction of extra load
+    however slow upstream gets. ``can_hedge`` is asked before each hedge, so a
+    caller can also skip hedges when there is no spare capacity for them.
+    Primaries cancelled because their hedge won are recorded with the time
+    they had run so far, a lower bound that keeps the slow tail in the window.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        budget: float = 0.05,
+        burst: float = 5.0,
+        window: int = 1000,
+        min_samples: int = 50,
+        clock=time.monotonic,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self._clock = clock
+        self._latencies: Deque[float] = deque(maxlen=window)
+        # The percentile is recomputed after every 5% of the window, not on every call
+        self._refresh_every = max(1, window // 20)
+        self._since_refresh = 0
+        self._delay: Optional[float] = None
+        self._tokens = 0.0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+        self.no_capacity = 0
+
+    def delay(self) -> Optional[float]:
+        # Seconds to wait for the primary before hedging; None until there are enough samples
+        return self._delay
+
+    def observe(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._since_refresh += 1
+        if self._since_refresh >= self._refresh_every and len(self._latencies) >= self.min_samples:
+            self._since_refresh = 0
+            ordered = sorted(self._latencies)
+            self._delay = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    async def run(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        hedge: Callable[[], Awaitable[T]],
+        can_hedge: Callable[[], bool] = lambda: True,
+    ) -> Tuple[T, Optional[str]]:
+        # Returns the result and which call produced it: None when no hedge was sent,
+        # otherwise "primary" or "hedge"
+        self.calls += 1
+        self._tokens = min(self.burst, self._tokens + self.budget)
+        started = self._clock()
+        first = asyncio.ensure_future(primary())
+        first.add_done_callback(lambda task: self._primary_done(task, started))
+        second = None
+        try:
+            delay = self._delay
+            if delay is None:
+                return await first, None
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result(), None
+            if self._tokens < 1:
+                self.over_budget += 1
+                return await first, None
+            if not can_hedge():
+                self.no_capacity += 1
+                return await first, None
+            self._tokens -= 1
+            self.hedged += 1
+            second = asyncio.ensure_future(hedge())
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                            return task.result(), "hedge"
+                        return task.result(), "primary"
+            # Both failed; the primary's error is the one callers expect
+            return first.result(), None
+        finally:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+                    task.add_done_callback(_retrieve)
+
+    def _primary_done(self, task: asyncio.Future, started: float) -> None:
+        # Failures are left out: a fast error says nothing about how long an answer takes
+        if task.cancelled() or task.exception() is None:
+            self.observe(self._clock() - started)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "delay_s": round(self._delay, 4) if self._delay is not None else None,
+            "percentile": self.percentile,
+            "budget": self.budget,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "over_budget": self.over_budget,
+            "no_capacity": self.no_capacity,
+            "extra_load": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+def _retrieve(task: asyncio.Future) -> None:
+    # A cancelled loser may still fail while it unwinds; nobody is waiting for it
+    if not task.cancelled():
+        task.exception()
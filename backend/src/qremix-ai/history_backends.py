@@ -0,0 +1,483 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from history_log import HistoryLog, ReplayClock, trailing_fields
+from history_store import SessionHistoryStore
+from redis_protocol import RedisClient
+
+Message = Dict[str, Any]
+
+
+class HistoryBackend:
+    """Where chat history lives, as seen by the request path.
+
+    Every method is one round trip to the backing store: ``load`` returns a
+    session's messages together with its summary, and ``append`` stores a
+    whole turn at once and returns the messages with their ids. Ids only ever
+    increase within a session, which is what history cursors rely on.
+    """
+
+    name = "abstract"
+
+    def lock(self) -> None:
+        # Claims whatever only one process may use; called before startup completes so a
+        # second worker fails at once instead of in the background
+        pass
+
+    async def open(self) -> None:
+        # Slow setup that should not hold up importing the server; runs during startup
+        pass
+
+    async def load(self, session_id: str) -> Tuple[List[Message], Optional[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    async def append(self, session_id: str, messages: List[Message]) -> List[Message]:
+        raise NotImplementedError
+
+    async def set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def clear(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryHistory(HistoryBackend):
+    """Process-local history; only correct with a single worker.
+
+    With a :class:`HistoryLog` every mutation is also logged, and the call
+    returns once its log record is on disk, so history survives restarts.
+    The log is replayed by :meth:`open`, or by whichever call comes first.
+    """
+
+    name = "memory"
+
+    def __init__(self, store: SessionHistoryStore, log: Optional[HistoryLog] = None):
+        self.store = store
+        self.log = log
+        self._recovered = log is None or log.recovered
+        self._recovery: Optional[asyncio.Future] = None
+
+    def lock(self) -> None:
+        if self.log is not None:
+            self.log.lock()
+
+    async def open(self) -> None:
+        # Replaying a large log takes a while, so it runs on a worker thread; nothing
+        # touches the store until it is done since every call waits for it first
+        if self._recovered:
+            return
+        if self._recovery is None:
+            self.lock()
+            self._recovery = asyncio.get_running_loop().run_in_executor(None, self.log.recover)
+        await asyncio.shield(self._recovery)
+        self._recovered = True
+
+    async def load(self, session_id: str) -> Tuple[List[Message], Optional[Dict[str, Any]]]:
+        if not self._recovered:
+            await self.open()
+        return list(self.store.get(session_id)), self.store.summary(session_id)
+
+    async def append(self, session_id: str, messages: List[Message]) -> List[Message]:
+        if not self._recovered:
+            await self.open()
+        stored = [self.store.append(session_id, message) for message in messages]
+        if self.log is not None:
+            await self.log.append(session_id, stored)
+        return stored
+
+    async def set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        if not self._recovered:
+            await self.open()
+        self.store.set_summary(session_id, summary)
+        if self.log is not None:
+            await self.log.set_summary(session_id, summary)
+
+    async def clear(self, session_id: str) -> None:
+        if not self._recovered:
+            await self.open()
+        self.store.clear(session_id)
+        if self.log is not None:
+            await self.log.clear(session_id)
+
+    async def stats(self) -> Dict[str, Any]:
+        if not self._recovered:
+            await self.open()
+        stats = {"backend": self.name, **self.store.stats()}
+        if self.log is not None:
+            stats["log"] = self.log.stats()
+        return stats
+
+    async def close(self) -> None:
+        # A log that was never replayed has no segment open, but may hold the lock
+        if self.log is not None and self.log.recovered:
+            await self.log.close()
+        elif self.log is not None:
+            self.log.unlock()
+
+
+class SQLiteHistory(HistoryBackend):
+    """History in a SQLite database in WAL mode, shared by all workers on a host.
+
+    Queries run on one dedicated thread so the event loop never blocks on the
+    file lock. Appends that arrive while a write is in progress are queued
+    and committed together in the next transaction (group commit), so a burst
+    of turns costs one commit rather than one each. Ids come from an
+    AUTOINCREMENT key and are never reused, even across a clear. The
+    database is opened, and its schema created or migrated, by :meth:`open`
+    or by whichever call comes first, not when the backend is constructed.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            segments TEXT,
+            refs TEXT
+        );
+        CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            last_seen REAL NOT NULL,
+            summary TEXT
+        );
+    """
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str, idle_ttl: float, max_messages: int, clock=time.time):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-sqlite")
+        self._db: Optional[sqlite3.Connection] = None
+        self._opening: Optional[asyncio.Future] = None
+        self._pending: List[Tuple[str, List[Message], asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.commits = 0
+        self.appends = 0
+
+    async def open(self) -> None:
+        # Connecting waits on the file lock while other workers migrate, so it runs on the
+        # query thread, once, however many calls are waiting for it
+        if self._db is not None:
+            return
+        if self._opening is None:
+            self._opening = asyncio.get_running_loop().run_in_executor(self._executor, self._connect)
+        opening = self._opening
+        try:
+            await asyncio.shield(opening)
+        except Exception:
+            # The next call tries again, e.g. once the directory exists or the lock is free
+            if self._opening is opening and opening.done():
+                self._opening = None
+            raise
+
+    def _connect(self) -> None:
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            # WAL with synchronous=NORMAL only syncs at checkpoints; a crash loses at most
+            # the last few turns, never corrupts the database
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA)
+            self._migrate(db)
+        except BaseException:
+            db.close()
+            raise
+        self._db = db
+
+    @staticmethod
+    def _migrate(db: sqlite3.Connection) -> None:
+        # Databases created before segments or references were stored get the columns; in a
+        # transaction since every worker runs this against the same file at startup
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in db.execute("PRAGMA table_info(messages)")}
+            for column in ("segments", "refs"):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE messages ADD COLUMN {column} TEXT")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    async def _run(self, function, *args):
+        if self._db is None:
+            await self.open()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _read(self, session_id: str) -> Tuple[List[Message], Optional[Dict[str, Any]]]:
+        row = self._db.execute(
+            "SELECT last_seen, summary FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or row[0] < self._clock() - self.idle_ttl:
+            return [], None
+        messages = []
+        for id_, role, content, tokens, segments, references in self._db.execute(
+            "SELECT id, role, content, tokens, segments, refs FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,),
+        ):
+            message = {"id": id_, "role": role, "content": content, "tokens": tokens}
+            if segments is not None:
+                message["segments"] = json.loads(segments)
+            if references is not None:
+                message["references"] = json.loads(references)
+            messages.append(message)
+        return messages, json.loads(row[1]) if row[1] else None
+
+    async def load(self, session_id: str) -> Tuple[List[Message], Optional[Dict[str, Any]]]:
+        return await self._run(self._read, session_id)
+
+    async def append(self, session_id: str, messages: List[Message]) -> List[Message]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((session_id, messages, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await self._run(self._write, batch)
+            except Exception as error:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for _, messages, future in batch:
+                if not future.done():
+                    future.set_result(messages)
+
+    def _write(self, batch: List[Tuple[str, List[Message], asyncio.Future]]) -> None:
+        now = self._clock()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for session_id, messages, _ in batch:
+                # A session that went idle starts over, like an expired in-memory session
+                self._db.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND EXISTS ("
+                    "SELECT 1 FROM sessions WHERE session_id = ? AND last_seen < ?)",
+                    (session_id, session_id, now - self.idle_ttl),
+                )
+                self._db.execute(
+                    "INSERT INTO sessions (session_id, last_seen) VALUES (?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET last_seen = excluded.last_seen, "
+                    "summary = CASE WHEN sessions.last_seen < ? THEN NULL ELSE sessions.summary END",
+                    (session_id, now, now - self.idle_ttl),
+                )
+                for message in messages:
+                    segments = message.get("segments")
+                    references = message.get("references")
+                    cursor = self._db.execute(
+                        "INSERT INTO messages (session_id, role, content, tokens, segments, refs) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            session_id, message["role"], message["content"], message["tokens"],
+                            json.dumps(segments) if segments is not None else None,
+                            json.dumps(references) if references else None,
+                        ),
+                    )
+                    message["id"] = cursor.lastrowid
+                self._db.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND id <= COALESCE(("
+                    "SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?), 0)",
+                    (session_id, session_id, self.max_messages),
+                )
+                self.appends += 1
+            if now - self._last_purge >= self.PURGE_INTERVAL:
+                self._purge(now)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self.commits += 1
+
+    def _purge(self, now: float) -> None:
+        cutoff = now - self.idle_ttl
+        self._db.execute(
+            "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE last_seen < ?)",
+            (cutoff,),
+        )
+        self._db.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,))
+        self._last_purge = now
+
+    async def set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        # Only onto the conversation that was summarized: after a clear the session's messages
+        # all have ids past the summary's last one
+        await self._run(self._set_summary, session_id, summary)
+
+    def _set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        self._db.execute(
+            "UPDATE sessions SET summary = ? WHERE session_id = ? AND EXISTS "
+            "(SELECT 1 FROM messages WHERE session_id = ? AND id <= ?)",
+            (json.dumps(summary), session_id, session_id, summary["upto"]),
+        )
+
+    def _clear(self, session_id: str) -> None:
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def clear(self, session_id: str) -> None:
+        await self._run(self._clear, session_id)
+
+    def _count(self) -> Tuple[int, int]:
+        sessions = self._db.execute(
+            "SELECT COUNT(*) FROM sessions WHERE last_seen >= ?", (self._clock() - self.idle_ttl,)
+        ).fetchone()[0]
+        return sessions, self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    async def stats(self) -> Dict[str, Any]:
+        sessions, messages = await self._run(self._count)
+        return {
+            "backend": self.name,
+            "sessions": sessions,
+            "messages": messages,
+            "appends": self.appends,
+            "commits": self.commits,
+        }
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            await self._flusher
+        if self._opening is not None:
+            # A database that failed to open has nothing to close
+            await asyncio.gather(self._opening, return_exceptions=True)
+        if self._db is not None:
+            await self._run(self._db.close)
+        self._executor.shutdown()
+
+
+class RedisHistory(HistoryBackend):
+    """History in Redis (or anything speaking its protocol), shared across hosts.
+
+    A session is a list of JSON-encoded messages, a counter of messages ever
+    appended, and a summary, all expiring after ``idle_ttl`` of inactivity.
+    Ids are positions derived from the counter: the list holds the newest
+    messages, so the last one has id ``count``. Reads and appends are single
+    MULTI/EXEC transactions, which keeps ids consistent when several workers
+    append to the same session.
+
+    A clear also records the counter at that point. A summary written later
+    by a compaction that was already running (on any worker) can only cover
+    ids up to it, so :meth:`load` ignores it rather than attach the old
+    conversation to the new one.
+    """
+
+    name = "redis"
+
+    def __init__(self, client: RedisClient, idle_ttl: float, max_messages: int, prefix: str = "qremix:history:"):
+        self.client = client
+        self.idle_ttl = int(idle_ttl)
+        self.max_messages = max_messages
+        self.prefix = prefix
+
+    def _keys(self, session_id: str) -> Tuple[str, str, str, str]:
+        base = f"{self.prefix}{session_id}"
+        return f"{base}:messages", f"{base}:count", f"{base}:summary", f"{base}:cleared"
+
+    def _touch(self, *keys: str) -> List[Tuple[Any, ...]]:
+        return [("EXPIRE", key, self.idle_ttl) for key in keys]
+
+    async def load(self, session_id: str) -> Tuple[List[Message], Optional[Dict[str, Any]]]:
+        messages_key, count_key, summary_key, cleared_key = self._keys(session_id)
+        count, rows, summary, cleared, *_ = await self.client.transaction([
+            ("GET", count_key),
+            ("LRANGE", messages_key, 0, -1),
+            ("GET", summary_key),
+            ("GET", cleared_key),
+            *self._touch(messages_key, count_key, summary_key, cleared_key),
+        ])
+        first = int(count or 0) - len(rows) + 1
+        messages = []
+        for offset, row in enumerate(rows):
+            # Segments and references are trailing fields, absent from rows stored before
+            # they existed
+            role, content, tokens, *rest = json.loads(row)
+            message = {"id": first + offset, "role": role, "content": content, "tokens": tokens}
+            if rest and rest[0] is not None:
+                message["segments"] = rest[0]
+            if len(rest) > 1:
+                message["references"] = rest[1]
+            messages.append(message)
+        summary = json.loads(summary) if summary else None
+        if summary is not None and summary["upto"] <= int(cleared or 0):
+            summary = None
+        return messages, summary
+
+    async def append(self, session_id: str, messages: List[Message]) -> List[Message]:
+        messages_key, count_key, summary_key, cleared_key = self._keys(session_id)
+        rows = [json.dumps([message["role"], message["content"], message["tokens"]] + trailing_fields(message))
+                for message in messages]
+        _, count, *_ = await self.client.transaction([
+            ("RPUSH", messages_key, *rows),
+            ("INCRBY", count_key, len(rows)),
+            ("LTRIM", messages_key, -self.max_messages, -1),
+            *self._touch(messages_key, count_key, summary_key, cleared_key),
+        ])
+        for offset, message in enumerate(messages):
+            message["id"] = count - len(messages) + 1 + offset
+        return messages
+
+    async def set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        _, _, summary_key, _ = self._keys(session_id)
+        await self.client.execute("SET", summary_key, json.dumps(summary), "EX", self.idle_ttl)
+
+    async def clear(self, session_id: str) -> None:
+        # The counter stays so ids keep increasing after a clear, and every id up to it
+        # belongs to the conversation cleared
+        messages_key, count_key, summary_key, cleared_key = self._keys(session_id)
+        count, _ = await self.client.transaction([("GET", count_key), ("DEL", messages_key, summary_key)])
+        await self.client.execute("SET", cleared_key, int(count or 0), "EX", self.idle_ttl)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "round_trips": self.client.round_trips}
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def open_history_backend(
+    url: str,
+    max_bytes: int,
+    idle_ttl: float,
+    max_messages: int,
+    log_dir: Optional[str] = None,
+    log_fsync: bool = True,
+) -> HistoryBackend:
+    # memory://, sqlite:///relative.db, sqlite:////absolute.db or redis://host:port/db
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        if not log_dir:
+            return MemoryHistory(SessionHistoryStore(max_bytes=max_bytes, idle_ttl=idle_ttl, max_messages=max_messages))
+        clock = ReplayClock()
+        store = SessionHistoryStore(max_bytes=max_bytes, idle_ttl=idle_ttl, max_messages=max_messages, clock=clock)
+        return MemoryHistory(store, HistoryLog(log_dir, store, clock, fsync=log_fsync))
+    if scheme == "sqlite":
+        return SQLiteHistory(url[len("sqlite:///"):], idle_ttl=idle_ttl, max_messages=max_messages)
+    if scheme == "redis":
+        return RedisHistory(RedisClient.from_url(url), idle_ttl=idle_ttl, max_messages=max_messages)
+    raise ValueError(f"Unsupported HISTORY_BACKEND {url!r}")
@@ -0,0 +1,417 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from history_store import SessionHistoryStore
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+# Every record is a little-endian length and CRC-32 followed by that many bytes of JSON
+HEADER = struct.Struct("<II")
+SEGMENT_PREFIX = "wal-"
+SNAPSHOT_PREFIX = "snapshot-"
+SUFFIX = ".log"
+LOCK_NAME = "lock"
+
+Operation = List[Any]
+
+
+def trailing_fields(message: Dict[str, Any]) -> List[Any]:
+    # Segments (assistant messages) and references (user messages) go after a row's fixed
+    # fields, so rows written before they existed still load
+    if message.get("references"):
+        return [message.get("segments"), message["references"]]
+    return [message["segments"]] if message.get("segments") is not None else []
+
+
+def message_row(message: Dict[str, Any]) -> List[Any]:
+    return [message["id"], message["role"], message["content"], message["tokens"]] + trailing_fields(message)
+
+
+def row_message(row: List[Any]) -> Dict[str, Any]:
+    id_, role, content, tokens, *rest = row
+    message = {"id": id_, "role": role, "content": content, "tokens": tokens}
+    if rest and rest[0] is not None:
+        message["segments"] = rest[0]
+    if len(rest) > 1:
+        message["references"] = rest[1]
+    return message
+
+
+def encode_record(payload: Any) -> bytes:
+    data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+    return HEADER.pack(len(data), zlib.crc32(data)) + data
+
+
+def read_records(path: str) -> Tuple[List[Any], int]:
+    """Decoded records of a log file and the offset where the valid part ends.
+
+    The file is mapped rather than read so a large log is not copied into
+    memory twice. Decoding stops at the first truncated or corrupt record,
+    which is what a crash in the middle of a write leaves behind.
+    """
+    records = []
+    size = os.path.getsize(path)
+    if size == 0:
+        return records, 0
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        offset = 0
+        while offset + HEADER.size <= size:
+            length, checksum = HEADER.unpack_from(view, offset)
+            start = offset + HEADER.size
+            data = view[start:start + length]
+            if len(data) < length or zlib.crc32(data) != checksum:
+                break
+            records.append(json.loads(data))
+            offset = start + length
+    return records, offset
+
+
+class ReplayClock:
+    """Monotonic clock that can be wound back while replaying old records.
+
+    The store measures idleness with this clock, so replaying each record at
+    the time it was written makes sessions that went idle before a restart
+    expire as if the process had never stopped.
+    """
+
+    def __init__(self):
+        self.lag = 0.0
+
+    def __call__(self) -> float:
+        return time.monotonic() - self.lag
+
+    def at(self, wall_time: float) -> None:
+        self.lag = max(0.0, time.time() - wall_time)
+
+
+class HistoryLogInUse(Exception):
+    """Another process holds the history log directory; only one may write to it."""
+
+
+class HistoryLog:
+    """Append-only, checksummed log of history mutations with snapshots.
+
+    Mutations (append, clear, summary) are applied to the store first and
+    queued here in the same step; a flusher writes everything queued as one
+    record and fsyncs it on a dedicated thread (group commit), then wakes the
+    callers waiting for durability. Once the log written since the last
+    snapshot reaches ``snapshot_bytes`` or ``snapshot_operations`` (whichever
+    comes first; replay time follows the operation count more than the
+    size), the store is snapshotted and a new segment started, so recovery
+    reads the latest snapshot plus a bounded tail of log. A failed write is
+    cut off the segment, or the log moves on to a new one, and the next
+    batch snapshots the store, since it holds operations the log does not.
+    """
+
+    def __init__(self, directory: str, store: SessionHistoryStore, clock: ReplayClock,
+                 fsync: bool = True, snapshot_bytes: int = 8 * 1024 * 1024, snapshot_operations: int = 20_000):
+        self.directory = directory
+        self.store = store
+        self.clock = clock
+        self.fsync = fsync
+        self.snapshot_bytes = snapshot_bytes
+        self.snapshot_operations = snapshot_operations
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-log")
+        # Snapshots get their own thread so writing one never holds up a group commit
+        self._snapshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-snapshot")
+        self._pending: List[Operation] = []
+        self._waiters: List[asyncio.Future] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._snapshotting: Optional[asyncio.Future] = None
+        self._segment = None
+        self._segment_size = 0
+        self._lock_file = None
+        # Log written since the last snapshot, replayed segments included: what a restart replays
+        self._tail_bytes = 0
+        self._tail_operations = 0
+        # Set when a failed write left the store ahead of the log
+        self._unlogged = False
+        self.sequence = 0
+        self.records = 0
+        self.operations = 0
+        self.snapshots = 0
+        self.recovered = False
+        self.recovered_operations = 0
+        self.recovery_seconds = 0.0
+
+    def _path(self, prefix: str, sequence: int) -> str:
+        return os.path.join(self.directory, f"{prefix}{sequence:08d}{SUFFIX}")
+
+    def _listing(self, prefix: str) -> List[int]:
+        return sorted(
+            int(name[len(prefix):-len(SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(SUFFIX)
+        )
+
+    def lock(self) -> None:
+        """Take the directory for this process, or raise :class:`HistoryLogInUse`.
+
+        Two processes writing the same segments would corrupt each other's
+        records, which is what ``uvicorn --workers N`` does with one
+        ``HISTORY_LOG_DIR``. The OS drops the lock when the process exits.
+        """
+        if self._lock_file is not None:
+            return
+        lock_file = open(os.path.join(self.directory, LOCK_NAME), "a+b")
+        try:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise HistoryLogInUse(
+                f"History log {self.directory} is in use by another process. The memory history "
+                "backend serves a single worker; to run several, point HISTORY_BACKEND at "
+                "sqlite:///path/to/history.db or redis://host:6379/0"
+            ) from None
+        self._lock_file = lock_file
+
+    def unlock(self) -> None:
+        if self._lock_file is not None:
+            # Closing the file releases the lock (flock and msvcrt alike)
+            self._lock_file.close()
+            self._lock_file = None
+
+    # Recovery
+
+    def recover(self) -> None:
+        """Rebuild the store from the newest snapshot and the log written since.
+
+        Runs once at startup, before the event loop serves requests.
+        """
+        self.lock()
+        started = time.perf_counter()
+        snapshot = 0
+        for sequence in reversed(self._listing(SNAPSHOT_PREFIX)):
+            if self._load_snapshot(sequence):
+                snapshot = sequence
+                break
+        segments = [sequence for sequence in self._listing(SEGMENT_PREFIX) if sequence >= snapshot]
+        for sequence in segments:
+            path = self._path(SEGMENT_PREFIX, sequence)
+            records, valid = read_records(path)
+            for record in records:
+                self._replay(record)
+            self._tail_bytes += valid
+            if valid < os.path.getsize(path):
+                logger.warning("Dropping a torn record at the end of %s", path)
+                with open(path, "r+b") as file:
+                    file.truncate(valid)
+        self.clock.lag = 0.0
+        # Never append to a segment that may have been cut short; start a fresh one
+        self.sequence = max(segments + [snapshot]) + 1
+        self._open_segment()
+        self._tail_operations = self.recovered_operations
+        self.recovery_seconds = time.perf_counter() - started
+        self.recovered = True
+
+    def _load_snapshot(self, sequence: int) -> bool:
+        records, _ = read_records(self._path(SNAPSHOT_PREFIX, sequence))
+        # A snapshot counts only if its closing record made it to disk
+        if not records or records[-1] != ["end"]:
+            return False
+        header = records[0]
+        for session_id, last_seen, messages, summary in records[1:-1]:
+            self.clock.at(last_seen)
+            self.store.restore(session_id, [row_message(row) for row in messages], summary)
+        self.store.next_id = max(self.store.next_id, header["next_id"])
+        return True
+
+    def _replay(self, record: List[Any]) -> None:
+        wall_time, operations = record
+        self.clock.at(wall_time)
+        for operation in operations:
+            kind, session_id = operation[0], operation[1]
+            if kind == "a":
+                for row in operation[2]:
+                    self.store.append(session_id, row_message(row))
+            elif kind == "s":
+                self.store.set_summary(session_id, operation[2])
+            elif kind == "c":
+                self.store.clear(session_id)
+            self.recovered_operations += 1
+
+    # Writing
+
+    def _open_segment(self) -> None:
+        self._segment = open(self._path(SEGMENT_PREFIX, self.sequence), "ab", buffering=0)
+        self._segment_size = self._segment.tell()
+
+    def _roll(self) -> None:
+        self._segment.close()
+        self.sequence += 1
+        self._open_segment()
+
+    async def write(self, operation: Operation) -> None:
+        # The caller has already applied the operation to the store
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(operation)
+        self._waiters.append(future)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+        await asyncio.shield(future)
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        await self.write(["a", session_id, [message_row(message) for message in messages]])
+
+    async def set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        await self.write(["s", session_id, summary])
+
+    async def clear(self, session_id: str) -> None:
+        await self.write(["c", session_id])
+
+    async def _flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            operations, self._pending = self._pending, []
+            waiters, self._waiters = self._waiters, []
+            # Everything applied to the store so far is in this batch, so the store is
+            # exactly the state at the end of the current segment once it is written
+            snapshot = self._capture() if self._due_for_snapshot() else None
+            try:
+                await loop.run_in_executor(self._executor, self._write_batch, [time.time(), operations])
+            except Exception as error:
+                logger.exception("Writing the history log failed")
+                # The store already holds these operations; a snapshot is the only way back
+                # into the log for them
+                self._unlogged = True
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(error)
+                continue
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            if snapshot is not None:
+                self._start_snapshot(snapshot)
+
+    def _write_batch(self, record: List[Any]) -> None:
+        data = encode_record(record)
+        try:
+            written = self._segment.write(data)
+            if written != len(data):
+                raise OSError(f"wrote {written} of {len(data)} bytes")
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+        except Exception:
+            self._discard_tail()
+            raise
+        self._segment_size += len(data)
+        self._tail_bytes += len(data)
+        self._tail_operations += len(record[1])
+        self.records += 1
+        self.operations += len(record[1])
+
+    def _discard_tail(self) -> None:
+        # Recovery stops reading a segment at the first bad record, so nothing may be written
+        # after part of one: cut it off, or leave the segment behind if even that fails
+        try:
+            self._segment.truncate(self._segment_size)
+        except Exception:
+            logger.exception("Truncating %s failed; starting a new segment", self._segment.name)
+            self._roll()
+
+    # Snapshots
+
+    def _due_for_snapshot(self) -> bool:
+        if self._snapshotting is not None:
+            return False
+        return (
+            self._unlogged
+            or self._tail_bytes >= self.snapshot_bytes
+            or self._tail_operations >= self.snapshot_operations
+        )
+
+    def _capture(self) -> List[Any]:
+        # Messages are never modified once stored, so copying the lists is enough
+        self._unlogged = False
+        now_wall, now = time.time(), self.clock()
+        sessions = [
+            [session_id, now_wall - (now - last_seen), list(messages), summary]
+            for session_id, messages, summary, last_seen in self.store.sessions()
+        ]
+        return [{"next_id": self.store.next_id}, sessions]
+
+    def _start_snapshot(self, snapshot: List[Any]) -> None:
+        # Later batches go to a new segment; the snapshot stands in for everything before it
+        self._roll()
+        self._tail_bytes = 0
+        self._tail_operations = 0
+        sequence = self.sequence
+        self._snapshotting = asyncio.get_running_loop().run_in_executor(
+            self._snapshot_executor, self._write_snapshot, sequence, snapshot
+        )
+        self._snapshotting.add_done_callback(self._snapshot_done)
+
+    def _snapshot_done(self, future: "asyncio.Future") -> None:
+        self._snapshotting = None
+        if future.exception() is not None:
+            # Whatever it held is only in the store (and older segments) now; try again
+            self._unlogged = True
+            logger.error("Writing a history snapshot failed", exc_info=future.exception())
+
+    def _write_snapshot(self, sequence: int, snapshot: List[Any]) -> None:
+        header, sessions = snapshot
+        path = self._path(SNAPSHOT_PREFIX, sequence)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(encode_record(header))
+            for session_id, last_seen, messages, summary in sessions:
+                rows = [message_row(message) for message in messages]
+                file.write(encode_record([session_id, last_seen, rows, summary]))
+            file.write(encode_record(["end"]))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        self._fsync_directory()
+        # The snapshot covers every older segment and snapshot
+        for prefix in (SEGMENT_PREFIX, SNAPSHOT_PREFIX):
+            for older in self._listing(prefix):
+                if older < sequence:
+                    os.remove(self._path(prefix, older))
+        self.snapshots += 1
+
+    def _fsync_directory(self) -> None:
+        descriptor = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            await self._flusher
+        if self._snapshotting is not None:
+            await self._snapshotting
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._segment.close)
+        self._executor.shutdown()
+        self._snapshot_executor.shutdown()
+        self.unlock()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segment": self.sequence,
+            "segment_bytes": self._segment_size,
+            "records": self.records,
+            "operations": self.operations,
+            "snapshots": self.snapshots,
+            "recovered_operations": self.recovered_operations,
+            "recovery_s": round(self.recovery_seconds, 3),
+        }
@@ -0,0 +1,190 @@
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Rough per-object overheads (CPython, 64-bit) used to account memory without
+# walking every object with sys.getsizeof on the hot path
+MESSAGE_OVERHEAD_BYTES = 400
+SESSION_OVERHEAD_BYTES = 600
+SEGMENT_OVERHEAD_BYTES = 150
+REFERENCE_OVERHEAD_BYTES = 300
+
+
+def message_size(message: Dict[str, Any]) -> int:
+    return (
+        MESSAGE_OVERHEAD_BYTES
+        + sum(len(value) for value in message.values() if isinstance(value, str))
+        + SEGMENT_OVERHEAD_BYTES * len(message.get("segments") or ())
+        + REFERENCE_OVERHEAD_BYTES * len(message.get("references") or ())
+    )
+
+
+class Session:
+    __slots__ = ("messages", "summary", "size", "last_seen")
+
+    def __init__(self, now: float):
+        self.messages: List[Dict[str, Any]] = []
+        # Running summary of messages up to and including summary["upto"]
+        self.summary: Optional[Dict[str, Any]] = None
+        self.size = SESSION_OVERHEAD_BYTES
+        self.last_seen = now
+
+
+class SessionHistoryStore:
+    """Chat history keyed by session id with a global memory budget.
+
+    Sessions are kept in least-recently-used order; idle sessions expire after
+    ``idle_ttl`` seconds and the least recently used ones are evicted whenever
+    the accounted size goes over ``max_bytes``. Every stored message gets an id
+    from a store-wide counter, so ids only ever increase within a session, even
+    across a clear. Messages that already carry an id (when restoring from a
+    log) keep it, and the counter moves past it.
+    """
+
+    def __init__(self, max_bytes: int, idle_ttl: float, max_messages: int, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self._clock = clock
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.next_id = 1
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def _touch(self, session_id: str, create: bool) -> Optional[Session]:
+        now = self._clock()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[session_id] = Session(now)
+            self.total_bytes += session.size
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_seen = now
+        return session
+
+    def _expire(self, now: float) -> None:
+        # The LRU head is always the longest-idle session, so stop at the first live one
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen < self.idle_ttl:
+                break
+            self._drop(session_id)
+            self.expirations += 1
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self.total_bytes -= session.size
+
+    def _trim(self, session: Session, max_size: int) -> None:
+        while session.messages and (len(session.messages) > self.max_messages or session.size > max_size):
+            self._remove_oldest(session)
+
+    def _remove_oldest(self, session: Session) -> None:
+        removed = message_size(session.messages.pop(0))
+        session.size -= removed
+        self.total_bytes -= removed
+
+    def _evict(self, keep: str) -> None:
+        while self.total_bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self.evictions += 1
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        session = self._touch(session_id, create=False)
+        return session.messages if session else []
+
+    def since(self, session_id: str, since: int, limit: int) -> List[Dict[str, Any]]:
+        messages = self.get(session_id)
+        start = bisect_right(messages, since, key=lambda message: message["id"])
+        return messages[start:start + limit]
+
+    def bounds(self, session_id: str) -> Tuple[int, int]:
+        # First and last stored id; together they identify the session's current contents
+        messages = self.get(session_id)
+        if not messages:
+            return 0, 0
+        return messages[0]["id"], messages[-1]["id"]
+
+    def append(self, session_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        session = self._touch(session_id, create=True)
+        message.setdefault("id", self.next_id)
+        self.next_id = max(self.next_id, message["id"] + 1)
+        size = message_size(message)
+        session.messages.append(message)
+        session.size += size
+        self.total_bytes += size
+        # A single session may never take more than the whole budget
+        self._trim(session, self.max_bytes)
+        self._evict(keep=session_id)
+        return message
+
+    def summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(session_id)
+        return session.summary if session else None
+
+    def set_summary(self, session_id: str, summary: Dict[str, Any]) -> None:
+        # Compaction runs in the background, so the session may be gone by the time it lands,
+        # or cleared and started again: ids keep increasing across a clear, so a session
+        # whose oldest message is newer than the summary's last one is not the one summarized
+        session = self._sessions.get(session_id)
+        if session is None or not session.messages or session.messages[0]["id"] > summary["upto"]:
+            return
+        self._set_summary(session_id, session, summary)
+
+    def _set_summary(self, session_id: str, session: Session, summary: Dict[str, Any]) -> None:
+        size = message_size(summary) - (message_size(session.summary) if session.summary else 0)
+        session.summary = summary
+        session.size += size
+        self.total_bytes += size
+        self._evict(keep=session_id)
+
+    def sessions(self) -> Iterator[Tuple[str, List[Dict[str, Any]], Optional[Dict[str, Any]], float]]:
+        # Least recently used first, so restoring in this order rebuilds the same LRU order
+        for session_id, session in self._sessions.items():
+            yield session_id, session.messages, session.summary, session.last_seen
+
+    def restore(
+        self, session_id: str, messages: List[Dict[str, Any]], summary: Optional[Dict[str, Any]]
+    ) -> None:
+        # Bulk version of append + set_summary for messages that already have ids
+        if not messages:
+            return
+        session = self._touch(session_id, create=True)
+        size = sum(message_size(message) for message in messages)
+        session.messages.extend(messages)
+        session.size += size
+        self.total_bytes += size
+        self.next_id = max(self.next_id, messages[-1]["id"] + 1)
+        self._trim(session, self.max_bytes)
+        self._evict(keep=session_id)
+        # Trimming may have dropped every message the summary covers, which leaves it valid
+        if summary is not None:
+            self._set_summary(session_id, session, summary)
+
+    def clear(self, session_id: str) -> None:
+        if session_id in self._sessions:
+            self._drop(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        self._expire(self._clock())
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,207 @@
+import asyncio
+import math
+import re
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+from admission import Overloaded
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_SECONDS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    # Groq formats resets like "2m59.56s" or "120ms"; Retry-After is plain seconds
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+class QuotaBucket:
+    """Local model of one Groq quota (requests or tokens).
+
+    Until Groq has reported the quota the bucket is unlimited. Each report
+    sets the remaining amount and a refill rate that brings it back to the
+    limit by the reported reset time. Reservations may drive ``available``
+    negative; the deficit divided by the refill rate is how long the newest
+    reservation has to wait, which makes waiting callers queue in order.
+    """
+
+    __slots__ = ("limit", "available", "rate", "updated")
+
+    def __init__(self):
+        self.limit: Optional[float] = None
+        self.available = 0.0
+        self.rate = 0.0
+        self.updated = 0.0
+
+    def refill(self, now: float) -> None:
+        if self.limit is not None:
+            self.available = min(self.limit, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_after(self, amount: float) -> float:
+        # Seconds until ``amount`` more would be covered by the refill
+        if self.limit is None:
+            return 0.0
+        deficit = min(amount, self.limit) - self.available
+        if deficit <= 0:
+            return 0.0
+        return deficit / self.rate if self.rate > 0 else math.inf
+
+    def take(self, amount: float) -> None:
+        if self.limit is not None:
+            self.available -= min(amount, self.limit)
+
+    def report(self, limit: float, remaining: float, reset: Optional[float], outstanding: float, now: float) -> None:
+        self.limit = limit
+        # Calls still in flight may not be counted by Groq yet, so keep them charged
+        self.available = remaining - outstanding
+        if not reset:
+            self.rate = limit
+        else:
+            # A full bucket still has to refill at some pace once calls start draining it
+            self.rate = max(limit - remaining, 1.0) / reset
+        self.updated = now
+
+
+class Reservation:
+    """Quota charged up front for one call, settled when Groq's headers arrive."""
+
+    __slots__ = ("pacer", "requests", "tokens", "open", "sent")
+
+    def __init__(self, pacer: "RateLimitPacer", requests: float, tokens: float):
+        self.pacer = pacer
+        self.requests = requests
+        self.tokens = tokens
+        self.open = True
+        self.sent = False
+
+    def settle(self, headers: Mapping[str, str], throttled: bool = False) -> None:
+        if self.open:
+            self.close()
+            self.pacer.report(headers, throttled)
+
+    def close(self) -> None:
+        # Called with no headers when the call failed before Groq answered
+        if self.open:
+            self.open = False
+            self.pacer.outstanding_requests -= self.requests
+            self.pacer.outstanding_tokens -= self.tokens
+
+    def cancel(self) -> None:
+        # The call was never sent, so its quota goes back to the buckets
+        if self.open:
+            self.close()
+            self.pacer.requests.take(-self.requests)
+            self.pacer.tokens.take(-self.tokens)
+
+    def release(self) -> None:
+        if self.sent:
+            self.close()
+        else:
+            self.cancel()
+
+
+class RateLimitPacer:
+    """Paces calls to Groq by the quota it reports in ``x-ratelimit-*`` headers.
+
+    Every call reserves one request and its estimated tokens (prompt plus
+    ``max_tokens``) before it is sent. When the local model of the quota says
+    the call would be rejected, the caller sleeps until the quota has refilled
+    enough, so a burst turns into short queueing delays instead of 429s. A
+    wait longer than ``max_wait`` (or the caller's own, if shorter) is
+    refused with :class:`Overloaded`, and a 429 that gets through anyway
+    pauses everyone for its Retry-After.
+    """
+
+    def __init__(self, max_wait: float, clock=time.monotonic):
+        self.max_wait = max_wait
+        self._clock = clock
+        self.requests = QuotaBucket()
+        self.tokens = QuotaBucket()
+        self.outstanding_requests = 0.0
+        self.outstanding_tokens = 0.0
+        self.paused_until = 0.0
+        self.paced = 0
+        self.paced_seconds = 0.0
+        self.refused = 0
+        self.throttled = 0
+
+    async def acquire(self, tokens: int, max_wait: Optional[float] = None) -> Reservation:
+        reservation, wait = self.reserve(tokens, max_wait)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                reservation.cancel()
+                raise
+        return reservation
+
+    def reserve(self, tokens: int, max_wait: Optional[float] = None) -> Tuple[Reservation, float]:
+        # Returns the reservation and how long to wait before sending the call
+        now = self._clock()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        wait = max(self.paused_until - now, self.requests.wait_after(1), self.tokens.wait_after(tokens))
+        if wait > (self.max_wait if max_wait is None else min(max_wait, self.max_wait)):
+            self.refused += 1
+            raise Overloaded("upstream rate limit reached", max(1, math.ceil(min(wait, 3600))))
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.outstanding_requests += 1
+        self.outstanding_tokens += tokens
+        if wait > 0:
+            self.paced += 1
+            self.paced_seconds += wait
+        return Reservation(self, 1, tokens), wait
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.paused_until - self._clock()))
+
+    def report(self, headers: Mapping[str, str], throttled: bool = False) -> None:
+        now = self._clock()
+        for bucket, kind, outstanding in (
+            (self.requests, "requests", self.outstanding_requests),
+            (self.tokens, "tokens", self.outstanding_tokens),
+        ):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if limit is None or remaining is None:
+                continue
+            try:
+                bucket.report(
+                    float(limit),
+                    float(remaining),
+                    parse_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+                    outstanding,
+                    now,
+                )
+            except ValueError:
+                continue
+        if throttled:
+            self.throttled += 1
+            retry_after = parse_duration(headers.get("retry-after")) or 1.0
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+    def stats(self) -> Dict[str, float]:
+        now = self._clock()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return {
+            "requests_limit": self.requests.limit,
+            "requests_available": round(self.requests.available, 1) if self.requests.limit is not None else None,
+            "tokens_limit": self.tokens.limit,
+            "tokens_available": round(self.tokens.available, 1) if self.tokens.limit is not None else None,
+            "paced": self.paced,
+            "paced_seconds": round(self.paced_seconds, 3),
+            "refused": self.refused,
+            "throttled": self.throttled,
+        }
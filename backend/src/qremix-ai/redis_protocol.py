@@ -0,0 +1,149 @@
+import asyncio
+from typing import Any, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+Command = Sequence[Any]
+
+
+class RedisError(Exception):
+    """An error reply from the server."""
+
+
+def encode_command(command: Command) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, str):
+            data = arg.encode()
+        else:
+            data = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed by server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"unexpected reply {line!r}")
+
+
+class RedisClient:
+    """Minimal asyncio client for the Redis protocol (RESP2).
+
+    Only what the history backend needs: pipelined commands and MULTI/EXEC
+    transactions, each sent in a single round trip over a pooled connection.
+    Replies are decoded as UTF-8 strings, integers, lists or None.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, max_connections: int = 16):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.max_connections = max_connections
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._open = 0
+        self._available: Optional[asyncio.Condition] = None
+        self.round_trips = 0
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisClient":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db, **kwargs)
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.db:
+            writer.write(encode_command(("SELECT", self.db)))
+            reply = await read_reply(reader)
+            if isinstance(reply, RedisError):
+                writer.close()
+                raise reply
+        return reader, writer
+
+    async def _checkout(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self._available is None:
+            self._available = asyncio.Condition()
+        async with self._available:
+            while not self._idle and self._open >= self.max_connections:
+                await self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            return await self._connect()
+        except BaseException:
+            await self._discard()
+            raise
+
+    async def _checkin(self, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter]) -> None:
+        async with self._available:
+            self._idle.append(connection)
+            self._available.notify()
+
+    async def _discard(self) -> None:
+        async with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    async def pipeline(self, commands: Sequence[Command]) -> List[Any]:
+        # Error replies are returned in place rather than raised so callers see every result
+        connection = await self._checkout()
+        reader, writer = connection
+        try:
+            writer.write(b"".join(encode_command(command) for command in commands))
+            await writer.drain()
+            replies = [await read_reply(reader) for _ in commands]
+        except BaseException:
+            # A half-read connection can't be reused
+            writer.close()
+            await self._discard()
+            raise
+        self.round_trips += 1
+        await self._checkin(connection)
+        return replies
+
+    async def execute(self, *command: Any) -> Any:
+        (reply,) = await self.pipeline([command])
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def transaction(self, commands: Sequence[Command]) -> List[Any]:
+        replies = await self.pipeline([("MULTI",), *commands, ("EXEC",)])
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        results = replies[-1]
+        if results is None:
+            raise RedisError("transaction aborted")
+        for result in results:
+            if isinstance(result, RedisError):
+                raise result
+        return results
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            self._open -= 1
@@ -0,0 +1,56 @@
+import time
+from contextvars import ContextVar
+from typing import Dict, Mapping, Optional
+
+
+class RequestTiming:
+    """Durations of the phases of one request, reported as ``Server-Timing``.
+
+    The timing of the request being handled is kept in :data:`current`, so
+    phases can be recorded where the work happens (deep in the upstream call,
+    say) without passing the object down. A phase recorded more than once is
+    summed. Tasks copy the context they are created in, so work a request
+    starts in the background must clear :data:`current` itself.
+    """
+
+    __slots__ = ("started", "phases")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def milliseconds(self) -> Dict[str, float]:
+        # Phases in the order they were first recorded, then the time since the start
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 3)
+        return timings
+
+
+current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def start() -> RequestTiming:
+    timing = RequestTiming()
+    current.set(timing)
+    return timing
+
+
+def record(name: str, seconds: float) -> None:
+    timing = current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+def server_timing(timings: Mapping[str, float], descriptions: Optional[Mapping[str, str]] = None) -> str:
+    # e.g. 'context;dur=0.41, groq;dur=512.3;desc="Groq call", total;dur=514.02'
+    descriptions = descriptions or {}
+    entries = []
+    for name, milliseconds in timings.items():
+        entry = f"{name};dur={milliseconds}"
+        if name in descriptions:
+            entry += f';desc="{descriptions[name]}"'
+        entries.append(entry)
+    return ", ".join(entries)
@@ -0,0 +1,164 @@
+import asyncio
+import math
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from admission import Overloaded
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    """Retries failed calls with decorrelated jitter, within a deadline.
+
+    A call is attempted up to ``max_attempts`` times while ``is_retryable``
+    accepts its error. Before each retry it sleeps for a random time between
+    ``base_delay`` and three times the previous sleep, capped at
+    ``max_delay``, so clients that failed together do not retry together. A
+    retry whose sleep would end past the deadline is not made; each attempt
+    is told how many seconds are left, to use as its timeout.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.1,
+        max_delay: float = 1.0,
+        is_retryable: Callable[[BaseException], bool] = lambda error: False,
+        on_retry: Optional[Callable[[BaseException, float], None]] = None,
+        clock=time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_retryable = is_retryable
+        self.on_retry = on_retry
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self.retries = 0
+        self.out_of_time = 0
+
+    def backoff(self, previous: float) -> float:
+        return min(self.max_delay, self._rng.uniform(self.base_delay, previous * 3))
+
+    async def run(
+        self, attempt: Callable[[float], Awaitable[T]], deadline: float, max_attempts: Optional[int] = None
+    ) -> T:
+        # ``attempt`` gets the seconds left until ``deadline``
+        attempts = max_attempts or self.max_attempts
+        delay = self.base_delay
+        number = 0
+        while True:
+            number += 1
+            try:
+                return await attempt(deadline - self._clock())
+            except Exception as error:
+                if number == attempts or not self.is_retryable(error):
+                    raise
+                delay = self.backoff(delay)
+                if self._clock() + delay >= deadline:
+                    self.out_of_time += 1
+                    raise
+                self.retries += 1
+                if self.on_retry is not None:
+                    self.on_retry(error, delay)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_attempts": self.max_attempts,
+            "retries": self.retries,
+            "out_of_time": self.out_of_time,
+        }
+
+
+class CircuitBreaker:
+    """Fails calls at once while upstream keeps failing.
+
+    After ``failure_threshold`` failures in a row the circuit opens and
+    :meth:`check` raises :class:`Overloaded` without the call being made, so
+    callers neither hold a slot nor wait for a timeout. Once ``reset_timeout``
+    seconds have passed it lets one call through as a probe (half-open): a
+    success closes the circuit, a failure opens it for another
+    ``reset_timeout``. :meth:`check` returns a token for the probe, which
+    the caller passes back with its outcome; calls that were already under
+    way when the circuit opened report without one and cannot close it. A
+    probe turned away before reaching upstream is handed back with
+    :meth:`release`, so the next call probes instead; one that reports
+    nothing at all is replaced after ``reset_timeout``. Only errors
+    that show upstream is unhealthy should be reported as failures; any
+    answer from it, even a rejection, is a success.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._probes = 0
+        self.trips = 0
+        self.rejected = 0
+
+    def check(self) -> Optional[int]:
+        # None for an ordinary call, or the token of the probe this call is to be
+        if self.state == CLOSED:
+            return None
+        now = self._clock()
+        if self.state == OPEN:
+            remaining = self._opened_at + self.reset_timeout - now
+            if remaining > 0:
+                self._reject(remaining)
+            self.state = HALF_OPEN
+            self._probe_started = None
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            self._reject(self._probe_started + self.reset_timeout - now)
+        self._probe_started = now
+        self._probes += 1
+        return self._probes
+
+    def _reject(self, retry_after: float) -> None:
+        self.rejected += 1
+        raise Overloaded("upstream unavailable", max(1, math.ceil(retry_after)))
+
+    def _is_probe(self, probe: Optional[int]) -> bool:
+        # A probe that was replaced after reset_timeout no longer speaks for upstream either
+        return self.state == HALF_OPEN and probe is not None and probe == self._probes
+
+    def record_success(self, probe: Optional[int] = None) -> None:
+        self._failures = 0
+        # Calls started before the circuit opened do not close it; only the probe can
+        if self._is_probe(probe):
+            self.state = CLOSED
+            self._probe_started = None
+
+    def release(self, probe: Optional[int] = None) -> None:
+        # The probe never reached upstream; a no-op once it reported (or was replaced)
+        if self._is_probe(probe):
+            self._probe_started = None
+
+    def record_failure(self, probe: Optional[int] = None) -> None:
+        self._failures += 1
+        if self._is_probe(probe) or (self.state == CLOSED and self._failures >= self.failure_threshold):
+            self.state = OPEN
+            self._opened_at = self._clock()
+            self._probe_started = None
+            self.trips += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout_s": self.reset_timeout,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
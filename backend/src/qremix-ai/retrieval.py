@@ -0,0 +1,437 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import re
+import textwrap
+import time
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SOURCE_SUFFIX = ".sol"
+SKIPPED_DIRS = {"node_modules", ".git", "artifacts", "cache"}
+
+# Comments and strings are matched (and skipped) so braces and semicolons inside them do
+# not count; an unterminated block comment runs to the end, as in a file being edited
+STRUCTURE = re.compile(r'//[^\n]*|/\*.*?(?:\*/|\Z)|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|[{};]', re.DOTALL)
+CONTAINER = re.compile(r"\b(?:abstract\s+)?(contract|library|interface)\s+([A-Za-z_$][\w$]*)")
+MEMBER = re.compile(r"\b(function|modifier|constructor|fallback|receive|struct|enum)\b(?:\s+([A-Za-z_$][\w$]*))?")
+
+IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*|\d+")
+# Pieces of camelCase, PascalCase, ACRONYMCase and snake_case identifiers
+WORD_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could do does did for from how i if in into is it its "
+    "me my of on or please should so than that the their then there these this those to "
+    "was what when where which who why will with would you your".split()
+)
+# A chunk's name (file, contract and function) counts this many times over, so asking
+# about MyContract1 or transferFrom finds the code that declares it
+NAME_WEIGHT = 3
+MAX_QUERY_TERMS = 16
+# Standard BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def source_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+
+
+_term_cache: Dict[str, Tuple[str, ...]] = {}
+
+
+def identifier_terms(word: str) -> Tuple[str, ...]:
+    # Code repeats the same identifiers, so their split is remembered (up to a bound)
+    terms = _term_cache.get(word)
+    if terms is None:
+        lower = word.lower()
+        parts = [part.lower() for part in WORD_PART.findall(word)]
+        terms = tuple(term for term in dict.fromkeys([lower, *parts]) if term not in STOPWORDS)
+        if len(_term_cache) < 100_000:
+            _term_cache[word] = terms
+    return terms
+
+
+def tokenize(text: str) -> List[str]:
+    # Each identifier gives itself and its parts: balanceOf -> balanceof, balance, of
+    terms = []
+    for word in IDENTIFIER.findall(text):
+        terms.extend(identifier_terms(word))
+    return terms
+
+
+class Chunk:
+    __slots__ = ("path", "name", "start_line", "end_line", "text", "terms", "length")
+
+    def __init__(self, path: str, name: str, start_line: int, end_line: int, text: str):
+        self.path = path
+        self.name = name
+        self.start_line = start_line
+        self.end_line = end_line
+        self.text = text
+        name_terms = tokenize(f"{os.path.basename(path)} {name}") * NAME_WEIGHT
+        self.terms = Counter(tokenize(text) + name_terms)
+        self.length = sum(self.terms.values())
+
+
+def chunk_solidity(source: str) -> List[Tuple[str, int, int, str]]:
+    """Splits Solidity source into (name, first line, last line, text) chunks.
+
+    Every function, modifier, constructor, fallback, receive, struct and enum
+    with a body is a chunk of its own, from its doc comment to its closing
+    brace, named ``Contract.member``. What is left of a contract, library or
+    interface (its declaration, state variables, events, errors and bodiless
+    interface functions) is one more chunk named after it. Braces are
+    counted outside comments and strings only, and a file that stops in the
+    middle of a declaration, as one being edited may, closes it at the end.
+    """
+    chunks = []
+    newlines = [match.start() for match in re.finditer("\n", source)]
+
+    def line(offset: int) -> int:
+        return bisect_right(newlines, offset - 1) + 1
+
+    def start_of(offset: int) -> int:
+        # Skip the whitespace between the previous declaration and this one
+        while offset < len(source) and source[offset].isspace():
+            offset += 1
+        return offset
+
+    depth = 0
+    boundary = 0
+    # [name, start, end of the declaration, statement spans] for the open contract
+    container = None
+    # (name, start, depth) for the open member
+    member = None
+
+    def close_member(end: int) -> None:
+        name, start, _ = member
+        # From the start of its first line, so the body dedents to the member's own level
+        line_start = source.rfind("\n", 0, start) + 1
+        if source[line_start:start].isspace():
+            start = line_start
+        chunks.append((name, line(start), line(end - 1), textwrap.dedent(source[start:end])))
+
+    def close_container(end: int) -> None:
+        name, start, header_end, statements = container
+        body = "".join(f"\n    {source[first:last].strip()}" for first, last in statements)
+        text = f"{source[start:header_end].rstrip()}{body}\n}}"
+        chunks.append((name, line(start), line(end - 1), text))
+
+    for match in STRUCTURE.finditer(source):
+        token = match.group()
+        if token == "{":
+            if member is None and depth <= 1:
+                header = source[boundary:match.start()]
+                declaration = CONTAINER.search(header) if depth == 0 else None
+                if declaration is not None:
+                    container = [declaration.group(2), start_of(boundary), match.end(), []]
+                elif depth == 0 or container is not None:
+                    found = MEMBER.search(header)
+                    if found is not None:
+                        name = found.group(2) or found.group(1)
+                        if container is not None:
+                            name = f"{container[0]}.{name}"
+                        member = (name, start_of(boundary), depth)
+            depth += 1
+            boundary = match.end()
+        elif token == "}":
+            depth = max(0, depth - 1)
+            if member is not None and depth == member[2]:
+                close_member(match.end())
+                member = None
+            elif container is not None and depth == 0:
+                close_container(match.end())
+                container = None
+            boundary = match.end()
+        elif token == ";":
+            if container is not None and member is None and depth == 1:
+                container[3].append((start_of(boundary), match.end()))
+            boundary = match.end()
+    if member is not None:
+        close_member(len(source))
+    if container is not None:
+        close_container(len(source))
+    return chunks
+
+
+class CodeIndex:
+    """BM25 inverted index over the chunks of a set of source files.
+
+    ``postings`` maps each term to the chunks containing it and how often.
+    Files are updated incrementally: :meth:`update` re-chunks a file whose
+    hash changed, keeps every chunk whose name and text are unchanged (only
+    its line numbers move) and indexes just the new ones, so editing one
+    function re-tokenizes one chunk. Chunk ids come from a shared counter, so several
+    indexes can be searched together by :func:`search`.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.chunks: Dict[int, Chunk] = {}
+        # Chunk lengths in terms, apart from the chunks so scoring reads a plain dict
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        # path -> (hash, {(chunk name, chunk text): chunk ids}); a list because one file can
+        # hold the same member twice, say a contract pasted before the old one is deleted
+        self.files: Dict[str, Tuple[str, Dict[Tuple[str, str], List[int]]]] = {}
+        self.chunks_indexed = 0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def update(self, path: str, content: str, digest: Optional[str] = None) -> None:
+        digest = digest or source_hash(content)
+        previous = self.files.get(path)
+        if previous is not None and previous[0] == digest:
+            return
+        old = previous[1] if previous is not None else {}
+        current: Dict[Tuple[str, str], List[int]] = {}
+        for name, start_line, end_line, text in chunk_solidity(content):
+            # Keyed by name as well as text: the same onlyOwner modifier in two contracts is
+            # two chunks, and a chunk's name is part of what it is indexed under
+            key = (name, text)
+            unchanged = old.get(key)
+            if unchanged:
+                chunk_id = unchanged.pop()
+                chunk = self.chunks[chunk_id]
+                chunk.start_line, chunk.end_line = start_line, end_line
+            else:
+                chunk_id = self._add_chunk(Chunk(path, name, start_line, end_line, text))
+            current.setdefault(key, []).append(chunk_id)
+        for chunk_ids in old.values():
+            for chunk_id in chunk_ids:
+                self._remove_chunk(chunk_id)
+        self.files[path] = (digest, current)
+
+    def remove(self, path: str) -> None:
+        previous = self.files.pop(path, None)
+        if previous is not None:
+            for chunk_ids in previous[1].values():
+                for chunk_id in chunk_ids:
+                    self._remove_chunk(chunk_id)
+
+    def _add_chunk(self, chunk: Chunk) -> int:
+        chunk_id = next(self._ids)
+        self.chunks[chunk_id] = chunk
+        self.lengths[chunk_id] = chunk.length
+        self.total_length += chunk.length
+        for term, count in chunk.terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+        self.chunks_indexed += 1
+        return chunk_id
+
+    def _remove_chunk(self, chunk_id: int) -> None:
+        chunk = self.chunks.pop(chunk_id)
+        del self.lengths[chunk_id]
+        self.total_length -= chunk.length
+        for term in chunk.terms:
+            posting = self.postings[term]
+            del posting[chunk_id]
+            if not posting:
+                del self.postings[term]
+
+
+def search(indexes: Iterable[CodeIndex], query: str, k: int, min_score: float = 0.0) -> List[Tuple[float, Chunk]]:
+    """The ``k`` best chunks for ``query`` across ``indexes``, best first.
+
+    Scored with BM25 as if the indexes were one: document frequencies and
+    the average chunk length are summed over all of them, so a chunk of the
+    session's workspace and one of the project compete on equal terms.
+    Chunks scoring under ``min_score`` are left out.
+
+    Terms are scored rarest first, MaxScore style. A term adds at most its
+    idf times ``K1 + 1`` to a chunk, so once the terms still to come could
+    not lift a chunk that matched none so far past the k-th best score, only
+    the chunks already found can still make the top k; the common terms are
+    then looked up for those chunks instead of walking their long postings.
+    The result is the same as scoring every posting.
+    """
+    indexes = [index for index in indexes if index.chunks]
+    count = sum(len(index.chunks) for index in indexes)
+    if not count:
+        return []
+    # tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average)), with the constants hoisted
+    # out of the loop over postings, which is where the time goes
+    constant = K1 * (1 - B)
+    per_length = K1 * B * count / sum(index.total_length for index in indexes)
+    terms = []
+    for term in set(tokenize(query)):
+        postings = [(posting, index.lengths) for index in indexes if (posting := index.postings.get(term))]
+        frequency = sum(len(posting) for posting, _ in postings)
+        if frequency:
+            weight = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5)) * (K1 + 1)
+            terms.append((frequency, weight, postings))
+    # A long question is scored on its rarest terms; the common ones it drops would cost
+    # the most to score and move the ranking the least
+    terms.sort(key=lambda item: item[0])
+    terms = terms[:MAX_QUERY_TERMS]
+    # The most the terms from position i on can still add to a chunk
+    bounds = [0.0] * (len(terms) + 1)
+    for position in range(len(terms) - 1, -1, -1):
+        bounds[position] = bounds[position + 1] + terms[position][1]
+    scores: Dict[int, float] = {}
+    get = scores.get
+    candidates = None
+    for position, (frequency, weight, postings) in enumerate(terms):
+        bound = bounds[position]
+        # max() first: it is much cheaper than finding the k-th best and usually decides
+        if candidates is None and len(scores) >= k and bound < max(scores.values()):
+            threshold = max(min_score, heapq.nlargest(k, scores.values())[-1])
+            if bound < threshold:
+                candidates = [chunk_id for chunk_id, score in scores.items() if score + bound >= threshold]
+        if candidates is not None:
+            # A chunk id in a posting list is in that index, so its length is too
+            for posting, lengths in postings:
+                for chunk_id in candidates:
+                    tf = posting.get(chunk_id)
+                    if tf:
+                        scores[chunk_id] += weight * tf / (tf + constant + per_length * lengths[chunk_id])
+            continue
+        for posting, lengths in postings:
+            for chunk_id, tf in posting.items():
+                scores[chunk_id] = get(chunk_id, 0.0) + weight * tf / (tf + constant + per_length * lengths[chunk_id])
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    found = []
+    for chunk_id, score in best:
+        if score < min_score:
+            break
+        for index in indexes:
+            chunk = index.chunks.get(chunk_id)
+            if chunk is not None:
+                found.append((score, chunk))
+                break
+    return found
+
+
+class Retriever:
+    """Project and workspace Solidity code, searchable per session.
+
+    The project index covers the ``.sol`` files under ``roots``; :meth:`scan`
+    finds the ones whose size or modification time changed (it only reads
+    files, so it can run in a thread) and :meth:`apply` indexes them. Each
+    session that has mirrored ``.sol`` files gets a small index of its own,
+    brought up to date with the mirror on each search and dropped after
+    ``idle_ttl`` seconds without one, or when more than ``max_sessions``
+    are kept.
+    """
+
+    def __init__(self, roots: List[str], label_root: str, idle_ttl: float, max_sessions: int, clock=time.monotonic):
+        self.roots = roots
+        self.label_root = label_root
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self.project = CodeIndex()
+        # path -> (mtime, size) of each file as last indexed
+        self._seen: Dict[str, Tuple[int, int]] = {}
+        self._workspaces: "OrderedDict[str, Tuple[CodeIndex, float]]" = OrderedDict()
+        self.scans = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def _label(self, path: str) -> str:
+        relative = os.path.relpath(path, self.label_root)
+        return path if relative.startswith("..") else relative.replace(os.sep, "/")
+
+    def scan(self) -> Tuple[List[Tuple[str, Tuple[int, int], str]], List[str]]:
+        # (path, signature, content) of new or changed files and paths of removed ones;
+        # a file that cannot be read or decoded is left out and tried again next time
+        changed = []
+        present = set()
+        for root in self.roots:
+            for directory, subdirectories, names in os.walk(root):
+                subdirectories[:] = [name for name in subdirectories if name not in SKIPPED_DIRS]
+                for name in names:
+                    if not name.endswith(SOURCE_SUFFIX):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        status = os.stat(path)
+                        present.add(path)
+                        signature = (status.st_mtime_ns, status.st_size)
+                        if self._seen.get(path) != signature:
+                            with open(path, encoding="utf-8") as f:
+                                changed.append((path, signature, f.read()))
+                    except (OSError, UnicodeDecodeError) as error:
+                        logger.warning("Could not index %s: %s", path, error)
+        removed = [path for path in self._seen if path not in present]
+        return changed, removed
+
+    def apply(self, changes: Tuple[List[Tuple[str, Tuple[int, int], str]], List[str]]) -> None:
+        # A file's signature is only recorded once it is indexed, so one that failed is
+        # scanned again
+        changed, removed = changes
+        for path, signature, content in changed:
+            try:
+                self.project.update(self._label(path), content)
+            except Exception:
+                logger.exception("Could not index %s", path)
+                continue
+            self._seen[path] = signature
+        for path in removed:
+            self.project.remove(self._label(path))
+            del self._seen[path]
+        self.scans += 1
+
+    def _workspace_index(self, session_id: str, files) -> Optional[CodeIndex]:
+        now = self._clock()
+        while self._workspaces:
+            oldest, (_, last_used) = next(iter(self._workspaces.items()))
+            if now - last_used < self.idle_ttl and len(self._workspaces) <= self.max_sessions:
+                break
+            del self._workspaces[oldest]
+        sources = [file for file in files if file.path.endswith(SOURCE_SUFFIX)]
+        entry = self._workspaces.pop(session_id, None)
+        if not sources:
+            return None
+        index = entry[0] if entry is not None else CodeIndex()
+        for file in sources:
+            index.update(file.path, file.content, file.hash)
+        paths = {file.path for file in sources}
+        for path in [path for path in index.files if path not in paths]:
+            index.remove(path)
+        self._workspaces[session_id] = (index, now)
+        return index
+
+    def search(self, session_id: str, files, query: str, k: int, min_score: float) -> List[Tuple[float, Chunk]]:
+        # ``files`` are the session's mirrored files (anything with path, content and hash)
+        started = time.perf_counter()
+        indexes = [self.project]
+        workspace = self._workspace_index(session_id, files)
+        if workspace is not None:
+            indexes.append(workspace)
+        found = search(indexes, query, k, min_score)
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return found
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "project_files": len(self.project.files),
+            "project_chunks": len(self.project),
+            "workspace_sessions": len(self._workspaces),
+            "workspace_chunks": sum(len(index) for index, _ in self._workspaces.values()),
+            "chunks_indexed": self.project.chunks_indexed
+            + sum(index.chunks_indexed for index, _ in self._workspaces.values()),
+            "scans": self.scans,
+            "searches": self.searches,
+            "mean_search_ms": round(self.search_seconds / self.searches * 1000, 3) if self.searches else 0.0,
+        }
+
+
+async def watch(retriever: Retriever, interval: float) -> None:
+    # Runs until cancelled; files are read in a thread, the index is only changed here
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        retriever.apply(await loop.run_in_executor(None, retriever.scan))
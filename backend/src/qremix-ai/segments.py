@@ -0,0 +1,109 @@
+import re
+from itertools import chain
+from typing import Any, Dict, List, Optional
+
+TEXT = "text"
+CODE = "code"
+EXPLANATION = "explanation"
+
+# [kind, start, end, language]: a slice of the message content, so storing the segments
+# next to the content costs a few integers rather than a second copy of the text
+Segment = List[Any]
+
+# The only lines that can change the state: a fence, or one that may be a heading. Lines
+# after the first are found by their leading newline, which the regex engine scans for
+# much faster than for ^ in MULTILINE mode
+_LINE = r"( {0,3}(?:(`{3,}|~{3,})|[#*_Ee]))"
+FIRST_LINE = re.compile(_LINE)
+LINE_START = re.compile("\n" + _LINE)
+EXPLANATION_HEADING = re.compile(
+    r"#{1,6}[ \t]+(?:\*\*|__)?explanation(?:\*\*|__)?[ \t]*:?[ \t]*$"
+    r"|(?:\*\*|__)explanation[ \t]*:?[ \t]*(?:\*\*|__)[ \t]*:?[ \t]*"
+    r"|explanation[ \t]*:[ \t]*$",
+    re.IGNORECASE,
+)
+OTHER_HEADING = re.compile(r"#{1,6}[ \t]|(?:\*\*|__)[^*_]+(?:\*\*|__)[ \t]*:?[ \t]*$")
+
+
+def parse_segments(markdown: str) -> List[Segment]:
+    """Splits a markdown answer into prose, fenced code blocks and its Explanation section.
+
+    One pass over the text, in which ``LINE_START`` finds the lines that
+    matter and every other line is skipped without being looked at. A line
+    opening a ``` or ~~~ fence (up to three spaces of indent, CommonMark
+    style) starts a code block, whose language is the first word of the info
+    string, and the next fence of the same character and at least the same
+    length closes it; an unclosed block runs to the end. Outside code, an
+    "Explanation" heading (``### Explanation``, ``**Explanation:**`` or
+    ``Explanation:``) turns the prose after it into the explanation, until
+    the next heading. Prose is trimmed and empty prose is left out; code
+    keeps its whitespace.
+    """
+    segments: List[Segment] = []
+    length = len(markdown)
+    prose_kind = TEXT
+    prose_start = 0
+    # (fence, start of the code, language) while inside a block
+    fence = None
+    first = FIRST_LINE.match(markdown)
+    for match in chain((first,) if first else (), LINE_START.finditer(markdown)):
+        position = match.start(1)
+        line_end = markdown.find("\n", position)
+        if line_end == -1:
+            line_end = length
+        marker = match.group(2)
+        if fence is not None:
+            opening, code_start, language = fence
+            if (
+                marker is not None
+                and marker[0] == opening[0]
+                and len(marker) >= len(opening)
+                and not markdown[match.end(2):line_end].strip()
+            ):
+                segments.append([CODE, code_start, max(code_start, position - 1), language])
+                fence = None
+                prose_start = line_end + 1
+        elif marker is not None:
+            info = markdown[match.end(2):line_end].strip()
+            # A backtick fence's info string may not contain backticks (it is inline code then)
+            if marker[0] != "`" or "`" not in info:
+                _add_prose(segments, markdown, prose_start, position, prose_kind)
+                fence = (marker, min(line_end + 1, length), info.split(" ", 1)[0] if info else "")
+        else:
+            start = match.end() - 1
+            heading = EXPLANATION_HEADING.match(markdown, start, line_end)
+            if heading is not None:
+                _add_prose(segments, markdown, prose_start, position, prose_kind)
+                prose_kind = EXPLANATION
+                # "**Explanation:** text" starts the explanation on the heading's own line
+                prose_start = heading.end()
+            elif prose_kind == EXPLANATION and OTHER_HEADING.match(markdown, start, line_end):
+                _add_prose(segments, markdown, prose_start, position, prose_kind)
+                prose_kind = TEXT
+                prose_start = position
+    if fence is not None:
+        segments.append([CODE, fence[1], length, fence[2]])
+    else:
+        _add_prose(segments, markdown, prose_start, length, prose_kind)
+    return segments
+
+
+def _add_prose(segments: List[Segment], markdown: str, start: int, end: int, kind: str) -> None:
+    prose = markdown[start:end]
+    trimmed = prose.strip()
+    if trimmed:
+        start += len(prose) - len(prose.lstrip())
+        segments.append([kind, start, start + len(trimmed), ""])
+
+
+def expand_segments(markdown: str, segments: Optional[List[Segment]] = None) -> List[Dict[str, str]]:
+    # The form returned to clients; parses the content when the segments were not stored
+    if segments is None:
+        segments = parse_segments(markdown)
+    expanded = []
+    for kind, start, end, language in segments:
+        segment = {"type": kind, "content": markdown[start:end]}
+        if kind == CODE:
+            segment["language"] = language
+        expanded.append(segment)
+    return expanded
@@ -0,0 +1,288 @@
+import itertools
+import math
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from importlib.util import find_spec
+from typing import Dict, List, Optional, Set, Tuple
+
+# The near-duplicate tier is optional; without NumPy it stays disabled. NumPy is
+# imported by the first cache that is opened rather than with this module, since
+# importing it is a noticeable part of the server's cold start
+np = None
+
+WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+CHAR_NGRAM = 3
+# Words that only frame the question ("how do I", "can you", "this") and carry no meaning
+# of their own; "to" and "from" stay, since they give a request its direction
+STOPWORDS = frozenset(
+    "a an and are as be but by can could do does for how i i'm is it me my of on or please "
+    "s should so that the this these those what whats what's which would you your".split()
+)
+# Spelled differently, meant the same
+CANONICAL = {"into": "to", "onto": "to"}
+# Words nearly every prompt here could add without changing what is asked ("write an ERC20"
+# is "write an ERC20 token contract"); they count for less
+GENERIC_WORDS = frozenset("code contract smart snippet token".split())
+GENERIC_WEIGHT = 0.35
+# Relative weight of the pieces of the vector: word order, so "solidity to python" and
+# "python to solidity" differ, and character trigrams, which only smooth over inflections
+# and typos ("attack" and "attacks") and must not outweigh the words themselves
+BIGRAM_WEIGHT = 1.0
+NGRAM_WEIGHT = 0.5
+# Pseudo-count of prompts behind every IDF weight: a nearly empty cache knows too little about
+# which words are common to weigh a word it has not seen yet above the others
+IDF_PRIOR = 100
+
+
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode())
+
+
+def normalize(word: str) -> str:
+    # Plurals and singulars are the same word ("attacks", "tokens"); "address" is not a plural
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    return CANONICAL.get(word, word)
+
+
+def extract_features(text: str) -> Tuple[Dict[int, float], Set[int]]:
+    """Hashed, weighted features of a prompt, and the word and word-pair hashes.
+
+    The features are the words left once the question's framing is dropped,
+    each pair of consecutive ones (so word order counts) and character
+    trigrams of each word; a word's trigrams together weigh ``NGRAM_WEIGHT``
+    times the word. Word and word-pair hashes feed the inverted index used
+    for candidate selection (a pair is far rarer than either word, so it
+    narrows the candidates without intersecting long lists); the weights
+    become the TF-IDF vector.
+    """
+    words = [normalize(word) for word in WORD_PATTERN.findall(text.lower())]
+    # A prompt of framing alone ("how do I?") is kept as it is
+    words = [word for word in words if word not in STOPWORDS] or words
+    # "how to prevent X" asks to prevent X; a leading "to" has no direction to give
+    if len(words) > 1 and words[0] == "to":
+        del words[0]
+    counts: Dict[int, float] = {}
+
+    def add(feature: int, weight: float) -> None:
+        counts[feature] = counts.get(feature, 0.0) + weight
+
+    weights = [GENERIC_WEIGHT if word in GENERIC_WORDS else 1.0 for word in words]
+    for word, weight in zip(words, weights):
+        add(_hash(word), weight)
+        padded = f"#{word}#"
+        grams = len(padded) - CHAR_NGRAM + 1
+        gram_weight = weight * NGRAM_WEIGHT / math.sqrt(grams)
+        for i in range(grams):
+            add(_hash(padded[i:i + CHAR_NGRAM]) ^ 0x9E3779B9, gram_weight)
+    indexed = {_hash(word) for word in words}
+    for i in range(len(words) - 1):
+        pair = _hash(f"{words[i]} {words[i + 1]}") ^ 0x7F4A7C15
+        add(pair, BIGRAM_WEIGHT * weights[i] * weights[i + 1])
+        indexed.add(pair)
+    return counts, indexed
+
+
+class SemanticCache:
+    """Second cache tier that answers near-duplicate prompts.
+
+    Prompts are embedded as signed, hashed TF-IDF vectors (see
+    :func:`extract_features`) and kept as rows of a preallocated float32 matrix. A lookup gathers candidate rows sharing one of
+    the query's rarest words under the same context key (the inverted index
+    is keyed by both, so other conversations never take up the candidate
+    budget), drops expired ones, and scores the rest with one batched
+    matrix-vector product; the best row wins if its cosine similarity
+    reaches ``threshold``. IDF weights are frozen into each row when it is
+    inserted. The matrix is allocated by :meth:`open`, or by the first ``put``.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        threshold: float,
+        ttl: float,
+        dims: int = 512,
+        max_candidates: int = 256,
+        clock=time.monotonic,
+    ):
+        self.enabled = max_entries > 0 and find_spec("numpy") is not None
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.dims = dims
+        self.max_candidates = max_candidates
+        self._clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._opened = False
+        # open() may run on a startup thread while the event loop serves a first put
+        self._open_lock = threading.Lock()
+
+    def open(self) -> None:
+        global np
+        with self._open_lock:
+            if self._opened or not self.enabled:
+                return
+            import numpy as np
+            self._vectors = np.zeros((self.max_entries, self.dims), dtype=np.float32)
+            self._contexts = np.zeros(self.max_entries, dtype=np.int64)
+            self._expires = np.zeros(self.max_entries, dtype=np.float64)
+            self._doc_freq = np.zeros(self.dims, dtype=np.float32)
+            self._responses: List[Optional[str]] = [None] * self.max_entries
+            self._row_words: List[Set[int]] = [set() for _ in range(self.max_entries)]
+            self._row_dims: List[Optional["np.ndarray"]] = [None] * self.max_entries
+            # word hash mixed with the context id -> rows containing it, oldest first (dicts
+            # keep insertion order)
+            self._postings: Dict[int, Dict[int, None]] = {}
+            self._free = list(range(self.max_entries - 1, -1, -1))
+            # Rows in least-recently-used order
+            self._lru: "OrderedDict[int, None]" = OrderedDict()
+            self._opened = True
+
+    def __len__(self) -> int:
+        return len(self._lru) if self._opened else 0
+
+    @staticmethod
+    def context_id(context_key: str) -> int:
+        # Context keys are hex digests; 63 bits are plenty to tell them apart
+        return int(context_key[:16], 16) & 0x7FFFFFFFFFFFFFFF
+
+    @staticmethod
+    def _posting_keys(words: Set[int], context: int) -> Set[int]:
+        # Two contexts can share a key only by a collision, which the context check in get()
+        # catches; it costs no more than the word alone
+        return {word ^ context for word in words}
+
+    def _vectorize(self, counts: Dict[int, float]) -> Tuple["np.ndarray", "np.ndarray"]:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for feature, weight in counts.items():
+            sign = 1.0 if feature & 0x80000000 else -1.0
+            vector[feature % self.dims] += sign * weight
+        present = np.flatnonzero(vector)
+        documents = len(self._lru)
+        vector[present] *= np.log((documents + IDF_PRIOR) / (self._doc_freq[present] + IDF_PRIOR)) + 1
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector, present
+
+    def similarity(self, first: str, second: str) -> float:
+        # Cosine similarity of two prompts as a lookup would score them, with the IDF
+        # weights of what is cached now
+        if not self._opened:
+            self.open()
+        first_vector, _ = self._vectorize(extract_features(first)[0])
+        second_vector, _ = self._vectorize(extract_features(second)[0])
+        return float(first_vector @ second_vector)
+
+    def _candidates(self, words: Set[int]) -> List[int]:
+        # Rare words are the discriminative ones and their posting lists are short. While
+        # the rarest list is over budget, narrow it to rows that also hold the next rarest
+        # word; any budget left goes to the most recent rows of the other lists.
+        postings = sorted((self._postings[w] for w in words if w in self._postings), key=len)
+        if not postings:
+            return []
+        narrowed = postings[0].keys()
+        for rows in postings[1:]:
+            if len(narrowed) <= self.max_candidates:
+                break
+            # Walks the shorter list, not the longer one the way ``keys() & keys()`` would
+            both = [row for row in narrowed if row in rows]
+            if not both:
+                break
+            narrowed = both
+        candidates = dict.fromkeys(itertools.islice(narrowed, self.max_candidates))
+        for rows in postings:
+            budget = self.max_candidates - len(candidates)
+            if budget <= 0:
+                break
+            candidates.update(dict.fromkeys(itertools.islice(reversed(rows), budget)))
+        return list(candidates)
+
+    def get(self, prompt: str, context_key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if not self._opened:
+            # Nothing has been put yet
+            self.misses += 1
+            return None
+        counts, words = extract_features(prompt)
+        context = self.context_id(context_key)
+        rows = self._candidates(self._posting_keys(words, context))
+        if rows:
+            rows = np.asarray(rows, dtype=np.intp)
+            rows = rows[self._contexts[rows] == context]
+            # Expired rows go before scoring, so one cannot hide a live match nearly as good
+            expired = self._expires[rows] <= self._clock()
+            for row in rows[expired].tolist():
+                self._remove(row)
+            rows = rows[~expired]
+        if len(rows) == 0:
+            self.misses += 1
+            return None
+        query, _ = self._vectorize(counts)
+        scores = self._vectors[rows] @ query
+        best = int(np.argmax(scores))
+        row = int(rows[best])
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        self._lru.move_to_end(row)
+        self.hits += 1
+        return self._responses[row]
+
+    def put(self, prompt: str, context_key: str, response: str) -> None:
+        if not self.enabled:
+            return
+        if not self._opened:
+            self.open()
+        counts, words = extract_features(prompt)
+        if not counts:
+            return
+        if not self._free:
+            self._remove(next(iter(self._lru)))
+            self.evictions += 1
+        row = self._free.pop()
+        vector, present = self._vectorize(counts)
+        context = self.context_id(context_key)
+        words = self._posting_keys(words, context)
+        self._vectors[row] = vector
+        self._contexts[row] = context
+        self._expires[row] = self._clock() + self.ttl
+        self._responses[row] = response
+        self._row_words[row] = words
+        self._row_dims[row] = present
+        self._doc_freq[present] += 1
+        for word in words:
+            self._postings.setdefault(word, {})[row] = None
+        self._lru[row] = None
+
+    def _remove(self, row: int) -> None:
+        del self._lru[row]
+        for word in self._row_words[row]:
+            rows = self._postings[word]
+            rows.pop(row, None)
+            if not rows:
+                del self._postings[word]
+        self._doc_freq[self._row_dims[row]] -= 1
+        self._vectors[row] = 0
+        self._responses[row] = None
+        self._row_words[row] = set()
+        self._row_dims[row] = None
+        self._free.append(row)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
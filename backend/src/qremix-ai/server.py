@@ -1,36 +1,407 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import os
-from groq import Groq
+import json
+import uuid
+import hashlib
+import time
+import asyncio
+from bisect import bisect_right
+from contextlib import AsyncExitStack, asynccontextmanager
+import threading
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple
 import re
 from fastapi.middleware.cors import CORSMiddleware
+from admission import AdmissionController, Overloaded
+from concurrency_limit import AIMDLimit, FixedLimit
+from compaction import HistoryCompactor, unsummarized
+from fast_path import ACKNOWLEDGEMENTS, IntentClassifier
+from hedging import HedgePolicy
+from history_backends import open_history_backend
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, RequestMetricsMiddleware, sample_event_loop_lag
+from rate_limits import RateLimitPacer, Reservation
+import request_timing
+from request_timing import RequestTiming
+from resilience import CircuitBreaker, RetryPolicy
+from response_cache import ResponseCache
+from retrieval import Retriever, watch as watch_sources
+from segments import expand_segments, parse_segments
+from semantic_cache import SemanticCache
+from singleflight import SingleFlight
+from token_budget import estimate_tokens, message_tokens, pack_newest_first
+from workspace import MirroredFile, MissingReferences, WorkspaceConflict, WorkspaceMirror, WorkspaceTooLarge, language_of
 
 # Load environment variables
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 PORT = int(os.getenv("PORT", 5000))
+# Chat history is kept per browser session
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "qremix_session"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+# Global memory budget shared by all sessions, and how long an idle session is kept
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", 256 * 1024 * 1024))
+# Where history lives: memory:// (single worker only), sqlite:///history.db (workers on
+# one host) or redis://host:6379/0 (any number of hosts)
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "memory://")
+# The memory backend logs every change here and replays it on startup (empty disables);
+# HISTORY_LOG_FSYNC=0 trades the last few turns on a power cut for faster appends
+HISTORY_LOG_DIR = os.getenv("HISTORY_LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history"))
+HISTORY_LOG_FSYNC = os.getenv("HISTORY_LOG_FSYNC", "1") != "0"
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 2 * 60 * 60))
+# Exact-match cache of cleaned responses; send X-Cache-Bypass: 1 to skip both tiers
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10_000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 60 * 60))
+# Near-duplicate tier behind the exact cache (needs NumPy; 0 entries disables it)
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 20_000))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.9))
+CACHE_BYPASS_HEADER = "X-Cache-Bypass"
+# Per-session mirror of the editor's files (PUT/PATCH /workspace/files), so chat messages
+# reference code by content hash instead of pasting it; idle workspaces expire with
+# SESSION_IDLE_TTL. REFERENCE_TOKEN_BUDGET caps the code one message can pull in
+WORKSPACE_MAX_BYTES = int(os.getenv("WORKSPACE_MAX_BYTES", 128 * 1024 * 1024))
+WORKSPACE_MAX_SESSION_BYTES = int(os.getenv("WORKSPACE_MAX_SESSION_BYTES", 8 * 1024 * 1024))
+WORKSPACE_MAX_FILE_BYTES = int(os.getenv("WORKSPACE_MAX_FILE_BYTES", 512 * 1024))
+REFERENCE_TOKEN_BUDGET = int(os.getenv("REFERENCE_TOKEN_BUDGET", 3000))
+MAX_REFERENCES = 16
+# Code relevant to each question is found by BM25 over the .sol files under RETRIEVAL_DIRS
+# (rescanned every RETRIEVAL_RESCAN_INTERVAL seconds) and the session's mirrored ones; up
+# to RETRIEVAL_TOP_K chunks scoring at least RETRIEVAL_MIN_SCORE go into the prompt within
+# RETRIEVAL_TOKEN_BUDGET. RETRIEVAL=0 disables it
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".."))
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL", "1") != "0"
+RETRIEVAL_DIRS = [path for path in os.getenv("RETRIEVAL_DIRS", os.pathsep.join([
+    os.path.join(PROJECT_ROOT, "backend", "contracts"),
+    os.path.join(PROJECT_ROOT, "frontend", "contracts"),
+])).split(os.pathsep) if path]
+RETRIEVAL_RESCAN_INTERVAL = float(os.getenv("RETRIEVAL_RESCAN_INTERVAL", 5))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 4))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", 2.5))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", 1200))
+RETRIEVAL_MAX_SESSIONS = 1000
+# Small talk (greetings, thanks, "ok", "help") is answered locally with X-Cache: LOCAL
+# instead of calling Groq; prompts only the fallback model recognises need at least
+# FAST_PATH_THRESHOLD confidence. FAST_PATH=0 disables it, X-Cache-Bypass skips it
+FAST_PATH_ENABLED = os.getenv("FAST_PATH", "1") != "0"
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", 0.9))
+# Admission control in front of Groq: a limited number of calls at once and
+# UPSTREAM_MAX_QUEUE waiting up to UPSTREAM_QUEUE_TIMEOUT seconds; beyond that, 503.
+# The limit adapts to Groq's latency between the min and max unless
+# UPSTREAM_ADAPTIVE_LIMIT=0, in which case it stays at UPSTREAM_MAX_IN_FLIGHT
+UPSTREAM_ADAPTIVE_LIMIT = os.getenv("UPSTREAM_ADAPTIVE_LIMIT", "1") != "0"
+UPSTREAM_MIN_IN_FLIGHT = int(os.getenv("UPSTREAM_MIN_IN_FLIGHT", 4))
+UPSTREAM_INITIAL_IN_FLIGHT = int(os.getenv("UPSTREAM_INITIAL_IN_FLIGHT", 16))
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", 64))
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", 256))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 5))
+# One connection pool to Groq shared by every client, with a connection for each call the
+# admission controller can let through. Idle connections are dropped after
+# UPSTREAM_KEEPALIVE_EXPIRY seconds, before Groq's edge would close them under us, and
+# UPSTREAM_WARM_CONNECTIONS of them are opened at startup and refreshed while idle
+# (0 disables). UPSTREAM_HTTP2=1 multiplexes calls over fewer connections (needs h2)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", UPSTREAM_MAX_IN_FLIGHT))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 30))
+UPSTREAM_WARM_CONNECTIONS = int(os.getenv("UPSTREAM_WARM_CONNECTIONS", 4))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "0") == "1"
+# Calls wait for Groq's request/token quota to refill rather than hit a 429, but
+# never longer than this; beyond it the request gets a 503 with Retry-After
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 10))
+CACHE_STATUS_HEADER = "X-Cache"
+# Every chat response has a Server-Timing header; send X-Timing: 1 to also get the
+# breakdown in the body (for streams, in the final event, once it is complete)
+SERVER_TIMING_HEADER = "Server-Timing"
+TIMING_REQUEST_HEADER = "X-Timing"
+FRONTEND_ORIGINS = ["http://localhost:3000"]  # Next.js frontend origin
 
-# Initialize FastAPI app and Groq client
-app = FastAPI(title="QRemix AI Assistant - Llama3 on Groq")
-client = Groq(api_key=GROQ_API_KEY)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # uvicorn binds the port only once this yields, so slow setup runs in the background:
+    # /health answers straight away and /ready once warm_up() has finished. Locking the
+    # history log is quick and stops startup if another worker already has it
+    history_store.lock()
+    app.state.warm_up = asyncio.create_task(warm_up())
+    lag_sampler = asyncio.create_task(sample_event_loop_lag(event_loop_lag, EVENT_LOOP_LAG_INTERVAL))
+    try:
+        yield
+    finally:
+        lag_sampler.cancel()
+        app.state.warm_up.cancel()
+        for task in ("keep_warm", "watch_sources"):
+            if getattr(app.state, task, None) is not None:
+                getattr(app.state, task).cancel()
+        # Lets the SQLite backend commit appends still waiting for their batch
+        await history_store.close()
+        if _upstream_http is not None:
+            await _upstream_http.aclose()
+
+# Initialize FastAPI app; Groq clients are created by get_client()
+app = FastAPI(title="QRemix AI Assistant - Llama3 on Groq", lifespan=lifespan)
+_clients: Dict[Optional[str], Any] = {}
+_upstream_http = None
+_upstream_transport = None
+_client_lock = threading.Lock()
+
+def get_client(api_key: Optional[str] = None):
+    # One client per API key (GROQ_API_KEY unless hedges use their own), built on first use
+    # or by warm_up: importing groq is a large share of the import time of this module, and
+    # a missing GROQ_API_KEY should fail readiness, not the import.
+    # The async client keeps the event loop free while requests to Groq are in flight.
+    # The SDK's own retries are off: retry_policy makes them, within the deadline and
+    # behind the circuit breaker
+    api_key = api_key or GROQ_API_KEY
+    client = _clients.get(api_key)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                from groq import AsyncGroq
+                client = _clients[api_key] = AsyncGroq(
+                    api_key=api_key, http_client=upstream_http_client(), max_retries=0
+                )
+    return client
+
+def upstream_http_client():
+    # The pool behind every Groq client (the API key is a per-request header); only
+    # called by get_client() with _client_lock held
+    global _upstream_http, _upstream_transport
+    if _upstream_http is None:
+        import httpx
+        from groq import DefaultAsyncHttpxClient
+        from upstream_http import InstrumentedTransport
+        _upstream_transport = InstrumentedTransport(
+            on_connection=record_connection,
+            http2=UPSTREAM_HTTP2,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+        )
+        # The SDK's subclass keeps its timeout and redirect defaults
+        _upstream_http = DefaultAsyncHttpxClient(transport=_upstream_transport)
+    return _upstream_http
 
 # Add CORS middleware to handle preflight OPTIONS requests
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # Next.js frontend origin
+    allow_origins=FRONTEND_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],  # Explicitly allow OPTIONS
+    # PUT, PATCH and DELETE are the editor syncing /workspace/files
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[SESSION_HEADER, "ETag", CACHE_STATUS_HEADER, "Retry-After", SERVER_TIMING_HEADER],
 )
 
-# In-memory chat history - store all messages
-chat_history: List[Dict[str, str]] = []
-# Only use this many messages for context in API calls to manage token limits
-MAX_CONTEXT_MESSAGES = 5
+# Prometheus metrics for the hot path, served at /metrics
+metrics = Registry()
+request_latency = metrics.histogram(
+    "qremix_request_duration_seconds", "Time from request to the last byte of the response", ["endpoint", "status"]
+)
+requests_in_flight = metrics.gauge("qremix_requests_in_flight", "Requests currently being handled")
+upstream_latency = metrics.histogram(
+    "qremix_upstream_latency_seconds",
+    "Groq call latency to the first token (for whole completions, less the time Groq spent generating)",
+    ["kind"],
+)
+queue_wait = metrics.histogram(
+    "qremix_queue_wait_seconds", "Time an upstream call waited for quota or for a slot", ["stage"]
+)
+# Children with fixed labels are looked up once rather than on every observation
+quota_wait, slot_wait = queue_wait.labels("quota"), queue_wait.labels("slot")
+context_build_time = metrics.histogram("qremix_context_build_seconds", "Time to load history and pack the prompt")
+retrieval_time = metrics.histogram("qremix_retrieval_seconds", "Time to search the project's code for a question")
+clean_response_time = metrics.histogram("qremix_clean_response_seconds", "Time spent stripping <think> spans")
+tokens_used = metrics.counter("qremix_tokens_total", "Tokens Groq reported as used", ["type"])
+prompt_tokens_used, completion_tokens_used = tokens_used.labels("prompt"), tokens_used.labels("completion")
+cache_lookups = metrics.counter("qremix_cache_lookups_total", "Chat requests by X-Cache status", ["result"])
+fast_path_checks = metrics.counter(
+    "qremix_fast_path_total", "Prompts checked by the local responder, by intent answered (llm: passed on)", ["result"]
+)
+hedged_calls = metrics.counter(
+    "qremix_hedged_calls_total", "Chat calls that got a backup call, by the call that answered first", ["winner"]
+)
+upstream_pool_wait = metrics.histogram(
+    "qremix_upstream_pool_wait_seconds", "Time a request to Groq waited for a pooled connection"
+)
+upstream_connect_time = metrics.histogram(
+    "qremix_upstream_connect_seconds", "Time to open a connection to Groq (TCP and TLS)"
+)
+upstream_requests = metrics.counter(
+    "qremix_upstream_http_requests_total", "HTTP requests to Groq by whether they opened a connection", ["connection"]
+)
+new_connection_requests, reused_connection_requests = upstream_requests.labels("new"), upstream_requests.labels("reused")
+upstream_errors = metrics.counter("qremix_upstream_errors_total", "Failed Groq calls by exception type", ["type"])
+upstream_retries = metrics.counter(
+    "qremix_upstream_retries_total", "Groq calls made again, by the exception that failed the last attempt", ["type"]
+)
+history_size = metrics.gauge("qremix_history_store_size", "Size of the history store as of the last scrape", ["measure"])
+# Sampled every EVENT_LOOP_LAG_INTERVAL seconds; sustained lag means blocking work on the loop
+event_loop_lag = metrics.histogram("qremix_event_loop_lag_seconds", "How late a timer on the event loop fired")
+EVENT_LOOP_LAG_INTERVAL = 0.1
+app.add_middleware(
+    RequestMetricsMiddleware,
+    latency=request_latency,
+    in_flight=requests_in_flight,
+    paths=["/chat", "/chat/stream", "/history", "/clear"],
+)
+
+# Upstream completion settings shared by /chat and /chat/stream
+MODEL = "llama3-8b-8192"  # Llama3 model
+MAX_TOKENS = 2000  # Increased token limit
+# Server-Timing phases, in milliseconds; the groq-* ones are Groq's own account of the call
+TIMING_DESCRIPTIONS = {
+    "workspace": "Expand code referenced from the workspace",
+    "retrieval": "Search the project's code for the question",
+    "context": "Load history and pack the prompt",
+    "fast-path": "Check for small talk answered locally",
+    "cache": "Response cache lookup",
+    "quota": "Wait for Groq rate limit quota",
+    "queue": "Wait for an upstream slot",
+    "pool": "Wait for a connection to Groq",
+    "connect": "Open a connection to Groq",
+    "groq": "Groq call as seen by the server",
+    "groq-queue": "Queued at Groq",
+    "groq-prompt": "Prompt processing at Groq",
+    "groq-completion": "Generation at Groq",
+    "shared": "Wait for an identical request already upstream",
+    "clean": "Strip <think> spans",
+    "history": "Store the turn",
+}
+TEMPERATURE = 0.5
+UPSTREAM_TIMEOUT = 30  # Increased timeout
+# Hedging for /chat: a Groq call still running after the HEDGE_PERCENTILE latency of
+# recent calls gets a backup call to HEDGE_MODEL (with HEDGE_GROQ_API_KEY, if set); the
+# first answer wins and the other call is cancelled. Backup calls are capped at
+# HEDGE_BUDGET of all calls and only use spare slots and quota. HEDGE=0 disables it
+HEDGE_ENABLED = os.getenv("HEDGE", "1") != "0"
+HEDGE_MODEL = os.getenv("HEDGE_MODEL", MODEL)
+HEDGE_GROQ_API_KEY = os.getenv("HEDGE_GROQ_API_KEY")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0.95))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", 0.05))
+# A Groq call that fails before answering (connection error, 5xx or 429) is made again, up
+# to UPSTREAM_MAX_ATTEMPTS times in all, after a jittered sleep between
+# UPSTREAM_RETRY_BASE_DELAY and UPSTREAM_RETRY_MAX_DELAY seconds, unless the sleep would
+# end past UPSTREAM_DEADLINE seconds from the first attempt
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", 3))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", 0.1))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", 1))
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", UPSTREAM_TIMEOUT))
+# After CIRCUIT_FAILURE_THRESHOLD connection errors, timeouts or 5xx in a row, calls get a
+# 503 without trying Groq for CIRCUIT_RESET_TIMEOUT seconds; then one call probes it
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 10))
+# Context window of the model; the prompt is packed into what is left after
+# reserving MAX_TOKENS for the answer and a margin for tokenizer estimate error
+CONTEXT_WINDOW = 8192
+CONTEXT_SAFETY_MARGIN = 256
+# Once a session's older messages pass this many tokens they are folded into a
+# running summary in the background, keeping roughly the newest
+# SUMMARY_KEEP_RECENT_TOKENS verbatim
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", 2000))
+SUMMARY_KEEP_RECENT_TOKENS = int(os.getenv("SUMMARY_KEEP_RECENT_TOKENS", 2000))
+SUMMARY_MAX_TOKENS = 400
 # But store up to this many messages for display purposes
 MAX_STORED_MESSAGES = 100
+# Default page size for GET /history
+HISTORY_PAGE_SIZE = 50
+
+# Chat history, one conversation per session
+history_store = open_history_backend(
+    HISTORY_BACKEND,
+    max_bytes=HISTORY_MAX_BYTES,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_messages=MAX_STORED_MESSAGES,
+    log_dir=HISTORY_LOG_DIR,
+    log_fsync=HISTORY_LOG_FSYNC,
+)
+
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    ttl=RESPONSE_CACHE_TTL,
+)
+semantic_cache = SemanticCache(
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl=RESPONSE_CACHE_TTL,
+)
+workspace_mirror = WorkspaceMirror(
+    max_bytes=WORKSPACE_MAX_BYTES,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_file_bytes=WORKSPACE_MAX_FILE_BYTES,
+    max_session_bytes=WORKSPACE_MAX_SESSION_BYTES,
+)
+retriever = Retriever(
+    roots=RETRIEVAL_DIRS,
+    label_root=PROJECT_ROOT,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_sessions=RETRIEVAL_MAX_SESSIONS,
+)
+# Identical concurrent cache misses share one upstream call
+inflight = SingleFlight()
+intent_classifier = IntentClassifier(threshold=FAST_PATH_THRESHOLD)
+
+def is_overload_error(error: BaseException) -> bool:
+    # Signals that Groq is saturated, as opposed to a problem with the request itself;
+    # upstream errors only happen once get_client() has imported groq
+    from groq import APIConnectionError, APIStatusError, APITimeoutError
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+def is_outage(error: BaseException) -> bool:
+    # Groq could not be reached or failed on its side; a 429 or a rejected request still
+    # shows it is up
+    from groq import APIConnectionError, APIStatusError
+    return isinstance(error, APIConnectionError) or (isinstance(error, APIStatusError) and error.status_code >= 500)
+
+def is_retryable(error: BaseException) -> bool:
+    # Groq did no work for the call, or asked for it to be made again. A 429 surfaces as
+    # Overloaded caused by it (the pacer then waits for quota); the admission controller's,
+    # the pacer's and the circuit breaker's own rejections have no cause and are final.
+    # A timeout has used up the time a retry would need
+    from groq import APIStatusError, APITimeoutError
+    if isinstance(error, Overloaded):
+        return isinstance(error.__cause__, APIStatusError)
+    return is_outage(error) and not isinstance(error, APITimeoutError)
+
+admission = AdmissionController(
+    limiter=AIMDLimit(
+        initial=UPSTREAM_INITIAL_IN_FLIGHT,
+        min_limit=UPSTREAM_MIN_IN_FLIGHT,
+        max_limit=UPSTREAM_MAX_IN_FLIGHT,
+    ) if UPSTREAM_ADAPTIVE_LIMIT else FixedLimit(UPSTREAM_MAX_IN_FLIGHT),
+    max_queue=UPSTREAM_MAX_QUEUE,
+    queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+    is_drop=is_overload_error,
+)
+pacer = RateLimitPacer(max_wait=RATE_LIMIT_MAX_WAIT)
+# Groq's quota is per key and model, so hedges to the primary's model with the primary's
+# key draw on the same one; either way a hedge never waits for quota
+hedge_pacer = (
+    pacer if HEDGE_MODEL == MODEL and HEDGE_GROQ_API_KEY in (None, GROQ_API_KEY) else RateLimitPacer(max_wait=0)
+)
+hedging = HedgePolicy(percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET)
+retry_policy = RetryPolicy(
+    max_attempts=UPSTREAM_MAX_ATTEMPTS,
+    base_delay=UPSTREAM_RETRY_BASE_DELAY,
+    max_delay=UPSTREAM_RETRY_MAX_DELAY,
+    is_retryable=is_retryable,
+    on_retry=lambda error, delay: upstream_retries.labels(
+        type(error.__cause__ if isinstance(error, Overloaded) else error).__name__
+    ).inc(),
+)
+breaker = CircuitBreaker(failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT)
+metrics.gauge("qremix_workspace_bytes", "Size of the mirrored editor files", function=lambda: workspace_mirror.total_bytes)
+metrics.gauge("qremix_upstream_in_flight", "Groq calls currently holding a slot", function=lambda: admission.in_flight)
+metrics.gauge("qremix_upstream_limit", "Current limit on concurrent Groq calls", function=lambda: admission.limit)
+metrics.gauge(
+    "qremix_upstream_circuit_open", "1 while Groq calls fail fast (circuit open or half-open)",
+    function=lambda: int(breaker.state != "closed"),
+)
 
 SYSTEM_PROMPT = (
     "You are QRemix AI, a coding assistant for Solidity, Python, and JavaScript. "
@@ -44,62 +415,869 @@ SYSTEM_PROMPT = (
     "followed by an **Explanation** section. For debugging (e.g., 'debug this'), return the corrected "
     "code in a markdown block followed by an **Explanation** section. Use markdown for code blocks."
 )
+RETRIEVAL_PROMPT = (
+    "Code from the user's project that may be relevant to the next question. "
+    "Use it if it helps; it may also be unrelated."
+)
+CONTEXT_TOKEN_BUDGET = CONTEXT_WINDOW - MAX_TOKENS - CONTEXT_SAFETY_MARGIN - message_tokens(SYSTEM_PROMPT)
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below so it can replace the original messages as context for "
+    "later turns. Keep the names of contracts, functions, variables and files, error messages, "
+    "code decisions and open questions; drop greetings and pleasantries. "
+    "Reply with the summary only, in at most a few short paragraphs."
+)
+SUMMARY_INPUT_BUDGET = CONTEXT_WINDOW - SUMMARY_MAX_TOKENS - CONTEXT_SAFETY_MARGIN - message_tokens(SUMMARY_PROMPT)
 
 def clean_response(response: str) -> str:
-    return re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
+    started = time.perf_counter()
+    cleaned = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
+    elapsed = time.perf_counter() - started
+    clean_response_time.observe(elapsed)
+    request_timing.record("clean", elapsed)
+    return cleaned
+
+class ThinkStripper:
+    # Streaming counterpart of clean_response: feed chunks as they arrive and get back
+    # only the text outside <think>...</think>, even when a tag is split across chunks.
+    # An unterminated <think> span is suppressed rather than emitted.
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._pending = ""
+        self._in_think = False
+        self._started = False
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        # Length of the longest suffix of text that is a proper prefix of tag
+        for size in range(min(len(text), len(tag) - 1), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def feed(self, chunk: str) -> str:
+        self._pending += chunk
+        output = []
+        while self._pending:
+            if self._in_think:
+                end = self._pending.find(self.CLOSE_TAG)
+                if end == -1:
+                    keep = self._partial_tag_length(self._pending, self.CLOSE_TAG)
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                self._pending = self._pending[end + len(self.CLOSE_TAG):]
+                self._in_think = False
+            else:
+                start = self._pending.find(self.OPEN_TAG)
+                if start == -1:
+                    keep = self._partial_tag_length(self._pending, self.OPEN_TAG)
+                    output.append(self._pending[:len(self._pending) - keep])
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                output.append(self._pending[:start])
+                self._pending = self._pending[start + len(self.OPEN_TAG):]
+                self._in_think = True
+        return self._emit("".join(output))
+
+    def flush(self) -> str:
+        # Release a held-back partial "<think" prefix once the stream has ended
+        remainder = "" if self._in_think else self._pending
+        self._pending = ""
+        return self._emit(remainder)
+
+    def _emit(self, text: str) -> str:
+        # Match clean_response's leading strip()
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+def request_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    # Groq counts the whole prompt plus the requested completion against the token quota
+    return sum(message_tokens(message["content"]) for message in messages) + max_tokens
+
+@asynccontextmanager
+async def upstream_call(
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    kind: str = "call",
+    quota: Optional[RateLimitPacer] = None,
+    deadline: Optional[float] = None,
+    max_quota_wait: Optional[float] = None,
+):
+    # Quota pacing comes before taking a slot, so time spent waiting for quota neither
+    # blocks a slot nor counts as upstream latency. While Groq is down neither is waited for
+    probe = breaker.check()
+    started = time.perf_counter()
+    try:
+        reservation = await (quota or pacer).acquire(request_tokens(messages, max_tokens), max_quota_wait)
+    except BaseException:
+        # Turned away before reaching Groq, so the probe (if this was one) learnt nothing;
+        # the next call probes instead of every call waiting for it to expire
+        breaker.release(probe)
+        raise
+    paced = time.perf_counter()
+    quota_wait.observe(paced - started)
+    request_timing.record("quota", paced - started)
+    try:
+        async with admission.slot(kind=kind) as timer:
+            admitted = time.perf_counter()
+            slot_wait.observe(admitted - paced)
+            request_timing.record("queue", admitted - paced)
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Overloaded("deadline passed while waiting for quota and a slot", 1)
+            try:
+                yield timer, reservation
+            except Exception as e:
+                # A 429 surfaces as Overloaded; count the Groq error behind it
+                cause = e.__cause__ if isinstance(e, Overloaded) and e.__cause__ is not None else e
+                upstream_errors.labels(type(cause).__name__).inc()
+                if is_outage(cause):
+                    breaker.record_failure(probe)
+                else:
+                    breaker.record_success(probe)
+                raise
+            else:
+                breaker.record_success(probe)
+            finally:
+                held = time.perf_counter() - admitted
+                upstream_latency.labels(kind).observe(timer.latency if timer.latency is not None else held)
+                request_timing.record("groq", held)
+    except BaseException:
+        # A no-op once the call reported its outcome
+        breaker.release(probe)
+        raise
+    finally:
+        reservation.release()
+
+def time_left(deadline: float) -> float:
+    # The timeout for a call admitted now: the wait for quota and a slot used up part of it
+    return min(UPSTREAM_TIMEOUT, deadline - time.monotonic())
+
+def record_connection(waited: float, connecting: Optional[float]) -> None:
+    # Called by the transport from the task that sent the request, so the phases land in
+    # that request's Server-Timing
+    upstream_pool_wait.observe(waited)
+    request_timing.record("pool", waited)
+    if connecting is None:
+        reused_connection_requests.inc()
+    else:
+        new_connection_requests.inc()
+        upstream_connect_time.observe(connecting)
+        request_timing.record("connect", connecting)
+
+def record_usage(usage) -> None:
+    # Streams only report usage on their last chunk, and a mock or proxy may omit it
+    if usage is not None:
+        prompt_tokens_used.inc(usage.prompt_tokens)
+        completion_tokens_used.inc(usage.completion_tokens)
+        for phase, seconds in (
+            ("groq-queue", usage.queue_time),
+            ("groq-prompt", usage.prompt_time),
+            ("groq-completion", usage.completion_time),
+        ):
+            if seconds is not None:
+                request_timing.record(phase, seconds)
+
+async def create_completion(reservation: Reservation, api_key: Optional[str] = None, **params):
+    client = get_client(api_key)
+    from groq import APIStatusError  # already imported by get_client()
+    reservation.sent = True
+    try:
+        raw = await client.chat.completions.with_raw_response.create(**params)
+    except APIStatusError as e:
+        reservation.settle(e.response.headers, throttled=e.status_code == 429)
+        if e.status_code == 429:
+            raise Overloaded("upstream rate limit reached", reservation.pacer.retry_after()) from e
+        raise
+    reservation.settle(raw.headers)
+    completion = await raw.parse()
+    if not params.get("stream"):
+        record_usage(completion.usage)
+    return completion
+
+async def summarize_history(previous: Optional[str], messages: List[Dict[str, Any]]) -> str:
+    # Runs in a background task that inherited the context of the request that scheduled
+    # it; its phases are not part of that request
+    request_timing.current.set(None)
+    transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    if previous:
+        transcript = f"Earlier summary: {previous}\n\n{transcript}"
+    messages = [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}]
+    async with upstream_call(messages, SUMMARY_MAX_TOKENS, kind="summary") as (_, reservation):
+        chat_completion = await create_completion(
+            reservation,
+            messages=messages,
+            model=MODEL,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0.2,
+            timeout=UPSTREAM_TIMEOUT,
+        )
+    return clean_response(chat_completion.choices[0].message.content)
+
+compactor = HistoryCompactor(
+    history_store,
+    summarize_history,
+    trigger_tokens=SUMMARY_TRIGGER_TOKENS,
+    keep_recent_tokens=SUMMARY_KEEP_RECENT_TOKENS,
+    input_budget=SUMMARY_INPUT_BUDGET,
+)
+
+def new_message(role: str, content: str) -> Dict[str, Any]:
+    # Token counts are computed once here so building a context is just a running sum;
+    # likewise answers are split into segments once and stored with them
+    message = {"role": role, "content": content, "tokens": message_tokens(content)}
+    if role == "assistant":
+        message["segments"] = parse_segments(content)
+    return message
+
+def public_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    public = {"id": message["id"], "role": message["role"], "content": message["content"]}
+    # Prose, code blocks with their language and the Explanation section, so clients need
+    # not parse the markdown; messages stored before segments were are parsed here
+    if message["role"] == "assistant":
+        public["segments"] = expand_segments(message["content"], message.get("segments"))
+    if message.get("references"):
+        public["references"] = message["references"]
+    return public
+
+async def finish_turn(
+    session_id: str, question: Dict[str, Any], response: str
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # The turn is only stored once it has an answer, so a rejected request leaves no trace;
+    # both messages go to the backend in one append
+    started = time.perf_counter()
+    user_message, assistant_message = await history_store.append(
+        session_id, [dict(question), new_message("assistant", response)]
+    )
+    request_timing.record("history", time.perf_counter() - started)
+    # A completed turn may push older messages over the summary threshold
+    compactor.schedule(session_id)
+    return user_message, assistant_message
+
+def fenced(label: str, language: str, code: str) -> str:
+    # A fence longer than any run of backticks in the code, so the code cannot close it
+    fence = "```"
+    while fence in code:
+        fence += "`"
+    return f"{label}:\n{fence}{language}\n{code}\n{fence}"
+
+def line_range(first: int, last: int) -> str:
+    return f"line {first}" if first == last else f"lines {first}-{last}"
+
+def relevant_code(session_id: str, query: str) -> Optional[Dict[str, Any]]:
+    # The best matching chunks that fit the budget, as a system message, or None
+    started = time.perf_counter()
+    found = retriever.search(
+        session_id, workspace_mirror.files(session_id), query, RETRIEVAL_TOP_K, RETRIEVAL_MIN_SCORE
+    )
+    blocks = []
+    tokens = message_tokens(RETRIEVAL_PROMPT)
+    for _, chunk in found:
+        label = f"{chunk.path}, {chunk.name} ({line_range(chunk.start_line, chunk.end_line)})"
+        block = fenced(label, "solidity", chunk.text)
+        cost = estimate_tokens(block)
+        # A chunk too big for what is left may still leave room for a smaller one
+        if tokens + cost <= RETRIEVAL_TOKEN_BUDGET:
+            blocks.append(block)
+            tokens += cost
+    elapsed = time.perf_counter() - started
+    retrieval_time.observe(elapsed)
+    request_timing.record("retrieval", elapsed)
+    return new_message("system", "\n\n".join([RETRIEVAL_PROMPT, *blocks])) if blocks else None
+
+async def build_context(
+    session_id: str, question: Dict[str, Any], query: Optional[str] = None
+) -> List[Dict[str, str]]:
+    # ``query`` is what to look up project code for; it is not stored, so every turn gets
+    # the code relevant to it
+    code = relevant_code(session_id, query) if query and RETRIEVAL_ENABLED else None
+    started = time.perf_counter()
+    # Messages already folded into the running summary are represented by it instead
+    stored, summary = await history_store.load(session_id)
+    messages = unsummarized(stored, summary) + [question]
+    budget = CONTEXT_TOKEN_BUDGET - (summary["tokens"] if summary else 0) - (code["tokens"] if code else 0)
+    
+    # Pack the newest messages that fit the model's window once the answer is reserved
+    context_messages = pack_newest_first(messages, budget)
+    
+    # Prepare messages for API call; stored messages carry ids Groq doesn't accept
+    preamble = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if summary:
+        preamble.append({"role": "system", "content": summary["content"]})
+    if code:
+        preamble.append({"role": "system", "content": code["content"]})
+    context = preamble + [
+        {"role": message["role"], "content": prompt_content(session_id, message)} for message in context_messages
+    ]
+    elapsed = time.perf_counter() - started
+    context_build_time.observe(elapsed)
+    request_timing.record("context", elapsed)
+    return context
+
+def reference_block(file: MirroredFile, snippet: str, first: int, last: int) -> str:
+    where = file.path if first == 1 and last == file.line_count else f"{file.path} ({line_range(first, last)})"
+    return fenced(where, language_of(file.path), snippet)
+
+def new_question(session_id: str, message: str, references: List["Reference"]) -> Dict[str, Any]:
+    # The user's turn as typed, with the workspace code it references kept as a list of
+    # references; every one must resolve now. The code is only put into the prompt sent to
+    # Groq (see prompt_content), but its tokens are counted with the question's
+    question = new_message("user", message)
+    if not references:
+        return question
+    started = time.perf_counter()
+    resolved = workspace_mirror.resolve(
+        session_id, [(reference.hash, reference.start_line, reference.end_line) for reference in references]
+    )
+    tokens = 0
+    for file, snippet, first, last in resolved:
+        tokens += estimate_tokens(reference_block(file, snippet, first, last))
+    if tokens > REFERENCE_TOKEN_BUDGET:
+        raise HTTPException(
+            status_code=413,
+            detail=f"The referenced code is too long ({tokens} tokens, limit {REFERENCE_TOKEN_BUDGET}). "
+            "Please reference a smaller line range.",
+        )
+    question["references"] = [
+        {"hash": reference.hash, "path": file.path, "start_line": reference.start_line, "end_line": reference.end_line}
+        for reference, (file, *_) in zip(references, resolved)
+    ]
+    question["tokens"] += tokens
+    request_timing.record("workspace", time.perf_counter() - started)
+    return question
+
+def prompt_content(session_id: str, message: Dict[str, Any]) -> str:
+    # A question with the code it referenced as fenced blocks ahead of it. A file edited
+    # since an earlier turn no longer has the hash it was referenced by, so that turn only
+    # says which file it was about
+    references = message.get("references")
+    if not references:
+        return message["content"]
+    blocks = []
+    for reference in references:
+        file = workspace_mirror.lookup(session_id, reference["hash"])
+        if file is None:
+            blocks.append(f"{reference['path']}: (edited since, no longer available)")
+        else:
+            blocks.append(reference_block(file, *file.lines(reference["start_line"], reference["end_line"])))
+    return "\n\n".join(blocks + [message["content"]])
+
+async def answer_locally(session_id: str, question: Dict[str, Any], use_cache: bool) -> Optional[str]:
+    # A canned answer for small talk, or None when Groq should answer; a question with
+    # code attached is never small talk
+    if not FAST_PATH_ENABLED or not use_cache or question.get("references"):
+        return None
+    started = time.perf_counter()
+    prompt = question["content"]
+    intent, confidence = intent_classifier.classify(prompt)
+    if intent in ACKNOWLEDGEMENTS:
+        # "ok" means "yes" when the last answer asked something; only these prompts pay
+        # for reading the history
+        stored, _ = await history_store.load(session_id)
+        previous = next((message["content"] for message in reversed(stored) if message["role"] == "assistant"), None)
+        intent, confidence = intent_classifier.classify(prompt, previous)
+    intent, answer = intent_classifier.record(intent, confidence)
+    fast_path_checks.labels(intent or "llm").inc()
+    request_timing.record("fast-path", time.perf_counter() - started)
+    return answer
+
+def cache_key(messages: List[Dict[str, str]]) -> str:
+    return ResponseCache.make_key(MODEL, messages, TEMPERATURE, MAX_TOKENS)
 
-def get_groq_llama_response(prompt: str) -> str:
-    chat_history.append({"role": "user", "content": prompt})
-    if len(chat_history) > MAX_STORED_MESSAGES:
-        chat_history[:] = chat_history[-MAX_STORED_MESSAGES:]
+def lookup_cache(messages: List[Dict[str, str]], use_cache: bool) -> Tuple[Optional[str], str]:
+    # Returns the cached response (or None) and the X-Cache status to report
+    started = time.perf_counter()
+    cached, cache_status = find_cached(messages, use_cache)
+    request_timing.record("cache", time.perf_counter() - started)
+    return cached, cache_status
+
+def find_cached(messages: List[Dict[str, str]], use_cache: bool) -> Tuple[Optional[str], str]:
+    if not use_cache:
+        response_cache.bypasses += 1
+        return None, "BYPASS"
+    cached = response_cache.get(cache_key(messages))
+    if cached is not None:
+        return cached, "HIT"
+    # A reworded prompt only counts as a duplicate when the preceding context is identical
+    cached = semantic_cache.get(messages[-1]["content"], cache_key(messages[:-1]))
+    if cached is not None:
+        response_cache.put(cache_key(messages), cached)
+        return cached, "SEMANTIC"
+    return None, "MISS"
+
+def store_in_cache(messages: List[Dict[str, str]], response: str) -> None:
+    response_cache.put(cache_key(messages), response)
+    semantic_cache.put(messages[-1]["content"], cache_key(messages[:-1]), response)
+
+async def complete(messages: List[Dict[str, str]], model: str = MODEL, hedge: bool = False) -> str:
+    async def attempt(remaining: float) -> str:
+        deadline = time.monotonic() + remaining
+        async with upstream_call(
+            messages,
+            MAX_TOKENS,
+            kind="hedge" if hedge else "call",
+            quota=hedge_pacer if hedge else None,
+            deadline=deadline,
+            max_quota_wait=0 if hedge else None,
+        ) as (timer, reservation):
+            chat_completion = await create_completion(
+                reservation,
+                api_key=HEDGE_GROQ_API_KEY if hedge else None,
+                messages=messages,
+                model=model,
+                max_tokens=MAX_TOKENS,
+                temperature=TEMPERATURE,
+                timeout=time_left(deadline),
+            )
+            # The latency signal leaves out generating the answer, which grows with its length
+            usage = chat_completion.usage
+            if usage is not None and usage.completion_time is not None:
+                timer.mark(generating=usage.completion_time)
+        return chat_completion.choices[0].message.content
     
-    # Use only the most recent messages for context
-    context_messages = chat_history[-MAX_CONTEXT_MESSAGES:]
+    # A hedge is already the second try of a call, so it is not retried itself
+    deadline = time.monotonic() + UPSTREAM_DEADLINE
+    return await retry_policy.run(attempt, deadline, max_attempts=1 if hedge else None)
+
+async def complete_hedge(messages: List[Dict[str, str]]) -> str:
+    # Runs alongside the primary call in the same request; only the primary's phases are
+    # reported in Server-Timing
+    request_timing.current.set(None)
+    return await complete(messages, HEDGE_MODEL, hedge=True)
+
+def spare_slot() -> bool:
+    # A hedge that would queue behind other requests only adds to the load it works around
+    return admission.in_flight < admission.limit and not admission.queue_depth
+
+async def fetch_completion(messages: List[Dict[str, str]]) -> str:
+    if HEDGE_ENABLED:
+        response, winner = await hedging.run(
+            lambda: complete(messages), lambda: complete_hedge(messages), can_hedge=spare_slot
+        )
+        if winner is not None:
+            hedged_calls.labels(winner).inc()
+    else:
+        response = await complete(messages)
+    # Whichever model answered, the answer is cached for the primary's key
+    cleaned_response = clean_response(response)
+    store_in_cache(messages, cleaned_response)
+    return cleaned_response
+
+async def fetch_shared_completion(messages: List[Dict[str, str]]) -> Tuple[str, bool]:
+    return await inflight.do(cache_key(messages), lambda: fetch_completion(messages))
+
+async def get_groq_llama_response(
+    session_id: str, question: Dict[str, Any], use_cache: bool = True, query: Optional[str] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    # Small talk needs neither the history nor the caches
+    answer = await answer_locally(session_id, question, use_cache)
+    if answer is not None:
+        return (*await finish_turn(session_id, question, answer), "LOCAL")
     
-    # Prepare messages for API call
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + context_messages
+    messages = await build_context(session_id, question, query)
+    cached, cache_status = lookup_cache(messages, use_cache)
+    if cached is not None:
+        return (*await finish_turn(session_id, question, cached), cache_status)
     
     try:
-        chat_completion = client.chat.completions.create(
+        if use_cache:
+            started = time.perf_counter()
+            cleaned_response, shared = await fetch_shared_completion(messages)
+            if shared:
+                # The upstream phases were recorded by the request that made the call
+                request_timing.record("shared", time.perf_counter() - started)
+                cache_status = "COALESCED"
+        else:
+            cleaned_response = await fetch_completion(messages)
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise upstream_failure(e) from e
+    return (*await finish_turn(session_id, question, cleaned_response), cache_status)
+
+def upstream_failure(error: Exception) -> HTTPException:
+    # Reported to the client but never stored: an error turn in the history would be sent
+    # back to Groq as context on the following turns
+    return HTTPException(status_code=502, detail=f"The AI service could not answer: {error}")
+
+async def open_stream(messages: List[Dict[str, str]], remaining: float) -> Tuple[AsyncExitStack, Any, Any]:
+    # Takes quota and a slot and waits for Groq to start answering. Nothing has reached the
+    # client yet, so this part can be retried; the returned stack holds the slot until closed
+    deadline = time.monotonic() + remaining
+    async with AsyncExitStack() as stack:
+        timer, reservation = await stack.enter_async_context(
+            upstream_call(messages, MAX_TOKENS, kind="first_token", deadline=deadline)
+        )
+        stream = await create_completion(
+            reservation,
             messages=messages,
-            model="llama3-8b-8192",  # Llama3 model
-            max_tokens=2000,  # Increased token limit
-            temperature=0.5,
-            timeout=30,  # Increased timeout
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            timeout=time_left(deadline),
+            stream=True,
         )
-        response = chat_completion.choices[0].message.content
-        cleaned_response = clean_response(response)
-        chat_history.append({"role": "assistant", "content": cleaned_response})
-        return cleaned_response
+        return stack.pop_all(), timer, stream
+
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def stream_groq_llama_response(
+    session_id: str, question: Dict[str, Any], messages: List[Dict[str, str]], timing: Optional[RequestTiming] = None
+) -> AsyncIterator[str]:
+    stripper = ThinkStripper()
+    parts = []
+    
+    try:
+        deadline = time.monotonic() + UPSTREAM_DEADLINE
+        call, timer, stream = await retry_policy.run(lambda remaining: open_stream(messages, remaining), deadline)
+        # The slot is held for the whole stream since that is how long Groq is busy
+        async with call:
+            async for chunk in stream:
+                # Time to first token is the latency signal; stream length depends on the answer
+                timer.mark()
+                if chunk.x_groq is not None:
+                    record_usage(chunk.x_groq.usage)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                text = stripper.feed(chunk.choices[0].delta.content)
+                if text:
+                    parts.append(text)
+                    yield sse_event({"delta": text})
+        text = stripper.flush()
+        if text:
+            parts.append(text)
+            yield sse_event({"delta": text})
+        # Commit the cleaned message only once the whole completion has arrived
+        cleaned_response = "".join(parts).strip()
+        store_in_cache(messages, cleaned_response)
+        yield sse_event(chat_result(await finish_turn(session_id, question, cleaned_response), timing), event="done")
+    except Overloaded as e:
+        # Headers are already sent, so a queue timeout can only be reported in-band
+        yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="overloaded")
     except Exception as e:
-        error_message = f"Error: {str(e)}"
-        chat_history.append({"role": "assistant", "content": error_message})
-        return error_message
+        # As for /chat, the error is not stored; a partial answer already sent is dropped too
+        yield sse_event({"error": upstream_failure(e).detail}, event="error")
+
+async def stream_cached_response(
+    session_id: str, question: Dict[str, Any], cached: str, timing: Optional[RequestTiming] = None
+) -> AsyncIterator[str]:
+    yield sse_event({"delta": cached})
+    yield sse_event(chat_result(await finish_turn(session_id, question, cached), timing), event="done")
+
+async def stream_shared_response(
+    session_id: str, question: Dict[str, Any], messages: List[Dict[str, str]], timing: Optional[RequestTiming] = None
+) -> AsyncIterator[str]:
+    # An identical non-streaming request is already upstream; wait for it rather than
+    # starting a second call, then send the answer in one piece
+    try:
+        started = time.perf_counter()
+        cleaned_response, shared = await fetch_shared_completion(messages)
+        if shared:
+            request_timing.record("shared", time.perf_counter() - started)
+        yield sse_event({"delta": cleaned_response})
+        yield sse_event(chat_result(await finish_turn(session_id, question, cleaned_response), timing), event="done")
+    except Overloaded as e:
+        yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="overloaded")
+    except Exception as e:
+        # As for /chat, the error is not stored; a partial answer already sent is dropped too
+        yield sse_event({"error": upstream_failure(e).detail}, event="error")
+
+def chat_delta(user_message: Dict[str, Any], assistant_message: Dict[str, Any]) -> Dict[str, Any]:
+    # Only the turn that was just added; clients append it and page with /history?since=cursor
+    return {
+        "response": assistant_message["content"],
+        "messages": [public_message(user_message), public_message(assistant_message)],
+        "cursor": assistant_message["id"],
+    }
+
+def chat_result(turn: Tuple[Dict[str, Any], Dict[str, Any]], timing: Optional[RequestTiming]) -> Dict[str, Any]:
+    # The final payload of a stream, with the phase breakdown when the client asked for it
+    payload = chat_delta(*turn)
+    if timing is not None:
+        payload["timing"] = timing.milliseconds()
+    return payload
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"The AI service is busy ({exc.reason}). Please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(MissingReferences)
+async def missing_references_handler(request: Request, exc: MissingReferences):
+    # The client uploads these files again (another worker or a restart lost them) and retries
+    return JSONResponse(
+        status_code=409,
+        content={"detail": "Some referenced files are not in the workspace.", "missing": exc.hashes},
+    )
+
+@app.exception_handler(WorkspaceConflict)
+async def workspace_conflict_handler(request: Request, exc: WorkspaceConflict):
+    return JSONResponse(status_code=409, content={"detail": f"Upload the whole file again: {exc}"})
+
+@app.exception_handler(WorkspaceTooLarge)
+async def workspace_too_large_handler(request: Request, exc: WorkspaceTooLarge):
+    return JSONResponse(status_code=413, content={"detail": f"The workspace is full: {exc}"})
+
+class Reference(BaseModel):
+    # A whole file by hash, or lines start_line..end_line of it (1-based, inclusive)
+    hash: str
+    start_line: Optional[int] = Field(None, ge=1)
+    end_line: Optional[int] = Field(None, ge=1)
 
 class ChatRequest(BaseModel):
     message: str
+    # Code from the workspace mirror; the 4000 character limit applies to the message only
+    references: List[Reference] = Field(default_factory=list, max_length=MAX_REFERENCES)
+
+class WorkspaceFile(BaseModel):
+    path: str = Field(min_length=1, max_length=512)
+    content: str
+
+class WorkspaceEdit(BaseModel):
+    # Replaces characters start..end of the base version with text
+    start: int = Field(ge=0)
+    end: int = Field(ge=0)
+    text: str = ""
+
+class WorkspacePatch(BaseModel):
+    path: str = Field(min_length=1, max_length=512)
+    base: str
+    edits: List[WorkspaceEdit]
+    hash: str
+
+def retrieval_query(request: ChatRequest) -> Optional[str]:
+    # A message that references code already says which code it is about
+    return None if request.references else request.message
+
+def get_session_id(request: Request, response: Response) -> str:
+    # Prefer an explicit header (the frontend keeps one per tab), then the cookie,
+    # otherwise start a new session and hand its id back as a cookie
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not session_id or not SESSION_ID_PATTERN.match(session_id):
+        session_id = uuid.uuid4().hex
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    response.headers[SESSION_HEADER] = session_id
+    return session_id
+
+def cache_enabled(request: Request) -> bool:
+    return request.headers.get(CACHE_BYPASS_HEADER, "").lower() not in ("1", "true", "yes")
+
+def timing_requested(request: Request) -> bool:
+    return request.headers.get(TIMING_REQUEST_HEADER, "").lower() in ("1", "true", "yes")
+
+def timing_headers(timings: Dict[str, float]) -> Dict[str, str]:
+    # Timing-Allow-Origin lets the frontend read the header through the Resource Timing API
+    return {
+        SERVER_TIMING_HEADER: request_timing.server_timing(timings, TIMING_DESCRIPTIONS),
+        "Timing-Allow-Origin": ", ".join(FRONTEND_ORIGINS),
+    }
 
 @app.post("/chat", response_model=dict)
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    session_id: str = Depends(get_session_id),
+):
     if not request.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
     # Check if the incoming message is too long
     if len(request.message) > 4000:
-        return {"response": "Your message is too long. Please keep it under 4000 characters.", "chat_history": chat_history}
+        stored, _ = await history_store.load(session_id)
+        return {"response": "Your message is too long. Please keep it under 4000 characters.", "messages": [], "cursor": stored[-1]["id"] if stored else 0}
     
-    response = get_groq_llama_response(request.message)
-    # Return the full chat history for display
-    return {"response": response, "chat_history": chat_history}
+    timing = request_timing.start()
+    question = new_question(session_id, request.message, request.references)
+    user_message, assistant_message, cache_status = await get_groq_llama_response(
+        session_id, question, cache_enabled(http_request), retrieval_query(request)
+    )
+    cache_lookups.labels(cache_status).inc()
+    response.headers[CACHE_STATUS_HEADER] = cache_status
+    timings = timing.milliseconds()
+    response.headers.update(timing_headers(timings))
+    result = chat_delta(user_message, assistant_message)
+    if timing_requested(http_request):
+        result["timing"] = timings
+    return result
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    session_id: str = Depends(get_session_id),
+):
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    if len(request.message) > 4000:
+        raise HTTPException(status_code=413, detail="Your message is too long. Please keep it under 4000 characters.")
+    
+    timing = request_timing.start()
+    # The final event carries the full breakdown; the header can only cover what happened
+    # before the stream starts
+    reported = timing if timing_requested(http_request) else None
+    question = new_question(session_id, request.message, request.references)
+    answer = await answer_locally(session_id, question, cache_enabled(http_request))
+    if answer is not None:
+        cache_status = "LOCAL"
+        events = stream_cached_response(session_id, question, answer, reported)
+    else:
+        messages = await build_context(session_id, question, retrieval_query(request))
+        cached, cache_status = lookup_cache(messages, cache_enabled(http_request))
+        if cached is not None:
+            events = stream_cached_response(session_id, question, cached, reported)
+        elif cache_status == "MISS" and cache_key(messages) in inflight:
+            cache_status = "COALESCED"
+            events = stream_shared_response(session_id, question, messages, reported)
+        else:
+            # Reject up front while a proper 503 can still be sent
+            admission.check()
+            events = stream_groq_llama_response(session_id, question, messages, reported)
+    cache_lookups.labels(cache_status).inc()
+    response.headers[CACHE_STATUS_HEADER] = cache_status
+    response.headers.update(timing_headers(timing.milliseconds()))
+    # Returning a response directly bypasses the injected one, so carry its session headers over
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream and defeating time-to-first-token
+        headers={**response.headers, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def warm_up() -> None:
+    # Everything here otherwise happens on first use, on the request path
+    from upstream_http import keep_warm, warm_connections  # imports httpx, like get_client()
+    loop = asyncio.get_running_loop()
+    # Replays the history log, or connects to and migrates the SQLite database
+    await history_store.open()
+    client = await loop.run_in_executor(None, get_client)
+    if HEDGE_ENABLED and HEDGE_GROQ_API_KEY:
+        await loop.run_in_executor(None, get_client, HEDGE_GROQ_API_KEY)
+    if UPSTREAM_WARM_CONNECTIONS:
+        # So the first calls skip the TCP and TLS handshakes, then keep them from expiring
+        await warm_connections(_upstream_http, str(client.base_url), UPSTREAM_WARM_CONNECTIONS)
+        app.state.keep_warm = asyncio.create_task(keep_warm(
+            _upstream_http, _upstream_transport, str(client.base_url),
+            UPSTREAM_WARM_CONNECTIONS, UPSTREAM_KEEPALIVE_EXPIRY / 2,
+        ))
+    await loop.run_in_executor(None, semantic_cache.open)
+    await loop.run_in_executor(None, intent_classifier.open)
+    if RETRIEVAL_ENABLED:
+        retriever.apply(await loop.run_in_executor(None, retriever.scan))
+        app.state.watch_sources = asyncio.create_task(watch_sources(retriever, RETRIEVAL_RESCAN_INTERVAL))
 
 @app.post("/clear", response_model=dict)
-async def clear_history():
-    chat_history.clear()
+async def clear_history(session_id: str = Depends(get_session_id)):
+    compactor.cancel(session_id)
+    await history_store.clear(session_id)
     return {"message": "Chat history cleared"}
 
+def workspace_file(file: MirroredFile) -> Dict[str, Any]:
+    return {"path": file.path, "hash": file.hash, "size": len(file.content)}
+
+@app.get("/workspace", response_model=dict)
+async def get_workspace(session_id: str = Depends(get_session_id)):
+    # What the mirror holds, so a client can tell which files it needs to upload
+    return {"files": [workspace_file(file) for file in workspace_mirror.files(session_id)]}
+
+@app.put("/workspace/files", response_model=dict)
+async def put_workspace_file(request: WorkspaceFile, session_id: str = Depends(get_session_id)):
+    return workspace_file(workspace_mirror.put(session_id, request.path, request.content))
+
+@app.patch("/workspace/files", response_model=dict)
+async def patch_workspace_file(request: WorkspacePatch, session_id: str = Depends(get_session_id)):
+    # A 409 means the mirror is not at request.base; the client then PUTs the whole file
+    edits = [(edit.start, edit.end, edit.text) for edit in request.edits]
+    return workspace_file(workspace_mirror.patch(session_id, request.path, request.base, edits, request.hash))
+
+@app.delete("/workspace/files", response_model=dict)
+async def delete_workspace_file(path: str = Query(..., min_length=1), session_id: str = Depends(get_session_id)):
+    return {"removed": workspace_mirror.remove(session_id, path)}
+
+@app.get("/history", response_model=dict)
+async def get_history(
+    request: Request,
+    response: Response,
+    since: int = Query(0, ge=0),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_STORED_MESSAGES),
+    session_id: str = Depends(get_session_id),
+):
+    # Ids only grow and trimming only drops the oldest messages, so the first/last stored
+    # ids plus the page parameters determine the page within a session. Ids start at 1 in
+    # every session, so the tag also carries a hash of the session id (not the id itself,
+    # which is the session's credential), and shared caches must not store the page at all
+    stored, _ = await history_store.load(session_id)
+    first_id, last_id = (stored[0]["id"], stored[-1]["id"]) if stored else (0, 0)
+    session_tag = hashlib.sha256(session_id.encode()).hexdigest()[:16]
+    etag = f'W/"{session_tag}-{first_id}-{last_id}-{since}-{limit}"'
+    response.headers["Vary"] = f"{SESSION_HEADER}, Cookie"
+    response.headers["Cache-Control"] = "private, no-cache"
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers={**response.headers, "ETag": etag})
+
+    start = bisect_right(stored, since, key=lambda message: message["id"])
+    messages = stored[start:start + limit]
+    response.headers["ETag"] = etag
+    return {
+        "messages": [public_message(message) for message in messages],
+        "cursor": messages[-1]["id"] if messages else since,
+        "has_more": bool(messages) and messages[-1]["id"] < last_id,
+    }
+
+@app.get("/cache/stats", response_model=dict)
+async def cache_stats():
+    return {
+        **response_cache.stats(),
+        "semantic": semantic_cache.stats(),
+        "inflight": inflight.stats(),
+        "fast_path": intent_classifier.stats(),
+        "workspace": workspace_mirror.stats(),
+        "retrieval": retriever.stats(),
+    }
+
+@app.get("/admission/stats", response_model=dict)
+async def admission_stats():
+    return {
+        **admission.stats(),
+        "rate_limits": pacer.stats(),
+        "hedging": {**hedging.stats(), "model": HEDGE_MODEL, "rate_limits": hedge_pacer.stats()},
+        "retries": retry_policy.stats(),
+        "circuit": breaker.stats(),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    # The history backend may have to ask SQLite or Redis, so its size is read per scrape
+    for measure, value in (await history_store.stats()).items():
+        if measure in ("sessions", "messages", "bytes"):
+            history_size.labels(measure).set(value)
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/health", response_model=dict)
 async def health_check():
-    return {"status": "healthy", "model": "llama3-8b-8192"}
+    # Liveness: the process is up and serving, even while it warms up
+    return {"status": "healthy", "model": MODEL}
+
+@app.get("/ready", response_model=dict)
+async def readiness_check():
+    # Readiness: warm_up() has finished, so requests will not pay for it
+    warm_up_task = getattr(app.state, "warm_up", None)
+    if warm_up_task is None or not warm_up_task.done():
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    if warm_up_task.cancelled() or warm_up_task.exception() is not None:
+        detail = "cancelled" if warm_up_task.cancelled() else str(warm_up_task.exception())
+        return JSONResponse(status_code=503, content={"status": "failed", "detail": detail})
+    return {"status": "ready"}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,13 @@
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules under test live next to server.py, not in a package
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+# Importing server must not touch the repo's history log or scan its contracts
+os.environ.setdefault("HISTORY_LOG_DIR", "")
+os.environ.setdefault("RETRIEVAL", "0")
+os.environ.setdefault("GROQ_API_KEY", "test-key")
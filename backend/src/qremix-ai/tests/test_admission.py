@@ -0,0 +1,125 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+from concurrency_limit import AIMDLimit, FixedLimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Dropped(Exception):
+    pass
+
+
+def aimd_admission():
+    clock = FakeClock()
+    limiter = AIMDLimit(initial=4, min_limit=2, max_limit=8, backoff=0.5, clock=clock)
+    admission = AdmissionController(
+        limiter=limiter, max_queue=0, queue_timeout=0, is_drop=lambda error: isinstance(error, Dropped), clock=clock,
+    )
+    return admission, limiter, clock
+
+
+async def busy_round(admission: AdmissionController, clock: FakeClock, latency: float = 0.1) -> None:
+    # Fills every slot, then finishes the calls one at a time
+    async with AsyncExitStack() as stack:
+        for _ in range(admission.limit):
+            await stack.enter_async_context(admission.slot())
+        clock.now += latency
+
+
+async def failing_call(admission: AdmissionController) -> None:
+    with pytest.raises(Dropped):
+        async with admission.slot():
+            raise Dropped()
+
+
+async def limit_changes():
+    admission, limiter, clock = aimd_admission()
+    limits = []
+    for _ in range(2):
+        await busy_round(admission, clock)
+        limits.append((admission.limit, limiter.increases))
+    # Latency at more than twice the baseline reads as overload
+    await busy_round(admission, clock, latency=0.3)
+    limits.append((admission.limit, limiter.decreases))
+    # Failures cut the limit at most once per baseline round trip (0.1 s), down to the floor
+    await failing_call(admission)
+    await failing_call(admission)
+    limits.append((admission.limit, limiter.decreases))
+    clock.now += 0.2
+    await failing_call(admission)
+    limits.append((admission.limit, limiter.decreases))
+    return limits
+
+
+def test_aimd_grows_the_limit_while_in_use_and_halves_it_on_overload():
+    # A call only grows the limit (by 1/limit) if it finishes with at least half the limit
+    # in flight: three of the four calls in the first round, two in the second
+    assert asyncio.run(limit_changes()) == [(4, 3), (5, 5), (2, 1), (2, 1), (2, 2)]
+
+
+def test_a_lone_call_does_not_grow_the_limit():
+    admission, limiter, clock = aimd_admission()
+
+    async def calls():
+        for _ in range(20):
+            async with admission.slot():
+                clock.now += 0.1
+
+    asyncio.run(calls())
+    assert limiter.increases == 0 and admission.limit == 4
+
+
+async def fill_the_queue():
+    admission = AdmissionController(limiter=FixedLimit(2), max_queue=1, queue_timeout=10)
+    order = []
+
+    async def call(name: str, hold: asyncio.Event):
+        async with admission.slot():
+            order.append(name)
+            await hold.wait()
+
+    holds = {name: asyncio.Event() for name in ("first", "second", "queued")}
+    tasks = [asyncio.ensure_future(call(name, hold)) for name, hold in holds.items()]
+    await asyncio.sleep(0)
+    assert (admission.in_flight, admission.queue_depth) == (2, 1)
+    # Both slots are taken and the queue is full: refused at once, without waiting
+    with pytest.raises(Overloaded, match="queue is full") as refused:
+        await call("refused", asyncio.Event())
+    holds["first"].set()
+    holds["queued"].set()
+    await tasks[0]
+    await tasks[2]
+    holds["second"].set()
+    await tasks[1]
+    return admission, order, refused.value
+
+
+def test_a_full_queue_rejects_at_once():
+    admission, order, refused = asyncio.run(fill_the_queue())
+    assert order == ["first", "second", "queued"]
+    assert refused.retry_after >= 1
+    assert (admission.admitted, admission.rejected, admission.in_flight, admission.queue_depth) == (3, 1, 0, 0)
+
+
+async def wait_too_long():
+    admission = AdmissionController(limiter=FixedLimit(1), max_queue=1, queue_timeout=0.01)
+    async with admission.slot():
+        with pytest.raises(Overloaded, match="timed out"):
+            async with admission.slot():
+                pass
+    return admission
+
+
+def test_a_queued_call_gives_up_after_the_queue_timeout():
+    admission = asyncio.run(wait_too_long())
+    assert (admission.timed_out, admission.in_flight, admission.queue_depth) == (1, 0, 0)
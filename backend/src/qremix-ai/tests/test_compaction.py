@@ -0,0 +1,99 @@
+import asyncio
+import contextlib
+import os
+import sys
+
+import pytest
+
+from compaction import HistoryCompactor
+from history_backends import open_history_backend
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from common import mini_redis  # noqa: E402
+
+
+@contextlib.contextmanager
+def backend_url(kind: str, tmp_path):
+    if kind == "redis":
+        with mini_redis() as url:
+            yield url
+    elif kind == "sqlite":
+        yield f"sqlite:///{tmp_path / 'history.db'}"
+    else:
+        yield "memory://"
+
+
+def turn(text: str):
+    return [
+        {"role": "user", "content": text, "tokens": 50},
+        {"role": "assistant", "content": text, "tokens": 50},
+    ]
+
+
+async def summary_after_clear(url: str, cancel: bool):
+    store = open_history_backend(url, max_bytes=1 << 20, idle_ttl=60, max_messages=100)
+    await store.open()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def summarize(previous, messages):
+        started.set()
+        await release.wait()
+        return "the old conversation"
+
+    compactor = HistoryCompactor(store, summarize, trigger_tokens=100, keep_recent_tokens=100, input_budget=1000)
+    try:
+        for number in range(3):
+            await store.append("session1", turn(f"old {number}"))
+        compactor.schedule("session1")
+        await started.wait()
+        # /clear while the summary is being written, then a new conversation
+        if cancel:
+            compactor.cancel("session1")
+        await store.clear("session1")
+        await store.append("session1", turn("new"))
+        release.set()
+        await compactor.drain()
+        return await store.load("session1")
+    finally:
+        await store.close()
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_a_summary_of_a_cleared_conversation_is_not_attached_to_the_next(kind, tmp_path):
+    # Without cancelling, as when the compaction runs on another worker
+    with backend_url(kind, tmp_path) as url:
+        messages, summary = asyncio.run(summary_after_clear(url, cancel=False))
+    assert [message["content"] for message in messages] == ["new", "new"]
+    assert summary is None
+
+
+def test_cancel_stops_the_running_compaction(tmp_path):
+    messages, summary = asyncio.run(summary_after_clear("memory://", cancel=True))
+    assert [message["content"] for message in messages] == ["new", "new"]
+    assert summary is None
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_a_summary_lands_when_nothing_was_cleared(kind, tmp_path):
+    async def compact(url):
+        store = open_history_backend(url, max_bytes=1 << 20, idle_ttl=60, max_messages=100)
+        await store.open()
+
+        async def summarize(previous, messages):
+            return "the conversation so far"
+
+        compactor = HistoryCompactor(store, summarize, trigger_tokens=100, keep_recent_tokens=100, input_budget=1000)
+        try:
+            for number in range(3):
+                await store.append("session1", turn(f"turn {number}"))
+            compactor.schedule("session1")
+            await compactor.drain()
+            return await store.load("session1")
+        finally:
+            await store.close()
+
+    with backend_url(kind, tmp_path) as url:
+        messages, summary = asyncio.run(compact(url))
+    assert summary is not None and summary["content"].endswith("the conversation so far")
+    assert summary["upto"] == messages[3]["id"]
@@ -0,0 +1,55 @@
+import asyncio
+import random
+
+from admission import AdmissionController
+from concurrency_limit import AIMDLimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def healthy_calls(report_generation: bool) -> AIMDLimit:
+    # Answers of 20 to 800 tokens from an upstream that is never overloaded, with the limit
+    # in use as under steady traffic
+    clock = FakeClock()
+    limiter = AIMDLimit(initial=16, min_limit=4, max_limit=64, clock=clock)
+    rng = random.Random(3)
+    for _ in range(500):
+        first_token = 0.05 + rng.uniform(0, 0.01)
+        generating = rng.randint(20, 800) * 0.001
+        clock.now += first_token + generating
+        latency = first_token if report_generation else first_token + generating
+        limiter.on_sample(latency, dropped=False, in_flight=limiter.limit)
+    return limiter
+
+
+def test_answer_length_does_not_read_as_overload():
+    limiter = healthy_calls(report_generation=True)
+    assert limiter.decreases == 0
+    assert limiter.limit > 16
+
+
+def test_whole_completion_latency_would_collapse_the_limit():
+    # What the limit did before generation time was left out
+    assert healthy_calls(report_generation=False).limit == 4
+
+
+def test_mark_leaves_out_generation_time():
+    clock = FakeClock()
+    admission = AdmissionController(
+        limiter=AIMDLimit(initial=16, min_limit=4, max_limit=64, clock=clock),
+        max_queue=0, queue_timeout=0, is_drop=lambda error: False, clock=clock,
+    )
+
+    async def call():
+        async with admission.slot() as timer:
+            clock.now += 1.5
+            timer.mark(generating=1.2)
+        return timer
+
+    assert abs(asyncio.run(call()).latency - 0.3) < 1e-9
@@ -0,0 +1,46 @@
+import pytest
+
+from fast_path import ANSWERS, PLEASANTRY, IntentClassifier, asks_for_reply
+
+classifier = IntentClassifier()
+classifier.open()
+
+INSTRUCTIONS = [
+    "ok do it", "ok do that", "yes do it", "sure go ahead", "go ahead", "ok proceed", "yes please",
+    "do it", "k do it", "ok go on", "yeah go for it", "please do", "alright lets do it",
+]
+
+
+@pytest.mark.parametrize("prompt", INSTRUCTIONS)
+def test_instructions_go_to_the_llm(prompt):
+    assert classifier.classify(prompt)[0] is None
+
+
+@pytest.mark.parametrize("prompt", ["ok", "okay", "sounds good", "ok got it", "cool cool"])
+def test_acknowledgements_are_answered_locally(prompt):
+    assert classifier.classify(prompt)[0] == PLEASANTRY
+    assert classifier.classify(prompt, "Here is the contract with the events added.")[0] == PLEASANTRY
+
+
+@pytest.mark.parametrize("previous", [
+    "Here is the contract.\n\nShall I add events for the transfers?",
+    "Would you like me to make it pausable as well?\n\n**Explanation**: the modifier checks the owner.",
+    "Do you want the tests too?",
+])
+def test_acknowledgements_of_a_question_go_to_the_llm(previous):
+    assert asks_for_reply(previous)
+    for prompt in ["ok", "sounds good", "ok got it"]:
+        assert classifier.classify(prompt, previous)[0] is None
+
+
+def test_greetings_and_thanks_ignore_the_previous_answer():
+    assert classifier.classify("thanks", "Shall I add events?")[0] == "thanks"
+    assert classifier.classify("hello", "Shall I add events?")[0] == "greeting"
+
+
+def test_answer_counts_what_classify_found():
+    counted = IntentClassifier(use_model=False)
+    assert counted.answer("ok") == (PLEASANTRY, ANSWERS[PLEASANTRY])
+    assert counted.answer("ok", "Shall I add events?") == (None, None)
+    assert counted.stats()["hits"][PLEASANTRY] == 1
+    assert counted.stats()["misses"] == 1
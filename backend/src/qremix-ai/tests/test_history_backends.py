@@ -0,0 +1,95 @@
+import asyncio
+import contextlib
+import os
+import sys
+
+import pytest
+
+from history_backends import open_history_backend
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from common import mini_redis  # noqa: E402
+
+
+@contextlib.contextmanager
+def backend_url(kind: str, tmp_path):
+    if kind == "redis":
+        with mini_redis() as url:
+            yield url
+    elif kind == "sqlite":
+        yield f"sqlite:///{tmp_path / 'history.db'}"
+    else:
+        yield "memory://"
+
+
+REFERENCES = [{"hash": "0123456789abcdef", "path": "contracts/A.sol", "start_line": 2, "end_line": None}]
+SEGMENTS = [{"type": "text", "content": "It does nothing."}]
+
+
+async def round_trip(url: str, log_dir: str):
+    store = open_history_backend(url, max_bytes=1 << 20, idle_ttl=60, max_messages=100, log_dir=log_dir)
+    await store.open()
+    try:
+        await store.append("session1", [
+            {"role": "user", "content": "what does f do?", "tokens": 40, "references": REFERENCES},
+            {"role": "assistant", "content": "It does nothing.", "tokens": 10, "segments": SEGMENTS},
+            {"role": "user", "content": "thanks", "tokens": 5},
+        ])
+        loaded, _ = await store.load("session1")
+    finally:
+        await store.close()
+    if log_dir:
+        # And once more from the log alone
+        store = open_history_backend(url, max_bytes=1 << 20, idle_ttl=60, max_messages=100, log_dir=log_dir)
+        await store.open()
+        assert (await store.load("session1"))[0] == loaded
+        await store.close()
+    return loaded
+
+
+@pytest.mark.parametrize("kind", ["memory", "logged", "sqlite", "redis"])
+def test_references_and_segments_are_stored(kind, tmp_path):
+    with backend_url(kind, tmp_path) as url:
+        loaded = asyncio.run(round_trip(url, str(tmp_path / "log") if kind == "logged" else None))
+    question, answer, thanks = loaded
+    assert question["references"] == REFERENCES and "segments" not in question
+    assert answer["segments"] == SEGMENTS and "references" not in answer
+    assert "references" not in thanks and "segments" not in thanks
+
+
+async def open_later(path):
+    store = open_history_backend(f"sqlite:///{path}", max_bytes=1 << 20, idle_ttl=60, max_messages=100)
+    # Constructing the backend (at import time in the server) touches nothing
+    assert not path.parent.exists()
+    with pytest.raises(Exception):
+        await store.load("session1")
+    path.parent.mkdir()
+    # The first call after a failed open tries again
+    assert await store.load("session1") == ([], None)
+    await store.close()
+
+
+def test_sqlite_connects_when_opened(tmp_path):
+    asyncio.run(open_later(tmp_path / "data" / "history.db"))
+    assert (tmp_path / "data" / "history.db").exists()
+
+
+async def clear_fails_then_succeeds(path):
+    store = open_history_backend(f"sqlite:///{path}", max_bytes=1 << 20, idle_ttl=60, max_messages=100)
+    await store.append("session1", [{"role": "user", "content": "hello", "tokens": 5}])
+    store._db.execute(
+        "CREATE TEMP TRIGGER refuse BEFORE DELETE ON sessions BEGIN SELECT RAISE(ABORT, 'refused'); END"
+    )
+    with pytest.raises(Exception, match="refused"):
+        await store.clear("session1")
+    # The failed clear was rolled back: its message delete is undone and the connection
+    # is out of the transaction, so the next write can begin one
+    assert [message["content"] for message in (await store.load("session1"))[0]] == ["hello"]
+    store._db.execute("DROP TRIGGER refuse")
+    await store.clear("session1")
+    assert await store.load("session1") == ([], None)
+    await store.close()
+
+
+def test_a_failed_sqlite_clear_is_rolled_back(tmp_path):
+    asyncio.run(clear_fails_then_succeeds(tmp_path / "history.db"))
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from history_backends import MemoryHistory
+from history_log import HistoryLog, HistoryLogInUse, ReplayClock
+from history_store import SessionHistoryStore
+
+
+def open_backend(directory, **options) -> MemoryHistory:
+    clock = ReplayClock()
+    store = SessionHistoryStore(max_bytes=1 << 30, idle_ttl=3600, max_messages=1000, clock=clock)
+    log = HistoryLog(str(directory), store, clock, fsync=False, **options)
+    log.recover()
+    return MemoryHistory(store, log)
+
+
+def contents(backend: MemoryHistory, session_id: str):
+    return [message["content"] for message in backend.store.get(session_id)]
+
+
+class FailingSegment:
+    """A segment file whose next write stops halfway and raises, like a full disk."""
+
+    def __init__(self, segment, truncate_fails: bool):
+        self.segment = segment
+        self.truncate_fails = truncate_fails
+        self.failed = False
+
+    def write(self, data: bytes) -> int:
+        if self.failed:
+            return self.segment.write(data)
+        self.failed = True
+        self.segment.write(data[:len(data) // 2])
+        raise OSError("No space left on device")
+
+    def truncate(self, size: int) -> int:
+        if self.truncate_fails:
+            raise OSError("Input/output error")
+        return self.segment.truncate(size)
+
+    def __getattr__(self, name):
+        return getattr(self.segment, name)
+
+
+async def write_through_a_failure(directory, truncate_fails: bool):
+    backend = open_backend(directory)
+    await backend.append("s1", [{"role": "user", "content": "before", "tokens": 1}])
+    backend.log._segment = FailingSegment(backend.log._segment, truncate_fails)
+    with pytest.raises(OSError):
+        await backend.append("s1", [{"role": "user", "content": "failed", "tokens": 1}])
+    await backend.append("s1", [{"role": "user", "content": "after", "tokens": 1}])
+    await backend.append("s1", [{"role": "user", "content": "later", "tokens": 1}])
+    await backend.close()
+    return backend
+
+
+@pytest.mark.parametrize("truncate_fails", [False, True])
+def test_writes_after_a_failed_one_survive_a_restart(tmp_path, truncate_fails):
+    backend = asyncio.run(write_through_a_failure(tmp_path, truncate_fails))
+    # The store kept the failed append, so the next batch snapshotted it
+    assert backend.log.snapshots == 1
+    restarted = open_backend(tmp_path)
+    assert contents(restarted, "s1") == ["before", "failed", "after", "later"]
+    assert [message["id"] for message in restarted.store.get("s1")] == [1, 2, 3, 4]
+
+
+async def append_turns(backend: MemoryHistory, turns: int):
+    for turn in range(turns):
+        await backend.append(f"s{turn % 3}", [{"role": "user", "content": str(turn), "tokens": 1}])
+        # Snapshots are written on their own thread and none starts while one is; waiting
+        # for it makes every threshold crossing take one
+        if backend.log._snapshotting is not None:
+            await backend.log._snapshotting
+    await backend.close()
+
+
+def test_snapshots_bound_the_operations_replayed(tmp_path):
+    backend = open_backend(tmp_path, snapshot_operations=10)
+    asyncio.run(append_turns(backend, 95))
+    assert backend.log.snapshots == 8
+    restarted = open_backend(tmp_path, snapshot_operations=10)
+    assert restarted.log.recovered_operations <= 10
+    assert contents(restarted, "s1") == [str(turn) for turn in range(1, 95, 3)]
+
+
+def test_a_replayed_tail_counts_towards_the_next_snapshot(tmp_path):
+    backend = open_backend(tmp_path, snapshot_operations=1000)
+    asyncio.run(append_turns(backend, 8))
+    # Restarting does not reset the count, so a tail cannot grow across restarts
+    restarted = open_backend(tmp_path, snapshot_operations=10)
+    asyncio.run(append_turns(restarted, 3))
+    assert restarted.log.snapshots == 1
+
+
+def test_a_second_process_cannot_open_the_same_log(tmp_path):
+    backend = open_backend(tmp_path)
+    # flock conflicts between two opens of the lock file even within one process
+    with pytest.raises(HistoryLogInUse, match="sqlite://"):
+        open_backend(tmp_path)
+    asyncio.run(backend.close())
+    assert contents(open_backend(tmp_path), "s1") == []
@@ -0,0 +1,118 @@
+import pytest
+
+from admission import Overloaded
+from rate_limits import RateLimitPacer, parse_duration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("2m59.56s", 179.56),
+    ("7.66s", 7.66),
+    ("120ms", 0.12),
+    ("1h2m3s", 3723.0),
+    ("1m0.5s", 60.5),
+    # Retry-After
+    ("30", 30.0),
+    ("0.5", 0.5),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_reset_durations(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def groq_headers(requests_remaining: int, tokens_remaining: int, **extra) -> dict:
+    return {
+        "x-ratelimit-limit-requests": "30",
+        "x-ratelimit-remaining-requests": str(requests_remaining),
+        "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-limit-tokens": "6000",
+        "x-ratelimit-remaining-tokens": str(tokens_remaining),
+        "x-ratelimit-reset-tokens": "1m0s",
+        **extra,
+    }
+
+
+def test_an_unreported_quota_is_not_paced():
+    pacer = RateLimitPacer(max_wait=0, clock=FakeClock())
+    for _ in range(100):
+        assert pacer.reserve(10_000)[1] == 0
+    assert pacer.stats()["requests_limit"] is None
+
+
+def test_headers_set_the_quota_and_its_refill_rate():
+    clock = FakeClock()
+    pacer = RateLimitPacer(max_wait=10, clock=clock)
+    # No requests left, refilling all 30 over the 2 s reset: one every 1/15 s
+    pacer.report(groq_headers(requests_remaining=0, tokens_remaining=6000))
+    assert pacer.requests.limit == 30 and pacer.tokens.limit == 6000
+    assert pacer.reserve(100)[1] == pytest.approx(1 / 15)
+    # The next one queues behind it
+    assert pacer.reserve(100)[1] == pytest.approx(2 / 15)
+    clock.now = 2 / 15
+    assert pacer.reserve(100)[1] == pytest.approx(1 / 15)
+
+
+def test_unparseable_or_missing_headers_are_ignored():
+    pacer = RateLimitPacer(max_wait=0, clock=FakeClock())
+    pacer.report({"x-ratelimit-limit-requests": "30", "x-ratelimit-remaining-requests": "lots"})
+    pacer.report({"x-ratelimit-limit-tokens": "6000"})
+    assert pacer.requests.limit is None and pacer.tokens.limit is None
+    assert pacer.reserve(100)[1] == 0
+
+
+def test_calls_in_flight_stay_charged_against_a_report():
+    clock = FakeClock()
+    pacer = RateLimitPacer(max_wait=10, clock=clock)
+    pacer.report(groq_headers(requests_remaining=30, tokens_remaining=6000))
+    first, _ = pacer.reserve(1000)
+    second, _ = pacer.reserve(1500)
+    assert (pacer.outstanding_requests, pacer.outstanding_tokens) == (2, 2500)
+    assert pacer.tokens.available == 3500
+    # Groq answered the first before counting the second
+    first.sent = True
+    first.settle(groq_headers(requests_remaining=29, tokens_remaining=5000))
+    assert (pacer.outstanding_requests, pacer.outstanding_tokens) == (1, 1500)
+    assert pacer.tokens.available == 3500 and pacer.requests.available == 28
+    # A call that was never sent gives its quota back
+    second.release()
+    assert (pacer.outstanding_requests, pacer.outstanding_tokens) == (0, 0)
+    assert pacer.tokens.available == 5000 and pacer.requests.available == 29
+
+
+def test_a_wait_over_max_wait_is_refused():
+    clock = FakeClock()
+    pacer = RateLimitPacer(max_wait=10, clock=clock)
+    # 100 tokens a second come back; 2000 more are needed before this call fits
+    pacer.report(groq_headers(requests_remaining=30, tokens_remaining=0))
+    with pytest.raises(Overloaded) as refused:
+        pacer.reserve(2000)
+    assert refused.value.retry_after == 20
+    assert pacer.refused == 1 and pacer.outstanding_tokens == 0
+    assert pacer.tokens.available == 0
+    # Within max_wait it is paced, unless the caller will not wait that long
+    assert pacer.reserve(500)[1] == pytest.approx(5)
+    with pytest.raises(Overloaded):
+        pacer.reserve(100, max_wait=0)
+    assert pacer.refused == 2
+
+
+def test_a_429_pauses_every_call_for_its_retry_after():
+    clock = FakeClock()
+    pacer = RateLimitPacer(max_wait=10, clock=clock)
+    reservation, _ = pacer.reserve(100)
+    reservation.sent = True
+    reservation.settle({"retry-after": "3"}, throttled=True)
+    assert pacer.throttled == 1
+    assert pacer.reserve(100)[1] == pytest.approx(3)
+    assert pacer.retry_after() == 3
+    clock.now = 3
+    assert pacer.reserve(100)[1] == 0
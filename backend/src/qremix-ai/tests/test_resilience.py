@@ -0,0 +1,65 @@
+import pytest
+
+from admission import Overloaded
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    # A slow call is under way when two others fail and open the circuit
+    slow = breaker.check()
+    breaker.check()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now = 11
+    probe = breaker.check()
+    assert breaker.state == HALF_OPEN
+    return breaker, clock, slow, probe
+
+
+def test_a_call_started_before_the_circuit_opened_does_not_close_it():
+    breaker, _, slow, probe = half_open()
+    breaker.record_success(slow)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(Overloaded):
+        breaker.check()
+    breaker.record_success(probe)
+    assert breaker.state == CLOSED
+
+
+def test_only_the_probe_failing_reopens_the_circuit():
+    breaker, _, slow, probe = half_open()
+    breaker.record_failure(slow)
+    assert breaker.state == HALF_OPEN
+    breaker.record_failure(probe)
+    assert breaker.state == OPEN
+
+
+def test_a_replaced_probe_no_longer_decides():
+    breaker, clock, _, probe = half_open()
+    clock.now = 22
+    replacement = breaker.check()
+    breaker.record_success(probe)
+    assert breaker.state == HALF_OPEN
+    breaker.record_success(replacement)
+    assert breaker.state == CLOSED
+
+
+def test_a_released_probe_lets_the_next_call_probe():
+    breaker, _, slow, probe = half_open()
+    breaker.release(slow)
+    with pytest.raises(Overloaded):
+        breaker.check()
+    breaker.release(probe)
+    assert breaker.state == HALF_OPEN
+    assert breaker.check() == probe + 1
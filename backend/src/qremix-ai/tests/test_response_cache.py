@@ -0,0 +1,74 @@
+from response_cache import ENTRY_OVERHEAD_BYTES, ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+MESSAGES = [
+    {"role": "system", "content": "You are a Solidity assistant."},
+    {"role": "user", "content": "write a token\n  with a cap"},
+]
+
+
+def key(messages, model="llama", temperature=0.5, max_tokens=100):
+    return ResponseCache.make_key(model, messages, temperature, max_tokens)
+
+
+def test_entries_expire_after_the_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=10, max_bytes=1 << 20, ttl=60, clock=clock)
+    cache.put("a", "answer")
+    clock.now = 59.9
+    assert cache.get("a") == "answer"
+    clock.now = 60
+    assert cache.get("a") is None
+    assert len(cache) == 0 and cache.total_bytes == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, max_bytes=1 << 20, ttl=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    # Reading a makes b the least recently used
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_the_byte_cap_evicts_too_and_oversized_values_are_not_stored():
+    entry = ENTRY_OVERHEAD_BYTES + 1 + 100
+    cache = ResponseCache(max_entries=10, max_bytes=2 * entry, ttl=60)
+    for name in "abc":
+        cache.put(name, "x" * 100)
+    assert cache.get("a") is None and len(cache) == 2
+    assert cache.total_bytes == 2 * entry
+    cache.put("d", "x" * 2 * entry)
+    assert cache.get("d") is None and len(cache) == 2
+
+
+def test_keys_ignore_line_endings_trailing_whitespace_and_other_fields():
+    reformatted = [
+        {"role": "system", "content": "You are a Solidity assistant.  \r\n"},
+        {"role": "user", "content": "write a token   \r\n  with a cap\n", "id": 7, "tokens": 9},
+    ]
+    assert key(reformatted) == key(MESSAGES)
+    assert key([dict(message) for message in MESSAGES]) == key(MESSAGES)
+
+
+def test_keys_change_with_anything_that_changes_the_answer():
+    reindented = [MESSAGES[0], {"role": "user", "content": "write a token\n    with a cap"}]
+    reordered = [MESSAGES[1], MESSAGES[0]]
+    other_role = [MESSAGES[0], {"role": "assistant", "content": MESSAGES[1]["content"]}]
+    keys = {
+        key(MESSAGES), key(reindented), key(reordered), key(other_role),
+        key(MESSAGES, model="other"), key(MESSAGES, temperature=0.7), key(MESSAGES, max_tokens=200),
+    }
+    assert len(keys) == 7
@@ -0,0 +1,94 @@
+from retrieval import CodeIndex, Retriever, search
+
+SOURCE = """pragma solidity ^0.8.0;
+
+contract Vault {
+    address public owner;
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "not owner");
+        _;
+    }
+
+    function withdraw(uint amount) external onlyOwner {
+        payable(owner).transfer(amount);
+    }
+}
+
+contract Treasury {
+    address public owner;
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "not owner");
+        _;
+    }
+
+    function sweep() external onlyOwner {
+        payable(owner).transfer(address(this).balance);
+    }
+}
+"""
+
+
+def test_identical_members_in_different_contracts_are_separate_chunks():
+    index = CodeIndex()
+    index.update("contracts/Vault.sol", SOURCE)
+    names = sorted(chunk.name for chunk in index.chunks.values())
+    assert names == [
+        "Treasury", "Treasury.onlyOwner", "Treasury.sweep", "Vault", "Vault.onlyOwner", "Vault.withdraw",
+    ]
+
+
+def test_repeated_updates_of_the_same_file_do_not_leak_chunks():
+    index = CodeIndex()
+    index.update("contracts/Vault.sol", SOURCE)
+    chunks = len(index)
+    for number in range(5):
+        edited = SOURCE.replace("transfer(amount)", f"transfer(amount + {number})")
+        indexed = index.chunks_indexed
+        index.update("contracts/Vault.sol", edited)
+        assert len(index) == chunks
+        # Only the edited function is indexed again
+        assert index.chunks_indexed - indexed == 1
+    assert sum(len(posting) for posting in index.postings.values()) == sum(
+        len(chunk.terms) for chunk in index.chunks.values()
+    )
+    index.remove("contracts/Vault.sol")
+    assert len(index) == 0
+    assert index.postings == {}
+    assert index.total_length == 0
+    assert search([index], "onlyOwner withdraw", 4) == []
+
+
+def test_a_member_duplicated_within_one_file_is_kept_twice():
+    index = CodeIndex()
+    index.update("contracts/Vault.sol", SOURCE + SOURCE)
+    assert len(index) == 12
+    index.update("contracts/Vault.sol", SOURCE)
+    assert len(index) == 6
+    index.remove("contracts/Vault.sol")
+    assert len(index) == 0 and index.postings == {}
+
+
+def test_files_that_failed_to_index_are_scanned_again(tmp_path, monkeypatch):
+    (tmp_path / "Vault.sol").write_text(SOURCE)
+    (tmp_path / "Broken.sol").write_bytes(b"contract Broken { \xff }")
+    retriever = Retriever([str(tmp_path)], str(tmp_path), idle_ttl=60, max_sessions=10)
+
+    def fail_once(label, content):
+        monkeypatch.undo()
+        raise RuntimeError("index failed")
+
+    monkeypatch.setattr(retriever.project, "update", fail_once)
+    retriever.apply(retriever.scan())
+    assert len(retriever.project) == 0
+    # Neither file changed since, but neither was indexed either
+    changed, _ = retriever.scan()
+    assert [path for path, _, _ in changed] == [str(tmp_path / "Vault.sol")]
+    retriever.apply((changed, []))
+    assert len(retriever.project) == 6
+    assert retriever.scan() == ([], [])
+    (tmp_path / "Broken.sol").write_text("contract Broken {}")
+    (tmp_path / "Vault.sol").unlink()
+    retriever.apply(retriever.scan())
+    assert [chunk.name for chunk in retriever.project.chunks.values()] == ["Broken"]
@@ -0,0 +1,67 @@
+from segments import expand_segments
+
+
+def parsed(markdown: str):
+    return [tuple(segment.values()) for segment in expand_segments(markdown)]
+
+
+def test_text_between_and_after_code_blocks():
+    answer = (
+        "Here is the contract:\n\n```solidity\ncontract A {}\n```\n\n"
+        "And its test:\n```js\nit(\"works\");\n```\nRun it with hardhat.\n"
+    )
+    assert parsed(answer) == [
+        ("text", "Here is the contract:"),
+        ("code", "contract A {}", "solidity"),
+        ("text", "And its test:"),
+        ("code", "it(\"works\");", "js"),
+        ("text", "Run it with hardhat."),
+    ]
+
+
+def test_language_is_the_first_word_of_the_info_string():
+    assert parsed("```solidity title=A.sol\nx\n```") == [("code", "x", "solidity")]
+    assert parsed("~~~ python\nx\n~~~") == [("code", "x", "python")]
+    assert parsed("```\nx\n```") == [("code", "x", "")]
+
+
+def test_an_unterminated_fence_runs_to_the_end():
+    assert parsed("Start:\n```solidity\ncontract A {\n") == [
+        ("text", "Start:"),
+        ("code", "contract A {\n", "solidity"),
+    ]
+    assert parsed("```js") == [("code", "", "js")]
+
+
+def test_only_a_matching_fence_closes_a_block():
+    # A shorter fence, another fence character, or a fence with text after it is code
+    answer = "````md\n```js\ninner\n```\n~~~\n```` not closing\n````\nafter"
+    assert parsed(answer) == [
+        ("code", "```js\ninner\n```\n~~~\n```` not closing", "md"),
+        ("text", "after"),
+    ]
+
+
+def test_backticks_in_the_info_string_make_it_inline_code():
+    assert parsed("```not `a` fence```\nstill text") == [("text", "```not `a` fence```\nstill text")]
+
+
+def test_explanation_sections_end_at_the_next_heading_but_not_in_code():
+    answer = (
+        "```solidity\n### Explanation\n```\n"
+        "**Explanation:** the modifier checks the owner.\n\n"
+        "```solidity\nmodifier onlyOwner() {}\n```\n"
+        "It reverts otherwise.\n\n## Next steps\nDeploy it."
+    )
+    assert parsed(answer) == [
+        ("code", "### Explanation", "solidity"),
+        ("explanation", "the modifier checks the owner."),
+        ("code", "modifier onlyOwner() {}", "solidity"),
+        ("explanation", "It reverts otherwise."),
+        ("text", "## Next steps\nDeploy it."),
+    ]
+
+
+def test_code_keeps_its_whitespace_and_empty_prose_is_left_out():
+    assert parsed("\n\n```\n\n    indented\n\n```\n\n") == [("code", "\n    indented\n", "")]
+    assert parsed("") == []
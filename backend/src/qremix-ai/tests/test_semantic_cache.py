@@ -0,0 +1,94 @@
+import random
+from importlib.util import find_spec
+
+import pytest
+
+from semantic_cache import SemanticCache
+
+CONTEXT = "0" * 64
+
+PARAPHRASES = [
+    ("how do I write an erc20", "write ERC20 token contract"),
+    ("explain reentrancy attacks", "Explain reentrancy attack"),
+    ("what is a modifier in solidity", "What's a modifier in Solidity?"),
+    ("convert this solidity code to python", "Convert this Solidity code into Python"),
+    ("how to prevent reentrancy in solidity", "prevent reentrancy in solidity"),
+]
+DIFFERENT_REQUESTS = [
+    ("convert this solidity code to python", "convert this python code to solidity"),
+    ("translate python to javascript", "translate javascript to python"),
+    ("how do I transfer tokens to a contract", "how do I transfer tokens from a contract"),
+    ("write a token", "write a contract"),
+    ("write an erc20 token", "write an erc721 token"),
+    ("explain reentrancy", "prevent reentrancy"),
+]
+# The cache disables itself without NumPy; that is tested on its own
+requires_numpy = pytest.mark.skipif(find_spec("numpy") is None, reason="the semantic cache needs NumPy")
+BACKGROUND_WORDS = (
+    "write explain debug audit erc20 erc721 token contract mapping modifier event struct "
+    "reentrancy oracle staking vesting proxy gas storage python solidity javascript convert"
+).split()
+
+
+def cache(background: int) -> SemanticCache:
+    semantic = SemanticCache(max_entries=background + 4, threshold=0.9, ttl=3600)
+    rng = random.Random(5)
+    for number in range(background):
+        semantic.put(" ".join(rng.sample(BACKGROUND_WORDS, 4)), CONTEXT, f"answer {number}")
+    return semantic
+
+
+@requires_numpy
+@pytest.mark.parametrize("background", [0, 1000])
+@pytest.mark.parametrize("cached, asked", PARAPHRASES)
+def test_a_paraphrase_is_answered_from_the_cache(cached, asked, background):
+    semantic = cache(background)
+    semantic.put(cached, CONTEXT, "cached answer")
+    assert semantic.get(asked, CONTEXT) == "cached answer"
+
+
+@pytest.mark.parametrize("background", [0, 1000])
+@pytest.mark.parametrize("cached, asked", DIFFERENT_REQUESTS)
+def test_the_same_words_asking_something_else_miss(cached, asked, background):
+    semantic = cache(background)
+    semantic.put(cached, CONTEXT, "cached answer")
+    assert semantic.get(asked, CONTEXT) != "cached answer"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@requires_numpy
+def test_an_expired_match_does_not_hide_a_live_one():
+    clock = FakeClock()
+    semantic = SemanticCache(max_entries=8, threshold=0.9, ttl=10, clock=clock)
+    semantic.put("explain reentrancy attacks", CONTEXT, "old answer")
+    clock.now = 5
+    semantic.put("Explain reentrancy attack", CONTEXT, "new answer")
+    clock.now = 12
+    assert semantic.get("explain reentrancy attacks", CONTEXT) == "new answer"
+    assert len(semantic) == 1
+
+
+@requires_numpy
+def test_other_contexts_do_not_take_up_the_candidates():
+    semantic = SemanticCache(max_entries=600, threshold=0.9, ttl=3600, max_candidates=16)
+    for number in range(500):
+        semantic.put("explain reentrancy attacks", f"{number + 1:016x}" + "0" * 48, f"answer {number}")
+        if number == 250:
+            semantic.put("explain reentrancy attacks", CONTEXT, "cached answer")
+    assert semantic.get("Explain reentrancy attack", CONTEXT) == "cached answer"
+
+
+@pytest.mark.skipif(find_spec("numpy") is not None, reason="only without NumPy")
+def test_without_numpy_the_cache_stays_disabled():
+    semantic = SemanticCache(max_entries=8, threshold=0.9, ttl=3600)
+    semantic.put("explain reentrancy attacks", CONTEXT, "cached answer")
+    assert not semantic.enabled
+    assert semantic.get("explain reentrancy attacks", CONTEXT) is None
+    assert len(semantic) == 0
@@ -0,0 +1,205 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import Request
+
+import server
+from admission import Overloaded
+from resilience import HALF_OPEN, CircuitBreaker
+from workspace import content_hash
+
+ORIGIN = server.FRONTEND_ORIGINS[0]
+
+
+async def preflight(method: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        return await client.options(
+            "/workspace/files",
+            headers={
+                "Origin": ORIGIN,
+                "Access-Control-Request-Method": method,
+                "Access-Control-Request-Headers": "content-type,x-session-id",
+            },
+        )
+
+
+@pytest.mark.parametrize("method", ["GET", "POST", "PUT", "PATCH", "DELETE"])
+def test_preflight_allows_the_methods_the_frontend_uses(method):
+    response = asyncio.run(preflight(method))
+    assert response.status_code == 200
+    assert method in response.headers["access-control-allow-methods"]
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+async def reply_to(session_id: str, previous: str, prompt: str):
+    await server.history_store.append(
+        session_id, [server.new_message("user", "write a token"), server.new_message("assistant", previous)]
+    )
+    return await server.answer_locally(session_id, server.new_message("user", prompt), use_cache=True)
+
+
+def test_an_ok_to_a_question_is_not_answered_locally():
+    assert asyncio.run(reply_to("asked", "Here is the token. Shall I add a mint function?", "ok")) is None
+    assert asyncio.run(reply_to("told", "Here is the token.", "ok")) is not None
+
+
+SOURCE = "pragma solidity ^0.8.0;\ncontract A {\n    function f() public {}\n}\n"
+
+
+async def ask_about_code(session_id: str):
+    server.workspace_mirror.put(session_id, "contracts/A.sol", SOURCE)
+    references = [server.Reference(hash=content_hash(SOURCE), start_line=2, end_line=3)]
+    question = server.new_question(session_id, "what does f do?", references)
+    prompt = (await server.build_context(session_id, question))[-1]["content"]
+    user_message, _ = await server.finish_turn(session_id, question, "It does nothing.")
+    stored, _ = await server.history_store.load(session_id)
+    # The file is edited before the next question
+    server.workspace_mirror.put(session_id, "contracts/A.sol", SOURCE.replace("f()", "g()"))
+    follow_up = await server.build_context(session_id, server.new_question(session_id, "and now?", []))
+    return prompt, server.public_message(user_message), stored[0], follow_up
+
+
+def test_referenced_code_goes_into_the_prompt_but_not_the_history():
+    prompt, public, stored, follow_up = asyncio.run(ask_about_code("references1"))
+    assert prompt.startswith("contracts/A.sol (lines 2-3):\n```solidity\ncontract A {")
+    assert prompt.endswith("what does f do?")
+    reference = {"hash": content_hash(SOURCE), "path": "contracts/A.sol", "start_line": 2, "end_line": 3}
+    assert public["content"] == stored["content"] == "what does f do?"
+    assert public["references"] == stored["references"] == [reference]
+    # An earlier turn whose file changed since only names the file
+    assert follow_up[-3]["content"] == "contracts/A.sol: (edited since, no longer available)\n\nwhat does f do?"
+    assert follow_up[-1]["content"] == "and now?"
+
+
+async def history_pages():
+    for session_id in ("history-a", "history-b"):
+        await server.history_store.append(session_id, [server.new_message("user", f"hello from {session_id}")])
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        first = await client.get("/history", headers={"X-Session-Id": "history-a"})
+        again = await client.get(
+            "/history", headers={"X-Session-Id": "history-a", "If-None-Match": first.headers["etag"]}
+        )
+        # Same ids and page parameters, but another session's page
+        other = await client.get(
+            "/history", headers={"X-Session-Id": "history-b", "If-None-Match": first.headers["etag"]}
+        )
+    return first, again, other
+
+
+def test_history_etags_are_per_session():
+    first, again, other = asyncio.run(history_pages())
+    assert again.status_code == 304
+    assert other.status_code == 200
+    assert other.json()["messages"][0]["content"] == "hello from history-b"
+    assert other.headers["etag"] != first.headers["etag"]
+    for response in (first, again):
+        assert "private" in response.headers["cache-control"]
+        assert "X-Session-Id" in response.headers["vary"] and "Cookie" in response.headers["vary"]
+
+
+class RejectingQuota:
+    async def acquire(self, tokens: int, max_wait=None):
+        raise Overloaded("rate limited", 1)
+
+
+async def call_upstream(**options):
+    async with server.upstream_call([{"role": "user", "content": "hi"}], 10, **options):
+        pass
+
+
+@pytest.mark.parametrize("options", [
+    {"quota": RejectingQuota()},
+    # The attempt's time ran out while it waited for quota and a slot
+    {"deadline": 0.0},
+])
+def test_a_probe_turned_away_before_groq_is_handed_back(monkeypatch, options):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    monkeypatch.setattr(server, "breaker", breaker)
+    breaker.record_failure()
+    breaker._opened_at -= 10
+    with pytest.raises(Overloaded):
+        asyncio.run(call_upstream(**options))
+    assert breaker.state == HALF_OPEN
+    # Without the probe back, every call would be refused until it expired
+    assert breaker.check() is not None
+    assert server.admission.in_flight == 0
+
+
+def test_hedges_with_the_primarys_key_and_model_share_its_quota():
+    assert server.HEDGE_MODEL == server.MODEL and server.HEDGE_GROQ_API_KEY is None
+    assert server.hedge_pacer is server.pacer
+
+
+def strip_in_pieces(pieces) -> str:
+    stripper = server.ThinkStripper()
+    return "".join(stripper.feed(piece) for piece in pieces) + stripper.flush()
+
+
+THOUGHTFUL = [
+    "<think>plan the contract</think>\n\nHere is the contract.",
+    "Before <think>a</think>between<think>b</think> after",
+    # A nested open tag ends at the first close tag, as in clean_response
+    "<think>outer <think>inner</think> rest</think> shown",
+    "No tags at all, but a < and a <thin and a </think",
+]
+
+
+@pytest.mark.parametrize("text", THOUGHTFUL)
+def test_think_spans_are_stripped_wherever_the_chunks_split(text):
+    expected = server.clean_response(text)
+    assert strip_in_pieces([text]).rstrip() == expected
+    assert strip_in_pieces(list(text)).rstrip() == expected
+    for split in range(1, len(text)):
+        assert strip_in_pieces([text[:split], text[split:]]).rstrip() == expected
+
+
+def test_plain_text_passes_through_as_it_arrives():
+    stripper = server.ThinkStripper()
+    assert stripper.feed("  Hello") == "Hello"
+    assert stripper.feed(" world, 1 < 2") == " world, 1 < 2"
+    # Could be the start of a tag, so it is held back until the stream says otherwise
+    assert stripper.feed(" <thi") == " "
+    assert stripper.feed("s") == "<this"
+    assert stripper.feed(" <th") == " "
+    assert stripper.flush() == "<th"
+
+
+def test_an_unclosed_think_span_is_never_emitted():
+    assert strip_in_pieces(["Answer <think>and then", " the rest</thi"]) == "Answer "
+    assert strip_in_pieces(["<think>", "all of it"]) == ""
+
+
+def cache_bypass_request(value: str) -> Request:
+    return Request({"type": "http", "headers": [(b"x-cache-bypass", value.encode())]})
+
+
+def test_the_bypass_header_skips_the_cache_lookup():
+    assert not server.cache_enabled(cache_bypass_request("1"))
+    assert not server.cache_enabled(cache_bypass_request("TRUE"))
+    assert server.cache_enabled(cache_bypass_request("0"))
+    assert server.cache_enabled(Request({"type": "http", "headers": []}))
+    messages = [{"role": "user", "content": "write a bypass test"}]
+    server.store_in_cache(messages, "Here it is.")
+    lookups = server.response_cache.hits + server.response_cache.misses
+    assert server.lookup_cache(messages, use_cache=False) == (None, "BYPASS")
+    assert server.response_cache.hits + server.response_cache.misses == lookups
+    assert server.lookup_cache(messages, use_cache=True) == ("Here it is.", "HIT")
+
+
+async def patch_the_wrong_version():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        headers = {"X-Session-Id": "patching"}
+        await client.put("/workspace/files", json={"path": "contracts/A.sol", "content": SOURCE}, headers=headers)
+        return await client.patch("/workspace/files", headers=headers, json={
+            "path": "contracts/A.sol",
+            "base": content_hash(SOURCE),
+            "edits": [{"start": 0, "end": 6, "text": "pragma"}],
+            "hash": content_hash("what the editor has"),
+        })
+
+
+def test_a_patch_that_does_not_apply_is_a_409():
+    response = asyncio.run(patch_the_wrong_version())
+    assert response.status_code == 409
+    assert response.json()["detail"].startswith("Upload the whole file again")
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+async def share_calls(fail: bool):
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        if fail:
+            raise ValueError("upstream said no")
+        return "answer"
+
+    waiting = [asyncio.ensure_future(flight.do("key", call)) for _ in range(5)]
+    other = asyncio.ensure_future(flight.do("other key", call))
+    await asyncio.sleep(0)
+    assert "key" in flight and len(flight) == 2
+    release.set()
+    results = await asyncio.gather(*waiting, other, return_exceptions=True)
+    assert len(flight) == 0
+    return flight, calls, results
+
+
+def test_concurrent_identical_calls_share_one():
+    flight, calls, results = asyncio.run(share_calls(fail=False))
+    assert calls == 2
+    assert results == [("answer", False)] + [("answer", True)] * 4 + [("answer", False)]
+    assert flight.stats() == {"in_flight": 0, "leaders": 2, "followers": 4}
+
+
+def test_the_leaders_exception_reaches_every_follower():
+    _, calls, results = asyncio.run(share_calls(fail=True))
+    assert calls == 2
+    assert all(isinstance(result, ValueError) for result in results)
+    # All of them got the same exception, raised once
+    assert len({id(result) for result in results[:5]}) == 1
+
+
+async def cancel_one_waiter():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def call():
+        await release.wait()
+        return "answer"
+
+    leader = asyncio.ensure_future(flight.do("key", call))
+    follower = asyncio.ensure_future(flight.do("key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    return await follower
+
+
+def test_a_cancelled_leader_does_not_cancel_the_call():
+    assert asyncio.run(cancel_one_waiter()) == ("answer", True)
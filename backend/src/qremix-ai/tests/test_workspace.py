@@ -0,0 +1,84 @@
+import pytest
+
+from workspace import (
+    FILE_OVERHEAD_BYTES, SESSION_OVERHEAD_BYTES, WorkspaceConflict, WorkspaceMirror, WorkspaceTooLarge, content_hash,
+)
+
+SOURCE = "contract A {\n    function f() public {}\n}\n"
+
+
+def mirror(**limits) -> WorkspaceMirror:
+    options = {"max_bytes": 1 << 20, "idle_ttl": 60, "max_file_bytes": 1 << 16, "max_session_bytes": 1 << 18}
+    return WorkspaceMirror(**{**options, **limits})
+
+
+def patched(edits, source: str = SOURCE) -> str:
+    workspace = mirror()
+    base = workspace.put("s", "A.sol", source)
+    pieces, position = [], 0
+    for start, end, text in sorted(edits):
+        pieces += [source[position:start], text]
+        position = end
+    expected = "".join(pieces) + source[position:]
+    return workspace.patch("s", "A.sol", base.hash, edits, content_hash(expected)).content
+
+
+def test_edits_apply_as_offsets_into_the_base_in_any_order():
+    start = SOURCE.index("f()")
+    edits = [(start, start + 1, "g"), (0, 8, "library"), (len(SOURCE), len(SOURCE), "// end\n")]
+    assert patched(edits) == "library A {\n    function g() public {}\n}\n// end\n"
+    # Adjacent edits and an insertion at the same offset as a replacement both apply
+    assert patched([(0, 1, "C"), (1, 2, "O"), (2, 2, "-")]) == "CO-ntract A {\n    function f() public {}\n}\n"
+
+
+@pytest.mark.parametrize("edits", [
+    [(0, 10, "x"), (5, 12, "y")],
+    [(5, 12, "y"), (0, 10, "x")],
+    [(0, len(SOURCE) + 1, "")],
+    [(len(SOURCE) + 1, len(SOURCE) + 1, "x")],
+    [(10, 5, "backwards")],
+])
+def test_overlapping_or_out_of_range_edits_are_conflicts(edits):
+    workspace = mirror()
+    base = workspace.put("s", "A.sol", SOURCE)
+    with pytest.raises(WorkspaceConflict, match="overlap or fall outside"):
+        workspace.patch("s", "A.sol", base.hash, edits, content_hash(""))
+    assert workspace.files("s")[0].content == SOURCE
+    assert workspace.conflicts == 1 and workspace.patches == 0
+
+
+def test_a_wrong_base_or_result_hash_is_a_conflict():
+    workspace = mirror()
+    base = workspace.put("s", "A.sol", SOURCE)
+    edits = [(0, 8, "library")]
+    with pytest.raises(WorkspaceConflict, match="not at version"):
+        workspace.patch("s", "A.sol", content_hash("an older version"), edits, content_hash("x"))
+    with pytest.raises(WorkspaceConflict, match="not at version"):
+        workspace.patch("other session", "A.sol", base.hash, edits, content_hash("x"))
+    # The browser counted the offsets in UTF-16, so the result is not what it has
+    with pytest.raises(WorkspaceConflict, match="does not match"):
+        workspace.patch("s", "A.sol", base.hash, edits, content_hash("library A {}"))
+    assert workspace.conflicts == 3
+    assert workspace.lookup("s", base.hash).content == SOURCE
+
+
+def test_the_file_limit_counts_utf8_bytes():
+    workspace = mirror(max_file_bytes=12)
+    # Four characters, twelve bytes
+    assert workspace.put("s", "A.sol", "€€€€").content == "€€€€"
+    with pytest.raises(WorkspaceTooLarge):
+        workspace.put("s", "B.sol", "€€€€a")
+    base = content_hash("€€€€")
+    with pytest.raises(WorkspaceTooLarge):
+        workspace.patch("s", "A.sol", base, [(4, 4, "é")], content_hash("€€€€é"))
+    assert workspace.lookup("s", base) is not None
+
+
+def test_session_sizes_count_utf8_bytes():
+    workspace = mirror(max_session_bytes=SESSION_OVERHEAD_BYTES + FILE_OVERHEAD_BYTES + len("A.sol") + 200)
+    with pytest.raises(WorkspaceTooLarge):
+        workspace.put("s", "A.sol", "€" * 67)
+    workspace.put("s", "A.sol", "€" * 66)
+    assert workspace.total_bytes == SESSION_OVERHEAD_BYTES + FILE_OVERHEAD_BYTES + len("A.sol") + 198
+    workspace.remove("s", "A.sol")
+    assert workspace.total_bytes == SESSION_OVERHEAD_BYTES
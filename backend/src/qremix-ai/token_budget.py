@@ -0,0 +1,46 @@
+import re
+from typing import Any, Dict, List
+
+# Llama 3 splits words into sub-word pieces of roughly four characters, numbers into
+# groups of up to three digits, and most punctuation into tokens of its own. Counting
+# the same way slightly overestimates, which is the safe side for a context budget.
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_+")
+CHARS_PER_WORD_TOKEN = 4
+DIGITS_PER_TOKEN = 3
+# Role markers and separators the chat template adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    count = 0
+    for piece in TOKEN_PATTERN.findall(text):
+        if piece[0].isdigit():
+            count += -(-len(piece) // DIGITS_PER_TOKEN)
+        elif piece[0].isalpha():
+            count += -(-len(piece) // CHARS_PER_WORD_TOKEN)
+        else:
+            count += 1
+    # Runs of newlines and indentation are merged into a handful of whitespace tokens
+    return count + text.count("\n")
+
+
+def message_tokens(content: str) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(content)
+
+
+def pack_newest_first(messages: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """Newest messages whose cached ``tokens`` fit in ``budget``, oldest first.
+
+    The newest message is always kept so the current prompt is never dropped;
+    packing stops at the first message that does not fit so the context stays
+    a contiguous tail of the conversation.
+    """
+    packed = []
+    used = 0
+    for message in reversed(messages):
+        used += message["tokens"]
+        if packed and used > budget:
+            break
+        packed.append(message)
+    packed.reverse()
+    return packed
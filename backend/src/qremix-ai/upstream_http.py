@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from importlib.util import find_spec
+from typing import Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# (seconds waited for a connection, seconds spent opening it or None when one was reused)
+ConnectionObserver = Callable[[float, Optional[float]], None]
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that reports how each request got its connection.
+
+    Uses httpcore's ``trace`` extension: a request that opens a connection
+    waited for the pool until the TCP connect starts and spent the time up to
+    its first header write connecting (TCP, TLS and, for HTTP/2, the
+    preface); a request on a kept-alive connection waited until its first
+    header write. ``on_connection`` gets both once per request, from the task
+    that sent it. ``last_request`` is the monotonic time the last request
+    started, so idle pools can be told apart.
+    """
+
+    def __init__(self, on_connection: Optional[ConnectionObserver] = None, **kwargs):
+        if kwargs.get("http2") and find_spec("h2") is None:
+            logger.warning("HTTP/2 to Groq needs the h2 package (pip install 'httpx[http2]'); using HTTP/1.1")
+            kwargs["http2"] = False
+        super().__init__(**kwargs)
+        self.on_connection = on_connection
+        self.last_request = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.last_request = time.monotonic()
+        if self.on_connection is not None:
+            request.extensions = {**request.extensions, "trace": self._tracer(request.extensions.get("trace"))}
+        return await super().handle_async_request(request)
+
+    def _tracer(self, inner):
+        started = time.perf_counter()
+        connecting = None
+        reported = False
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal connecting, reported
+            if not reported:
+                if event == "connection.connect_tcp.started":
+                    connecting = time.perf_counter()
+                elif event.endswith(".send_request_headers.started"):
+                    now = time.perf_counter()
+                    reported = True
+                    if connecting is None:
+                        self.on_connection(now - started, None)
+                    else:
+                        self.on_connection(connecting - started, now - connecting)
+            if inner is not None:
+                await inner(event, info)
+
+        return trace
+
+
+async def warm_connections(client: httpx.AsyncClient, url: str, count: int, timeout: float = 5.0) -> int:
+    # Sent together, the requests cannot share a connection, so up to ``count`` idle
+    # connections are reused or opened; any response will do. Returns how many got one
+    results = await asyncio.gather(
+        *(client.head(url, timeout=timeout) for _ in range(count)), return_exceptions=True
+    )
+    return sum(isinstance(result, httpx.Response) for result in results)
+
+
+async def keep_warm(
+    client: httpx.AsyncClient, transport: InstrumentedTransport, url: str, count: int, interval: float
+) -> None:
+    # Runs until cancelled. While traffic flows the connections stay open by themselves;
+    # after ``interval`` without a request they are refreshed before they expire
+    while True:
+        await asyncio.sleep(interval)
+        if time.monotonic() - transport.last_request >= interval:
+            await warm_connections(client, url, count)
@@ -0,0 +1,301 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Hex digits of the SHA-256 kept as a file's hash; 64 bits is plenty within one session
+HASH_LENGTH = 16
+# Rough per-file and per-session overheads (objects, dict entries) added to the content size
+FILE_OVERHEAD_BYTES = 300
+SESSION_OVERHEAD_BYTES = 600
+
+LANGUAGES = {
+    ".sol": "solidity",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".json": "json",
+    ".py": "python",
+    ".md": "markdown",
+}
+
+
+def utf8(content: str) -> bytes:
+    # What the editor sends and hashes (a lone surrogate from a broken paste is kept
+    # rather than failing the request)
+    return content.encode("utf-8", "surrogatepass")
+
+
+def bytes_hash(data: bytes) -> str:
+    # What the editor computes with crypto.subtle over the UTF-8 bytes
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def content_hash(content: str) -> str:
+    return bytes_hash(utf8(content))
+
+
+def language_of(path: str) -> str:
+    dot = path.rfind(".")
+    return LANGUAGES.get(path[dot:].lower(), "") if dot != -1 else ""
+
+
+class WorkspaceConflict(Exception):
+    """A patch that does not apply to what the mirror holds; the client should upload the file."""
+
+
+class WorkspaceTooLarge(Exception):
+    """A file or session over its size limit."""
+
+
+class MissingReferences(Exception):
+    """Hashes a chat message referenced that this mirror does not hold (any more)."""
+
+    def __init__(self, hashes: List[str]):
+        super().__init__(", ".join(hashes))
+        self.hashes = hashes
+
+
+class MirroredFile:
+    __slots__ = ("path", "content", "hash", "size")
+
+    def __init__(self, path: str, content: str, digest: str, content_bytes: int):
+        self.path = path
+        self.content = content
+        self.hash = digest
+        # Counted in UTF-8 bytes like the limits, not in characters
+        self.size = FILE_OVERHEAD_BYTES + len(utf8(path)) + content_bytes
+
+    @property
+    def line_count(self) -> int:
+        # A final newline ends the last line rather than starting another
+        newlines = self.content.count("\n")
+        return max(1, newlines if self.content.endswith("\n") else newlines + 1)
+
+    def lines(self, start: Optional[int], end: Optional[int]) -> Tuple[str, int, int]:
+        # Lines start..end (1-based, inclusive, clamped to the file) and the range taken
+        count = self.line_count
+        if start is None and end is None:
+            return self.content.rstrip("\n"), 1, count
+        start = min(max(1, start or 1), count)
+        end = min(max(start, end or count), count)
+        # Splitting stops after the last line wanted, so the rest of the file is not copied
+        return "\n".join(self.content.split("\n", end)[start - 1:end]).rstrip("\n"), start, end
+
+
+class Workspace:
+    __slots__ = ("files", "by_hash", "size", "last_seen")
+
+    def __init__(self, now: float):
+        self.files: Dict[str, MirroredFile] = {}
+        self.by_hash: Dict[str, MirroredFile] = {}
+        self.size = SESSION_OVERHEAD_BYTES
+        self.last_seen = now
+
+
+class WorkspaceMirror:
+    """Per-session copies of the editor's files, addressed by content hash.
+
+    The editor uploads a file once with :meth:`put`, then sends only what
+    changed with :meth:`patch`: edits against the version it last synced
+    (``base``) plus the hash the result should have, so a diff applied to
+    the wrong version, or computed on different offsets, is refused instead
+    of silently corrupting the copy. Chat messages then name files or line
+    ranges by hash and :meth:`resolve` returns just those snippets. Only the
+    current version of each path is kept.
+
+    Sessions are kept in least-recently-used order like the chat history:
+    idle ones expire after ``idle_ttl`` seconds and the least recently used
+    are dropped while the total is over ``max_bytes``. The mirror lives in
+    process memory, so behind several workers, or after a restart, a hash
+    can be unknown; :class:`MissingReferences` tells the client which files
+    to upload again.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        idle_ttl: float,
+        max_file_bytes: int,
+        max_session_bytes: int,
+        clock=time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.max_file_bytes = max_file_bytes
+        self.max_session_bytes = max_session_bytes
+        self._clock = clock
+        self._sessions: "OrderedDict[str, Workspace]" = OrderedDict()
+        self.total_bytes = 0
+        self.uploads = 0
+        self.patches = 0
+        self.conflicts = 0
+        self.resolved = 0
+        self.missing = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _touch(self, session_id: str, create: bool) -> Optional[Workspace]:
+        now = self._clock()
+        self._expire(now)
+        workspace = self._sessions.get(session_id)
+        if workspace is None:
+            if not create:
+                return None
+            workspace = self._sessions[session_id] = Workspace(now)
+            self.total_bytes += workspace.size
+        else:
+            self._sessions.move_to_end(session_id)
+        workspace.last_seen = now
+        return workspace
+
+    def _expire(self, now: float) -> None:
+        # The LRU head is always the longest-idle session, so stop at the first live one
+        while self._sessions:
+            session_id, workspace = next(iter(self._sessions.items()))
+            if now - workspace.last_seen < self.idle_ttl:
+                break
+            self._drop(session_id)
+            self.expirations += 1
+
+    def _drop(self, session_id: str) -> None:
+        self.total_bytes -= self._sessions.pop(session_id).size
+
+    def _evict(self, keep: str) -> None:
+        while self.total_bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self.evictions += 1
+
+    def _store(self, session_id: str, workspace: Workspace, path: str, content: str, encoded: bytes) -> MirroredFile:
+        # ``encoded`` is the content's UTF-8, which callers have already made
+        if len(encoded) > self.max_file_bytes:
+            raise WorkspaceTooLarge(f"{path} is larger than {self.max_file_bytes} bytes")
+        new = MirroredFile(path, content, bytes_hash(encoded), len(encoded))
+        old = workspace.files.get(path)
+        growth = new.size - (old.size if old is not None else 0)
+        if workspace.size + growth > self.max_session_bytes:
+            raise WorkspaceTooLarge(f"the workspace would be larger than {self.max_session_bytes} bytes")
+        if old is not None:
+            self._unindex(workspace, old)
+        workspace.files[path] = new
+        workspace.by_hash[new.hash] = new
+        workspace.size += growth
+        self.total_bytes += growth
+        self._evict(keep=session_id)
+        return new
+
+    def _unindex(self, workspace: Workspace, file: MirroredFile) -> None:
+        if workspace.by_hash.get(file.hash) is not file:
+            return
+        del workspace.by_hash[file.hash]
+        # Another path with identical content keeps the hash resolvable
+        for other in workspace.files.values():
+            if other.hash == file.hash and other is not file:
+                workspace.by_hash[file.hash] = other
+                break
+
+    def put(self, session_id: str, path: str, content: str) -> MirroredFile:
+        workspace = self._touch(session_id, create=True)
+        self.uploads += 1
+        return self._store(session_id, workspace, path, content, utf8(content))
+
+    def patch(
+        self, session_id: str, path: str, base: str, edits: Iterable[Tuple[int, int, str]], expected: str
+    ) -> MirroredFile:
+        # ``edits`` are (start, end, text) replacements, all as offsets into the base version
+        workspace = self._touch(session_id, create=False)
+        current = workspace.files.get(path) if workspace is not None else None
+        if current is None or current.hash != base:
+            self.conflicts += 1
+            raise WorkspaceConflict(f"{path} is not at version {base}")
+        pieces = []
+        position = 0
+        for start, end, text in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+            if not position <= start <= end <= len(current.content):
+                self.conflicts += 1
+                raise WorkspaceConflict(f"edits to {path} overlap or fall outside the file")
+            pieces.append(current.content[position:start])
+            pieces.append(text)
+            position = end
+        pieces.append(current.content[position:])
+        content = "".join(pieces)
+        encoded = utf8(content)
+        # Offsets counted differently (UTF-16 in the browser, code points here) end up here
+        if bytes_hash(encoded) != expected:
+            self.conflicts += 1
+            raise WorkspaceConflict(f"{path} does not match {expected} after the edits")
+        self.patches += 1
+        return self._store(session_id, workspace, path, content, encoded)
+
+    def remove(self, session_id: str, path: str) -> bool:
+        workspace = self._touch(session_id, create=False)
+        file = workspace.files.pop(path, None) if workspace is not None else None
+        if file is None:
+            return False
+        self._unindex(workspace, file)
+        workspace.size -= file.size
+        self.total_bytes -= file.size
+        return True
+
+    def clear(self, session_id: str) -> None:
+        if session_id in self._sessions:
+            self._drop(session_id)
+
+    def files(self, session_id: str) -> List[MirroredFile]:
+        workspace = self._touch(session_id, create=False)
+        return list(workspace.files.values()) if workspace is not None else []
+
+    def sessions(self) -> Iterator[Tuple[str, List[MirroredFile]]]:
+        for session_id, workspace in self._sessions.items():
+            yield session_id, list(workspace.files.values())
+
+    def lookup(self, session_id: str, digest: str) -> Optional[MirroredFile]:
+        # The file with this hash if the mirror still holds it; unlike resolve(), a hash
+        # from an earlier turn that has since been edited away is not an error
+        workspace = self._touch(session_id, create=False)
+        return workspace.by_hash.get(digest) if workspace is not None else None
+
+    def resolve(
+        self, session_id: str, references: Iterable[Tuple[str, Optional[int], Optional[int]]]
+    ) -> List[Tuple[MirroredFile, str, int, int]]:
+        # (file, snippet, first line, last line) per (hash, start line, end line) reference;
+        # every unknown hash is reported at once so the client can upload them in one go
+        workspace = self._touch(session_id, create=False)
+        by_hash = workspace.by_hash if workspace is not None else {}
+        resolved = []
+        missing = []
+        for digest, start, end in references:
+            file = by_hash.get(digest)
+            if file is None:
+                if digest not in missing:
+                    missing.append(digest)
+                continue
+            resolved.append((file, *file.lines(start, end)))
+        if missing:
+            self.missing += len(missing)
+            raise MissingReferences(missing)
+        self.resolved += len(resolved)
+        return resolved
+
+    def stats(self) -> Dict[str, int]:
+        self._expire(self._clock())
+        return {
+            "sessions": len(self._sessions),
+            "files": sum(len(workspace.files) for workspace in self._sessions.values()),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "uploads": self.uploads,
+            "patches": self.patches,
+            "conflicts": self.conflicts,
+            "resolved": self.resolved,
+            "missing": self.missing,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
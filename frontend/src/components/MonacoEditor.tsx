@@ -4,6 +4,7 @@ import * as monaco from 'monaco-editor';
 import { getNodeById, updateNode } from "../utils/IndexDB";
 import type { FileSystemNode } from "../types";
 import { useEditor } from "../context/EditorContext";
+import { postChat } from "../utils/qremixWorkspace";
 
 interface MonacoEditorProps {
   file: FileSystemNode;
@@ -107,22 +108,22 @@ const MonacoEditor: React.FC<MonacoEditorProps> = ({
     setIsFetchingSuggestion(true);
     
     try {
-      // Get file context for better AI responses
-      const fileContext = getFileContext();
       const language = getLanguage(file?.name);
       
-      // Prepare the prompt with context
-      const fullPrompt = `I'm working on a ${language} file. ${fileContext} 
+      // Prepare the prompt; the code around the cursor goes by reference to the AI service's
+      // copy of the file, so only the lines that changed since the last question are sent
+      const fullPrompt = `I'm working on a ${language} file. The code above ends at my cursor.
 Please help with: ${aiPrompt}`;
+      const snippets = editorRef.current ? [{
+        path: file?.name || "untitled",
+        content: editorRef.current.getValue(),
+        // Up to 10 lines before the cursor
+        startLine: Math.max(1, cursorPosition.lineNumber - 10),
+        endLine: cursorPosition.lineNumber,
+      }] : [];
       
       // Call the API
-      const response = await fetch('http://localhost:5000/chat', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({ message: fullPrompt })
-      });
+      const response = await postChat('http://localhost:5000/chat', fullPrompt, snippets);
       
       if (!response.ok) {
         throw new Error(`API error: ${response.status}`);
@@ -149,35 +150,6 @@ Please help with: ${aiPrompt}`;
     }
   };
   
-  const getFileContext = () => {
-    if (!editorRef.current) return '';
-    
-    const editor = editorRef.current;
-    const fullContent = editor.getValue();
-    
-    // Get text around cursor for better context
-    const position = editor.getPosition();
-    
-    if (position) {
-      const model = editor.getModel();
-      if (model) {
-        // Get up to 10 lines before cursor
-        const startLine = Math.max(1, position.lineNumber - 10);
-        const beforeText = model.getValueInRange({
-          startLineNumber: startLine,
-          startColumn: 1,
-          endLineNumber: position.lineNumber,
-          endColumn: position.column
-        });
-        
-        return `Here's the relevant code around my cursor: ${beforeText}`;
-      }
-    }
-    
-    // Fallback to first 500 chars
-    return `Here's the file context: ${fullContent.substring(0, 500)}${fullContent.length > 500 ? '...' : ''}`;
-  };
-  
   const extractCodeFromResponse = (response: string) => {
     // Extract code blocks from markdown response
     const codeBlockRegex = /```(?:\w+)?\s*([\s\S]*?)```/g;
@@ -1,5 +1,7 @@
 import React, { useState, useEffect, useRef } from "react";
 import { FaArrowRight, FaTrash } from "react-icons/fa";
+import { useEditor } from "../context/EditorContext";
+import { getSessionId, postChat } from "../utils/qremixWorkspace";
 
 const QremixAI = () => {
   const [query, setQuery] = useState("");
@@ -14,6 +16,8 @@ const QremixAI = () => {
   const API_URL = "http://localhost:5000/chat";
   const CLEAR_URL = "http://localhost:5000/clear";
 
+  const { activeFile } = useEditor();
+
   // Load chat history from localStorage on component mount
   useEffect(() => {
     const savedHistory = localStorage.getItem("qremixChatHistory");
@@ -145,14 +149,20 @@ const QremixAI = () => {
   const sendMessage = async (message) => {
     setLoading(true);
     try {
-      const res = await fetch(API_URL, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message }),
-      });
+      // Questions about the open file send it by reference rather than pasted into the message
+      const aboutOpenFile = /\b(current|this|open|my) (file|contract|code)\b/i.test(message);
+      const snippets = aboutOpenFile && activeFile?.content
+        ? [{ path: activeFile.name, content: activeFile.content }]
+        : [];
+      const res = await postChat(API_URL, message, snippets);
       if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
       const data = await res.json();
-      setChatHistory(data.chat_history);
+      // The server only returns the new turn; swap it in for the optimistic user message
+      setChatHistory((prev) =>
+        data.messages.length > 0
+          ? [...prev.slice(0, -1), ...data.messages]
+          : [...prev, { role: "assistant", content: data.response }]
+      );
     } catch (error) {
       setChatHistory([...chatHistory, { role: "assistant", content: `Error: ${error.message}` }]);
     } finally {
@@ -164,6 +174,7 @@ const QremixAI = () => {
     try {
       await fetch(CLEAR_URL, {
         method: "POST",
+        headers: { "X-Session-Id": getSessionId() },
       });
       setChatHistory([]);
       // Reset to default suggestions when chat is cleared
@@ -192,7 +203,29 @@ const QremixAI = () => {
     sendMessage(queryText);
   };
 
-  const formatMessage = (content) => {
+  const formatMessage = (msg) => {
+    // Assistant messages from the server come already split into prose, code and explanation
+    if (msg.segments) {
+      return msg.segments.map((segment, index) => {
+        if (segment.type === "code") {
+          return (
+            <pre key={index} className="bg-gray-800 text-white p-3 rounded overflow-x-auto my-2 text-sm">
+              <code className={segment.language ? `language-${segment.language}` : undefined}>{segment.content}</code>
+            </pre>
+          );
+        }
+        if (segment.type === "explanation") {
+          return (
+            <div key={index} className="my-2">
+              <div className="font-semibold">Explanation</div>
+              <span>{segment.content}</span>
+            </div>
+          );
+        }
+        return <div key={index} className="my-1">{segment.content}</div>;
+      });
+    }
+    const content = msg.content;
     // Handle code blocks with syntax highlighting
     if (content.includes("```")) {
       return content.split("```").map((part, index) => {
@@ -251,7 +284,7 @@ const QremixAI = () => {
                   {msg.role === "user" ? "You" : "QremixAI"}
                 </div>
                 <div className="whitespace-pre-wrap text-sm break-words">
-                  {formatMessage(msg.content)}
+                  {formatMessage(msg)}
                 </div>
               </div>
             </div>
@@ -0,0 +1,103 @@
+// Keeps the QremixAI service's copy of the editor's files in sync, so chat messages can
+// point at code by content hash instead of pasting whole contracts into every request
+const AI_URL = "http://localhost:5000";
+
+export interface WorkspaceSnippet {
+  path: string;
+  content: string;
+  // 1-based and inclusive; leave both out to send the whole file
+  startLine?: number;
+  endLine?: number;
+}
+
+// One AI conversation per tab; the backend keys chat history and the workspace on this id
+export const getSessionId = () => {
+  let sessionId = sessionStorage.getItem("qremixSessionId");
+  if (!sessionId) {
+    sessionId = crypto.randomUUID().replace(/-/g, "");
+    sessionStorage.setItem("qremixSessionId", sessionId);
+  }
+  return sessionId;
+};
+
+// First 16 hex digits of the SHA-256 of the UTF-8 content, as the server computes it
+export const contentHash = async (content: string) => {
+  const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(content));
+  return Array.from(new Uint8Array(digest).slice(0, 8), (byte) => byte.toString(16).padStart(2, "0")).join("");
+};
+
+// The last version of each path the server acknowledged
+const synced = new Map<string, { hash: string; content: string }>();
+
+const send = (method: string, path: string, body: unknown) =>
+  fetch(`${AI_URL}${path}`, {
+    method,
+    headers: { "Content-Type": "application/json", "X-Session-Id": getSessionId() },
+    body: JSON.stringify(body),
+  });
+
+// A single replacement covering everything between the common prefix and suffix, which is
+// what a burst of typing between two questions usually amounts to
+const diff = (before: string, after: string) => {
+  let start = 0;
+  const shorter = Math.min(before.length, after.length);
+  while (start < shorter && before[start] === after[start]) start++;
+  let end = 0;
+  while (end < shorter - start && before[before.length - 1 - end] === after[after.length - 1 - end]) end++;
+  return { start, end: before.length - end, text: after.slice(start, after.length - end) };
+};
+
+// Uploads the file the first time and only the changed part afterwards; returns its hash
+export const syncFile = async (path: string, content: string) => {
+  const hash = await contentHash(content);
+  const previous = synced.get(path);
+  if (previous?.hash === hash) return hash;
+  let res: Response | null = null;
+  if (previous) {
+    res = await send("PATCH", "/workspace/files", {
+      path,
+      base: previous.hash,
+      edits: [diff(previous.content, content)],
+      hash,
+    });
+  }
+  // 409: the server lost the file or counted the offsets differently (characters outside
+  // the BMP are two units here and one there), so send the whole file instead
+  if (!res || res.status === 409) {
+    res = await send("PUT", "/workspace/files", { path, content });
+  }
+  if (!res.ok) throw new Error(`Failed to sync ${path}: ${res.status}`);
+  synced.set(path, { hash, content });
+  return hash;
+};
+
+// Posts a chat message that references code from the editor. A server that does not know
+// some of the hashes (a restart, or another worker) answers 409 with the missing ones;
+// those files are uploaded again and the message is sent once more.
+export const postChat = async (url: string, message: string, snippets: WorkspaceSnippet[] = []) => {
+  const references = await Promise.all(
+    snippets.map(async ({ path, content, startLine, endLine }) => ({
+      hash: await syncFile(path, content),
+      start_line: startLine,
+      end_line: endLine,
+    }))
+  );
+  const post = () =>
+    fetch(url, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", "X-Session-Id": getSessionId() },
+      body: JSON.stringify({ message, references }),
+    });
+  let res = await post();
+  if (res.status === 409 && snippets.length > 0) {
+    const { missing = [] } = await res.json();
+    for (const { path, content } of snippets) {
+      if (missing.includes(synced.get(path)?.hash)) {
+        synced.delete(path);
+        await syncFile(path, content);
+      }
+    }
+    res = await post();
+  }
+  return res;
+};